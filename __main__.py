@@ -0,0 +1,8 @@
+"""
+    Entry point for `python -m phylo_tree`, see `cli`.
+"""
+import sys
+
+from phylo_tree.cli import main
+
+sys.exit(main())
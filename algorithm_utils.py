@@ -0,0 +1,103 @@
+"""
+    Helpers shared by the Processing algorithms.
+
+    Building fields, matching leaves to the features of a layer, and
+    starting worker processes from inside QGIS are done the same way by
+    every algorithm, so they live here rather than on any one of them.
+"""
+import multiprocessing
+import os
+import sys
+
+from qgis.core import QgsFields, QgsField, QgsFeatureRequest, QgsWkbTypes
+from phylo_tree.geometry import convex_hull
+
+
+def make_fields(spec):
+    """Build a QgsFields from a {name: type} dictionary"""
+    fields = QgsFields()
+    for name, typ in spec.items():
+        fields.append(QgsField(name, typ))
+    return fields
+
+
+def representative_point(geom):
+    """
+    A point standing for a feature: the point itself, the centroid of a
+    multipoint, or a point on the surface of lines and polygons.
+    """
+    if geom.type() == QgsWkbTypes.PointGeometry:
+        if not geom.isMultipart():
+            return geom.asPoint()
+        return geom.centroid().asPoint()
+    return geom.pointOnSurface().asPoint()
+
+
+def match_leaves(layer, keys, index, aggregator, hulls=None, threshold=0):
+    """
+    Match leaf nodes up with features in input layer, feeding the
+    representative point of each matched feature to `aggregator`.
+    `keys` are the fields looked up in `index`, in order of preference.
+    Features whose name is not in the index are matched approximately
+    afterwards if `threshold` is positive. If `hulls` is a dictionary,
+    it is filled with the convex hull of the features matched to each
+    leaf.
+    Returns the ids of the features that could not be matched.
+    """
+    request = QgsFeatureRequest().setSubsetOfAttributes(keys, layer.fields())
+    unmatched = {}
+    for f in layer.getFeatures(request):
+        names = [f[key] for key in keys]
+        leaf = index.lookup(*names)
+        if leaf is None:
+            unmatched[f.id()] = names[0] or None
+        else:
+            add_match(leaf, f, aggregator, hulls)
+
+    # Approximate matching of the remainder, fetching back only the
+    # features that found a leaf
+    names = set(name for name in unmatched.values() if name)
+    if threshold > 0 and names:
+        approx = index.approximate(names, threshold)
+        fids = [fid for fid, name in unmatched.items() if name in approx]
+        request.setFilterFids(fids)
+        for f in layer.getFeatures(request):
+            add_match(approx[f[keys[0]]], f, aggregator, hulls)
+            del unmatched[f.id()]
+    return list(unmatched)
+
+
+def add_match(leaf, feat, aggregator, hulls=None):
+    """Record that `feat` is linked to `leaf`"""
+    geom = feat.geometry()
+    if geom.isEmpty():
+        return
+    point = representative_point(geom)
+    aggregator.add(leaf, point.x(), point.y())
+    if hulls is not None:
+        hull = geom.convexHull()
+        points = [(v.x(), v.y()) for v in hull.vertices()]
+        points.extend(hulls.get(id(leaf), []))
+        hulls[id(leaf)] = convex_hull(points)
+
+
+def worker_context():
+    """
+    `multiprocessing` context to start worker processes from. Inside
+    QGIS `sys.executable` is the QGIS binary, which would start another
+    QGIS for every worker, so they are spawned with the Python
+    interpreter bundled with it instead.
+    Returns None if there is no interpreter to be found.
+    """
+    if os.path.basename(sys.executable).lower().startswith('python'):
+        return multiprocessing.get_context()
+    names = ['python.exe', 'python{}.{}'.format(*sys.version_info),
+             'python{}'.format(sys.version_info[0])]
+    for folder in (sys.exec_prefix, os.path.join(sys.exec_prefix, 'bin')):
+        for name in names:
+            path = os.path.join(folder, name)
+            if os.path.isfile(path) and os.access(path, os.X_OK):
+                context = multiprocessing.get_context('spawn')
+                context.set_executable(path)
+                return context
+    return None
@@ -0,0 +1,216 @@
+"""
+    Force-directed edge bundling of link lines.
+
+    Holten and van Wijk's method: every link is split into points
+    that are pulled towards the matching points of compatible links,
+    those of similar angle, length and position, while springs keep
+    each link smooth. Over a few cycles the links are split more
+    finely and moved by smaller steps.
+
+    Compatible pairs are found by hashing the link midpoints into a
+    grid, since links far apart relative to their length can never be
+    compatible, and the compatibility of the candidates is computed as
+    arrays. Each link keeps its most compatible neighbours only, in a
+    table of fixed width, and forces are summed over the table a few
+    links at a time, so the cost grows with the number of links rather
+    than its square.
+
+    Coordinates are scaled so that links are a few hundred units long
+    on average, the scale the method's constants were tuned for.
+"""
+import numpy as np
+
+# Minimum compatibility of two links pulling on each other
+THRESHOLD = 0.6
+# Most compatible neighbours kept for each link
+NEIGHBOURS = 16
+# Grid cells searched around a link midpoint, at most, on each side
+WINDOW = 3
+# Spring constant, first step size and number of cycles
+K = 0.1
+STEP = 0.1
+CYCLES = 5
+# Average link length during bundling
+SCALE = 200.
+# Pairs of points whose forces are computed at once
+BATCH = 2 ** 20
+
+
+def compatibility(segments, i, j):
+    """
+    Compatibility of the pairs of links `i` and `j` of an (n, 4) array,
+    the product of their angle, scale and position compatibilities.
+    """
+    p, q = segments[i], segments[j]
+    vp = p[:, 2:] - p[:, :2]
+    vq = q[:, 2:] - q[:, :2]
+    lp = np.hypot(*vp.T)
+    lq = np.hypot(*vq.T)
+    angle = np.abs((vp * vq).sum(axis=1)) / (lp * lq)
+    mean = (lp + lq) / 2
+    scale = 2 / (mean / np.minimum(lp, lq) + np.maximum(lp, lq) / mean)
+    mp = (p[:, :2] + p[:, 2:]) / 2
+    mq = (q[:, :2] + q[:, 2:]) / 2
+    position = mean / (mean + np.hypot(*(mp - mq).T))
+    return angle * scale * position
+
+
+def neighbours(segments, threshold=THRESHOLD, limit=NEIGHBOURS):
+    """
+    Pairs of compatible links, both ways round and sorted by the
+    first, with their compatibility: arrays (i, j, c).
+
+    Two links of mean length l can only be compatible if their
+    midpoints are closer than l * (1 - threshold) / threshold, so each
+    link only looks at the grid cells within that distance, taking
+    its own length for l. Every compatible pair is found by at least
+    the longer of its links. Where links are crowded the grid is made
+    finer and only the `WINDOW` nearest cells are searched, which
+    keeps the closest, and so most compatible, of the neighbours.
+    """
+    n = len(segments)
+    length = np.hypot(segments[:, 2] - segments[:, 0],
+                      segments[:, 3] - segments[:, 1])
+    mid = (segments[:, :2] + segments[:, 2:]) / 2
+    reach = length * (1 - threshold) / threshold
+    width, height = mid.max(axis=0) - mid.min(axis=0)
+    # About one midpoint per cell on average
+    crowded = np.sqrt(width * height / n)
+    cell = float(min(np.median(reach), crowded or np.inf)) or 1.
+    grid = np.floor((mid - mid.min(axis=0)) / cell).astype(np.int64)
+    rows = int(grid[:, 1].max()) + 1
+    key = grid[:, 0] * rows + grid[:, 1]
+    order = np.argsort(key, kind='stable')
+    cells, first, count = np.unique(key[order], return_index=True,
+                                    return_counts=True)
+
+    found = []
+    window = np.minimum(np.ceil(reach / cell), WINDOW).astype(np.int64)
+    for w in np.unique(window).tolist():
+        links = np.flatnonzero(window == w)
+        dx, dy = np.meshgrid(np.arange(-w, w + 1), np.arange(-w, w + 1))
+        cx = (grid[links, 0][:, None] + dx.ravel()).ravel()
+        cy = (grid[links, 1][:, None] + dy.ravel()).ravel()
+        owner = np.repeat(links, dx.size)
+        inside = (cy >= 0) & (cy < rows)
+        cx, cy, owner = cx[inside], cy[inside], owner[inside]
+        pos = np.minimum(np.searchsorted(cells, cx * rows + cy),
+                         len(cells) - 1)
+        hit = cells[pos] == cx * rows + cy
+        pos, owner = pos[hit], owner[hit]
+        m = count[pos]
+        offset = np.arange(m.sum()) - np.repeat(np.cumsum(m) - m, m)
+        i = np.repeat(owner, m)
+        j = order[np.repeat(first[pos], m) + offset]
+        keep = i != j
+        i, j = i[keep], j[keep]
+        c = compatibility(segments, i, j)
+        keep = c >= threshold
+        found.append((i[keep], j[keep], c[keep]))
+
+    i, j, c = (np.concatenate(a) for a in zip(*found))
+    # Both ways round, once each
+    i, j, c = np.concatenate([i, j]), np.concatenate([j, i]), \
+        np.concatenate([c, c])
+    _, unique = np.unique(i * n + j, return_index=True)
+    i, j, c = i[unique], j[unique], c[unique]
+    # Most compatible neighbours first, then only the best `limit`
+    order = np.lexsort((-c, i))
+    i, j, c = i[order], j[order], c[order]
+    starts = np.searchsorted(i, i)
+    keep = np.arange(len(i)) - starts < limit
+    return i[keep], j[keep], c[keep]
+
+
+def subdivide(points):
+    """Add a point halfway between each pair of consecutive points"""
+    n, m = points.shape[:2]
+    out = np.empty((n, 2 * m - 1) + points.shape[2:], dtype=points.dtype)
+    out[:, ::2] = points
+    out[:, 1::2] = (points[:, 1:] + points[:, :-1]) / 2
+    return out
+
+
+def bundle(segments, iterations=50, cycles=CYCLES,
+           threshold=THRESHOLD, limit=NEIGHBOURS, progress=None):
+    """
+    Bundle an (n, 4) array of links.
+
+    :param iterations: Iterations of the first cycle, each later cycle\
+        doing two thirds as many.
+    :param progress: Called with the fraction of the work done, if given.
+    :return: (n, m, 2) array of polylines, the ends of each staying\
+        where they were.
+    """
+    segments = np.asarray(segments, dtype=np.float64).reshape(-1, 4)
+    n = len(segments)
+    length = np.hypot(segments[:, 2] - segments[:, 0],
+                      segments[:, 3] - segments[:, 1])
+    movable = length > 0
+    if not movable.any() or not iterations:
+        return segments.reshape(-1, 2, 2).copy()
+
+    # Scaled so that links are SCALE long on average
+    origin = segments.reshape(-1, 2).min(axis=0)
+    factor = SCALE / length[movable].mean()
+    scaled = (segments - np.tile(origin, 2)) * factor
+    i, j, c = neighbours(scaled[movable], threshold, limit)
+    idx = np.flatnonzero(movable)
+    i, j = idx[i], idx[j]
+    # Links running the other way are matched from their other end
+    v = scaled[:, 2:] - scaled[:, :2]
+    flip = (v[i] * v[j]).sum(axis=1) < 0
+
+    # Neighbours of each link as a table, padded with the link itself
+    # at no compatibility. Points are complex numbers in single
+    # precision, plenty once scaled, to halve the memory traffic.
+    rank = np.arange(len(i)) - np.searchsorted(i, i)
+    width = int(rank.max()) + 1 if len(i) else 1
+    table = np.repeat(np.arange(n)[:, None], width, axis=1)
+    table[i, rank] = j
+    weights = np.zeros((n, width), dtype=np.float32)
+    weights[i, rank] = c
+    flipped = np.zeros((n, width), dtype=bool)
+    flipped[i, rank] = flip
+    ends = (scaled[:, 0::2] + 1j * scaled[:, 1::2]).astype(np.complex64)
+    spring = K / (length * factor)
+
+    inner = np.empty((n, 0), dtype=np.complex64)
+    step = STEP
+    work = sum(int(iterations * (2. / 3) ** k) * (2 ** (k + 1) - 1)
+               for k in range(cycles)) or 1
+    done = 0
+    for cycle in range(cycles):
+        inner = subdivide(np.concatenate(
+            [ends[:, :1], inner, ends[:, 1:]], axis=1))[:, 1:-1].copy()
+        m = inner.shape[1]
+        kp = (spring / (m + 1)).astype(np.float32)[:, None]
+        # Point k of a link pulls on point k of its neighbours, or on
+        # point m - 1 - k of those running the other way
+        column = np.arange(m, dtype=np.int32)
+        other = table.astype(np.int32)[..., None] * m + np.where(
+            flipped[..., None], m - 1 - column, column)
+        rows = max(1, BATCH // (width * m))
+        rounds = int(iterations * (2. / 3) ** cycle)
+        for _ in range(rounds):
+            full = np.concatenate([ends[:, :1], inner, ends[:, 1:]], axis=1)
+            force = kp * (full[:, :-2] + full[:, 2:] - 2 * inner)
+            flat = inner.ravel()
+            for lo in range(0, n, rows):
+                hi = lo + rows
+                diff = flat[other[lo:hi]] - inner[lo:hi, None]
+                dist = np.abs(diff)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    pull = np.where(dist > 1e-6,
+                                    weights[lo:hi, :, None] / dist,
+                                    np.float32(0))
+                force[lo:hi] += (diff * pull).sum(axis=1)
+            force[~movable] = 0
+            inner += np.float32(step) * force
+            done += m
+            if progress is not None:
+                progress(min(done / work, 1.))
+        step /= 2
+    points = np.concatenate([ends[:, :1], inner, ends[:, 1:]], axis=1)
+    points = np.stack([points.real, points.imag], axis=2)
+    return points.astype(np.float64) / factor + origin
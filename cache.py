@@ -0,0 +1,131 @@
+"""
+    In-process cache shared by all runs of the plugin's algorithms.
+
+    Processing creates a fresh algorithm instance for every run, so
+    anything worth keeping between runs, such as parsed trees and
+    their layouts, lives in the module level `tree_cache`. It is
+    a least recently used cache bounded by an estimate of the memory
+    held by its entries, and is safe to use from several threads.
+"""
+import threading
+from collections import OrderedDict
+
+# Rough per node memory use of the cached objects, used to estimate
+# entry sizes without walking the object graph
+NODE_BYTES = 300
+DRAWTREE_NODE_BYTES = 600
+INCREMENTAL_NODE_BYTES = 400
+FLAT_NODE_BYTES = 200
+
+DEFAULT_BUDGET = 512 * 2 ** 20
+
+
+class LRUCache(object):
+    """
+    Thread-safe least recently used cache with a memory budget.
+
+    Every entry is stored with its estimated size in bytes. When the
+    total goes over `budget`, the least recently used entries are
+    evicted until it fits again. An entry larger than the whole budget
+    is not stored at all.
+    """
+
+    def __init__(self, budget=DEFAULT_BUDGET):
+        self.budget = budget
+        self._items = OrderedDict()
+        self._lock = threading.RLock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._items
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, _ = self._items[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, size):
+        with self._lock:
+            self.discard(key)
+            if size > self.budget:
+                return
+            self._items[key] = (value, size)
+            self.size += size
+            self._shrink()
+
+    def get_or_create(self, key, create, sizeof):
+        """
+        Return the value cached under `key`, calling `create()` to make
+        it on a miss. `sizeof(value)` estimates its size in bytes.
+        The value is created outside the lock, so other keys can be
+        used meanwhile.
+        """
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            value = create()
+            self.put(key, value, sizeof(value))
+        return value
+
+    def discard(self, key):
+        with self._lock:
+            item = self._items.pop(key, None)
+            if item is not None:
+                self.size -= item[1]
+
+    def resize(self, budget):
+        """Change the memory budget, evicting entries if needed"""
+        with self._lock:
+            self.budget = budget
+            self._shrink()
+
+    def clear(self):
+        """Drop every entry. Returns the number of bytes freed."""
+        with self._lock:
+            freed = self.size
+            self._items.clear()
+            self.size = 0
+            return freed
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries':   len(self._items),
+                'size':      self.size,
+                'budget':    self.budget,
+                'hits':      self.hits,
+                'misses':    self.misses,
+                'evictions': self.evictions,
+            }
+
+    def _shrink(self):
+        while self.size > self.budget and self._items:
+            _, (_, size) = self._items.popitem(last=False)
+            self.size -= size
+            self.evictions += 1
+
+
+tree_cache = LRUCache()
+
+
+def clear():
+    """Empty the shared cache, returning the number of bytes freed"""
+    return tree_cache.clear()
+
+
+def stats():
+    """Hit, miss and size statistics of the shared cache"""
+    return tree_cache.stats()
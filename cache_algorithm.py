@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ PhyloTree
+                                 A QGIS plugin
+ Create, draw and link a phylogenetic tree to vector features
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2020-05-08
+        copyright            : (C) 2020 by Isaac Stead
+        email                : isaac.stead@protonmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+__author__ = 'Isaac Stead'
+__date__ = '2020-05-08'
+__copyright__ = '(C) 2020 by Isaac Stead'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+from qgis.PyQt.QtCore import QCoreApplication
+from qgis.core import (QgsProcessingAlgorithm,
+                       QgsProcessingParameterBoolean,
+                       QgsProcessingParameterNumber,
+                       QgsProcessingOutputNumber)
+from phylo_tree import cache
+
+
+class TreeCacheAlgorithm(QgsProcessingAlgorithm):
+    """
+    Reports the statistics of the tree cache shared by the plugin's
+    algorithms, optionally clearing it or changing its memory budget.
+    """
+
+    CLEAR = 'CLEAR'
+    BUDGET = 'BUDGET'
+    HITS = 'HITS'
+    MISSES = 'MISSES'
+    ENTRIES = 'ENTRIES'
+    SIZE = 'SIZE'
+    FREED = 'FREED'
+
+    def initAlgorithm(self, config):
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.CLEAR,
+                self.tr('Clear the cache'),
+                defaultValue=False
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.BUDGET,
+                self.tr('Memory budget (MB)'),
+                QgsProcessingParameterNumber.Integer,
+                defaultValue=cache.tree_cache.budget // 2 ** 20,
+                minValue=0
+            )
+        )
+        outputs = [(self.HITS, 'Hits'), (self.MISSES, 'Misses'),
+                   (self.ENTRIES, 'Entries'), (self.SIZE, 'Size (MB)'),
+                   (self.FREED, 'Freed (MB)')]
+        for name, description in outputs:
+            self.addOutput(
+                QgsProcessingOutputNumber(name, self.tr(description)))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        clear = self.parameterAsBool(parameters, self.CLEAR, context)
+        budget = self.parameterAsInt(parameters, self.BUDGET, context)
+
+        stats = cache.stats()
+        for key in ('entries', 'size', 'hits', 'misses', 'evictions'):
+            feedback.pushInfo('{}: {}'.format(key, stats[key]))
+
+        freed = cache.clear() if clear else 0
+        cache.tree_cache.resize(budget * 2 ** 20)
+
+        return {
+            self.HITS:    stats['hits'],
+            self.MISSES:  stats['misses'],
+            self.ENTRIES: stats['entries'],
+            self.SIZE:    stats['size'] / 2 ** 20,
+            self.FREED:   freed / 2 ** 20,
+        }
+
+    def name(self):
+        return 'Tree cache'
+
+    def displayName(self):
+        return self.tr(self.name())
+
+    def group(self):
+        return self.tr(self.groupId())
+
+    def groupId(self):
+        return ''
+
+    def shortHelpString(self):
+        return self.tr('Parsed trees and their layouts are kept in memory '
+                       'between runs. This shows how well the cache is '
+                       'doing and lets you empty it or change its size.')
+
+    def tr(self, string):
+        return QCoreApplication.translate('Processing', string)
+
+    def createInstance(self):
+        return TreeCacheAlgorithm()
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ PhyloTree
+                                 A QGIS plugin
+ Create, draw and link a phylogenetic tree to vector features
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2020-05-08
+        copyright            : (C) 2020 by Isaac Stead
+        email                : isaac.stead@protonmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+__author__ = 'Isaac Stead'
+__date__ = '2020-05-08'
+__copyright__ = '(C) 2020 by Isaac Stead'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+from qgis.PyQt.QtCore import QCoreApplication, QVariant
+from qgis.core import (QgsProcessingAlgorithm,
+                       QgsProcessingException,
+                       QgsProcessingParameterFile,
+                       QgsProcessingParameterVectorLayer,
+                       QgsProcessingParameterString,
+                       QgsProcessingOutputVectorLayer,
+                       QgsProcessingOutputString,
+                       QgsProcessingOutputNumber,
+                       QgsField,
+                       QgsFeatureRequest)
+from phylo_tree.pipeline import TreePipeline
+from phylo_tree.phylo_tree_algorithm import PhyloTreeAlgorithm
+from phylo_tree.trees.flat import FlatTree
+
+
+class CladeIndexAlgorithm(QgsProcessingAlgorithm):
+    """
+    Writes the preorder interval index of a tree into the layers drawn
+    from it, so that the links of any clade can be selected with a
+    numeric range expression.
+
+    Every link gets the rank of its leaf among the leaves of the tree
+    in preorder, and every edge of the tree layer the range of leaf
+    ranks under its node, as the leaves of a clade have consecutive
+    ranks.
+    """
+
+    INPUTTREE = 'INPUTTREE'
+    LINKLAYER = 'LINKLAYER'
+    TREELAYER = 'TREELAYER'
+    NODE = 'NODE'
+    OUTPUT = 'OUTPUT'
+    EXPRESSION = 'EXPRESSION'
+    SELECTED = 'SELECTED'
+
+    LINK_FIELDS = {
+        'leaf_rank': QVariant.Int,
+    }
+    TREE_FIELDS = {
+        'leaf_min': QVariant.Int,
+        'leaf_max': QVariant.Int,
+    }
+
+    def flags(self):
+        # The link and tree layers are edited and selected in place,
+        # which is only safe on the main thread
+        return super().flags() | QgsProcessingAlgorithm.FlagNoThreading
+
+    def initAlgorithm(self, config):
+        self.addParameter(
+            QgsProcessingParameterFile(
+                self.INPUTTREE,
+                self.tr('Tree file')
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterVectorLayer(
+                self.LINKLAYER,
+                self.tr('Links layer drawn from the file')
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterVectorLayer(
+                self.TREELAYER,
+                self.tr('Tree layer drawn from the file'),
+                optional=True
+            )
+        )
+        # Clade whose links to select once the index is written
+        self.addParameter(
+            QgsProcessingParameterString(
+                self.NODE,
+                self.tr('Select the links of the clade under node'),
+                optional=True
+            )
+        )
+        self.addOutput(
+            QgsProcessingOutputVectorLayer(self.OUTPUT, self.tr('Links')))
+        self.addOutput(
+            QgsProcessingOutputString(self.EXPRESSION,
+                                      self.tr('Selection expression')))
+        self.addOutput(
+            QgsProcessingOutputNumber(self.SELECTED,
+                                      self.tr('Selected links')))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        fname = self.parameterAsFile(parameters, self.INPUTTREE, context)
+        links = self.parameterAsVectorLayer(parameters, self.LINKLAYER,
+                                            context)
+        tree_layer = self.parameterAsVectorLayer(parameters, self.TREELAYER,
+                                                 context)
+        label = self.parameterAsString(parameters, self.NODE, context)
+
+        # The layers may show a summary of the file rather than its
+        # first tree
+        layers = [links] + ([tree_layer] if tree_layer is not None else [])
+        summaries = set(layer.customProperty(
+            PhyloTreeAlgorithm.SUMMARY_PROPERTY) or None for layer in layers)
+        if len(summaries) > 1:
+            raise QgsProcessingException(
+                self.tr('The layers were drawn from different trees of '
+                        'the file'))
+        with TreePipeline(fname, summary=summaries.pop()) as pipeline:
+            flat = FlatTree(pipeline.parse())
+        names = flat.names
+        rank, lo, hi = flat.leaf_ranks()
+
+        # Leaves by label, the first of any duplicates
+        leaves = {}
+        for i in flat.leaves().tolist():
+            leaves.setdefault(names[i], i)
+        values = {}
+        for name, i in leaves.items():
+            values[name] = {'leaf_rank': int(rank[i])}
+        written = self.write_fields(links, self.LINK_FIELDS, 'label',
+                                    values)
+        feedback.pushInfo('Indexed {} links'.format(written))
+
+        if tree_layer is not None:
+            ids = flat.clade_ids().tolist()
+            values = {ids[i]: {'leaf_min': int(lo[i]),
+                               'leaf_max': int(hi[i]) - 1}
+                      for i in range(len(flat))}
+            written = self.write_fields(tree_layer, self.TREE_FIELDS, 'id',
+                                        values)
+            feedback.pushInfo('Indexed {} tree edges'.format(written))
+
+        results = {self.OUTPUT: links.id(), self.EXPRESSION: '',
+                   self.SELECTED: 0}
+        if label:
+            if label not in names:
+                raise QgsProcessingException(
+                    self.tr('No node labelled {} in the tree').format(label))
+            i = names.index(label)
+            expression = '"leaf_rank" BETWEEN {} AND {}'.format(
+                int(lo[i]), int(hi[i]) - 1)
+            links.selectByExpression(expression)
+            feedback.pushInfo(expression)
+            results[self.EXPRESSION] = expression
+            results[self.SELECTED] = links.selectedFeatureCount()
+        return results
+
+    def write_fields(self, layer, spec, key, values):
+        """
+        Add the fields of `spec` to `layer` if missing and set them on
+        each feature from `values`, a dict of field values by the
+        feature's `key` attribute. Returns the number of features set.
+        """
+        provider = layer.dataProvider()
+        missing = [QgsField(name, kind) for name, kind in spec.items()
+                   if layer.fields().indexOf(name) < 0]
+        if missing:
+            provider.addAttributes(missing)
+            layer.updateFields()
+        fields = layer.fields()
+        index = {name: fields.indexOf(name) for name in spec}
+
+        request = QgsFeatureRequest().setFlags(QgsFeatureRequest.NoGeometry)
+        request.setSubsetOfAttributes([key], fields)
+        changes = {}
+        for feat in layer.getFeatures(request):
+            row = values.get(feat[key])
+            if row is not None:
+                changes[feat.id()] = {index[name]: value
+                                      for name, value in row.items()}
+        provider.changeAttributeValues(changes)
+        layer.triggerRepaint()
+        return len(changes)
+
+    def name(self):
+        return 'Index clades'
+
+    def displayName(self):
+        return self.tr(self.name())
+
+    def group(self):
+        return self.tr(self.groupId())
+
+    def groupId(self):
+        return ''
+
+    def shortHelpString(self):
+        return self.tr('Writes the rank of each link\'s leaf, and the range '
+                       'of leaf ranks under each node of the tree layer, so '
+                       'that the links of a clade can be selected with an '
+                       'expression such as "leaf_rank" BETWEEN 10 AND 25, '
+                       'without walking the tree again.')
+
+    def tr(self, string):
+        return QCoreApplication.translate('Processing', string)
+
+    def createInstance(self):
+        return CladeIndexAlgorithm()
@@ -0,0 +1,410 @@
+"""
+    Command line pipeline: parse -> layout -> export, without QGIS.
+
+    Reads one or more tree files and a table of leaf locations (CSV or
+    GeoJSON), lays out each tree, links its leaves to the locations and
+    writes the edges and links as GeoJSON, GeoJSON text sequences or
+    CSV with a WKT column, and optionally as a vector tile pyramid.
+    Features are written as they are produced, and several tree files
+    are processed in parallel:
+
+        python -m phylo_tree trees/*.nwk -l languages.csv -o out/ -j 8
+
+    Run with --help for all the options.
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from json.encoder import encode_basestring_ascii
+
+from phylo_tree.pipeline import TreePipeline
+from phylo_tree.linking import (LinkAggregator, NameIndex, AGGREGATIONS,
+                                NORMALIZERS, make_normalizer)
+from phylo_tree.trees.consensus import METHODS
+from phylo_tree.trees.drawtree import NEXUS_EXTENSIONS
+from phylo_tree.trees.flat import FlatTree
+from phylo_tree.trees.phylogeography import reconstruct_locations
+from phylo_tree.geometry import centroid, polygon_centroid
+from phylo_tree.mvt import TileSet, export_tiles
+
+FORMATS = {
+    'geojson':    '.geojson',
+    'geojsonseq': '.geojsons',
+    'csv':        '.csv',
+}
+LAYOUTS = ['beside', 'phylogeography']
+TILES = {
+    'mbtiles':   '.mbtiles',
+    'directory': '-tiles',
+}
+NUMBER = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+
+
+# Reading leaf locations
+
+def geojson_point(geometry):
+    """A representative (x, y) point for a GeoJSON geometry"""
+    kind, coords = geometry['type'], geometry.get('coordinates')
+    if kind == 'Point':
+        return tuple(coords[:2])
+    elif kind in ('MultiPoint', 'LineString'):
+        return centroid([tuple(c[:2]) for c in coords])
+    elif kind == 'MultiLineString':
+        return centroid([tuple(c[:2]) for line in coords for c in line])
+    elif kind == 'Polygon':
+        return polygon_centroid([tuple(c[:2]) for c in coords[0]])
+    elif kind == 'MultiPolygon':
+        # Centroid of the polygon with the most vertices
+        ring = max((p[0] for p in coords), key=len)
+        return polygon_centroid([tuple(c[:2]) for c in ring])
+    elif kind == 'GeometryCollection':
+        return centroid([geojson_point(g) for g in geometry['geometries']])
+    raise ValueError('Unsupported geometry type {}'.format(kind))
+
+
+def wkt_point(wkt):
+    """A representative (x, y) point for a WKT geometry"""
+    numbers = [float(n) for n in NUMBER.findall(wkt)]
+    # Only 2D coordinates are supported
+    points = list(zip(numbers[0::2], numbers[1::2]))
+    if not points:
+        raise ValueError('Empty geometry {}'.format(wkt[:50]))
+    if wkt.lstrip().upper().startswith('POLYGON'):
+        return polygon_centroid(points[:-1])
+    return centroid(points)
+
+
+def read_geojson(path, fields):
+    """Yield (names, (x, y)) for each feature of a GeoJSON(Seq) file"""
+    with open(path, encoding='utf8') as f:
+        first = f.read(1)
+        while first.isspace():
+            first = f.read(1)
+        f.seek(0)
+        if first == '\x1e' or path.endswith(('.geojsons', '.geojsonl',
+                                             '.jsonl')):
+            features = (json.loads(line.strip('\x1e\n')) for line in f
+                        if line.strip('\x1e\n '))
+        else:
+            data = json.load(f)
+            features = data.get('features', [data])
+        for feat in features:
+            if not feat.get('geometry'):
+                continue
+            props = feat.get('properties') or {}
+            yield ([props.get(name) for name in fields],
+                   geojson_point(feat['geometry']))
+
+
+def read_csv(path, fields):
+    """
+    Yield (names, (x, y)) for each row of a CSV file, with coordinates
+    in x/y, lon/lat, longitude/latitude or WKT columns.
+    """
+    with open(path, encoding='utf8', newline='') as f:
+        reader = csv.DictReader(f)
+        columns = {c.lower(): c for c in reader.fieldnames}
+        for x, y in (('x', 'y'), ('lon', 'lat'), ('longitude', 'latitude')):
+            if x in columns and y in columns:
+                x, y = columns[x], columns[y]
+                point = lambda row: (float(row[x]), float(row[y]))
+                break
+        else:
+            if 'wkt' not in columns:
+                raise ValueError('No coordinate columns in {}'.format(path))
+            wkt = columns['wkt']
+            point = lambda row: wkt_point(row[wkt])
+        for row in reader:
+            try:
+                yield [row.get(name) for name in fields], point(row)
+            except ValueError:
+                continue
+
+
+def read_locations(path, fields):
+    if path.lower().endswith('.csv'):
+        return list(read_csv(path, fields))
+    return list(read_geojson(path, fields))
+
+
+# Writing features
+
+FEATURE = ('{{"type": "Feature", "geometry": {{"type": "LineString", '
+           '"coordinates": [[%s, %s], [%s, %s]]}}, "properties": {{{}}}}}')
+
+
+def json_value(value):
+    """JSON text of a property value"""
+    if value is None:
+        return 'null'
+    if isinstance(value, str):
+        return encode_basestring_ascii(value)
+    if type(value) is int:
+        return str(value)
+    return json.dumps(value)
+
+
+def geojson_features(lines, properties):
+    """
+    GeoJSON texts of line features, as `json.dumps` writes them, from
+    their (x0, y0, x1, y1) and a dictionary of property columns. Each
+    column is serialized at once, then every feature is made by a
+    single string formatting.
+    """
+    template = FEATURE.format(', '.join(
+        '{}: %s'.format(json_value(k)) for k in properties))
+    columns = [list(map(json_value, v)) for v in properties.values()]
+    return [template % (line + row)
+            for line, row in zip(lines, zip(*columns) if columns
+                                 else itertools.repeat(()))]
+
+
+class GeoJSONWriter(object):
+    """Writes a FeatureCollection"""
+
+    def __init__(self, f):
+        self.f = f
+        self.first = True
+        f.write('{"type": "FeatureCollection", "features": [\n')
+
+    def write(self, lines, properties):
+        features = geojson_features(lines, properties)
+        if features and not self.first:
+            self.f.write(',\n')
+        self.first = self.first and not features
+        self.f.write(',\n'.join(features))
+
+    def close(self):
+        self.f.write('\n]}\n')
+
+
+class GeoJSONSeqWriter(object):
+    """Writes RFC 8142 GeoJSON text sequences"""
+
+    def __init__(self, f):
+        self.f = f
+
+    def write(self, lines, properties):
+        self.f.writelines('\x1e' + feature + '\n'
+                          for feature in geojson_features(lines, properties))
+
+    def close(self):
+        pass
+
+
+class CSVWriter(object):
+    """Writes one row per feature with the geometry as WKT"""
+
+    def __init__(self, f):
+        self.writer = csv.writer(f)
+        self.header = None
+
+    def write(self, lines, properties):
+        if self.header is None:
+            self.header = list(properties)
+            self.writer.writerow(['wkt'] + self.header)
+        wkt = ['LINESTRING (%s %s, %s %s)' % line for line in lines]
+        self.writer.writerows(
+            [w] + list(row) for w, row in
+            zip(wkt, zip(*[properties[k] for k in self.header])))
+
+    def close(self):
+        pass
+
+
+WRITERS = {
+    'geojson':    GeoJSONWriter,
+    'geojsonseq': GeoJSONSeqWriter,
+    'csv':        CSVWriter,
+}
+
+
+def write_lines(path, options, lines, properties, layer, tiles=None):
+    """
+    Write line features in the chosen format, given by their (x0, y0,
+    x1, y1) and a dictionary of property columns, and add them to
+    `tiles` if given.
+    """
+    with open(path, 'w', encoding='utf8', newline='') as f:
+        writer = WRITERS[options.format](f)
+        writer.write(lines, properties)
+        writer.close()
+    if tiles is not None:
+        keys = list(properties)
+        for (x0, y0, x1, y1), row in zip(lines, zip(*properties.values())):
+            tiles.add(layer, [[x0, y0], [x1, y1]], dict(zip(keys, row)))
+
+
+# The pipeline
+
+def link_tree(tree, records, options):
+    """Match the leaves of `tree` to location records"""
+    index = NameIndex(tree.leaves(),
+                      normalize=make_normalizer(options.normalize))
+    aggregator = LinkAggregator(options.aggregation)
+    unmatched = {}
+    for names, (x, y) in records:
+        leaf = index.lookup(*names)
+        if leaf is None:
+            unmatched.setdefault(names[0], []).append((x, y))
+        else:
+            aggregator.add(leaf, x, y)
+    names = [n for n in unmatched if n]
+    if options.fuzzy > 0 and names:
+        for name, leaf in index.approximate(names, options.fuzzy).items():
+            for x, y in unmatched[name]:
+                aggregator.add(leaf, x, y)
+    return aggregator
+
+
+def process_tree(path, records, options):
+    """
+    Lay out the tree in `path`, link it to `records` and write its
+    edges and links, and their vector tiles if asked for. Returns a
+    summary dictionary.
+    """
+    start = time.time()
+    stem = os.path.splitext(os.path.basename(path))[0]
+    ext = FORMATS[options.format]
+    # Features go to the tiles as they are written, not kept as they are
+    tiles = TileSet() if options.tiles else None
+    with TreePipeline(path, summary=options.summary) as pipeline:
+        tree = pipeline.layout()
+        aggregator = link_tree(tree, records, options)
+
+        if options.layout == 'phylogeography':
+            nodes = list(tree.walk())
+            locations = {i: aggregator.centroid(n)
+                         for i, n in enumerate(nodes) if n in aggregator}
+            xs, ys = reconstruct_locations(FlatTree(tree.tree), locations)
+            for node, x, y in zip(nodes, xs.tolist(), ys.tolist()):
+                node.x, node.y = x, y
+        else:
+            pipeline.place(options.scale, options.center)
+
+        nodes = list(tree.walk())[1:]
+        ids = FlatTree(tree.tree).clade_ids().tolist()[1:]
+        properties = {'id': ids, 'label': [n.name for n in nodes]}
+        if options.summary:
+            properties['support'] = [n.tree.support for n in nodes]
+        out = os.path.join(options.output, stem + '-edges' + ext)
+        write_lines(out, options, [(n.parent.x, n.parent.y, n.x, n.y)
+                                   for n in nodes], properties, 'edges',
+                    tiles)
+        edges = len(nodes)
+
+        links = 0
+        if options.layout != 'phylogeography':
+            pairs = list(aggregator.links(lambda l: (l.x, l.y)))
+            properties = {'label': [leaf.name for leaf, _ in pairs],
+                          'features': [aggregator.count(leaf)
+                                       for leaf, _ in pairs]}
+            out = os.path.join(options.output, stem + '-links' + ext)
+            write_lines(out, options, [(leaf.x, leaf.y) + tuple(target)
+                                       for leaf, target in pairs],
+                        properties, 'links', tiles)
+            links = len(pairs)
+
+    if tiles is not None:
+        out = os.path.join(options.output, stem + TILES[options.tiles])
+        export_tiles(tiles, out, options.min_zoom, options.max_zoom,
+                     processes=options.tile_processes, name=stem)
+
+    return {'tree': path, 'edges': edges, 'links': links,
+            'matched': len(aggregator), 'seconds': time.time() - start}
+
+
+# Worker processes load the locations once and reuse them for every
+# tree file they are given
+_records = None
+_options = None
+
+
+def _init_worker(locations, options):
+    global _records, _options
+    fields = [options.name_field] + (
+        [options.id_field] if options.id_field else [])
+    _records = read_locations(locations, fields)
+    _options = options
+
+
+def _run(path):
+    return process_tree(path, _records, _options)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m phylo_tree',
+        description='Lay out phylogenetic trees and link their leaves '
+                    'to locations, without QGIS.')
+    parser.add_argument('trees', nargs='+',
+                        help='Tree files: Newick (.nwk), NEXUS ({}) or '
+                             'indented .txt. Files of many trees, such as '
+                             'posterior samples, can be summarized with '
+                             '--summary'.format(', '.join(NEXUS_EXTENSIONS)))
+    parser.add_argument('-l', '--locations', required=True,
+                        help='CSV or GeoJSON file of leaf locations')
+    parser.add_argument('-o', '--output', default='.',
+                        help='Output directory (default: current)')
+    parser.add_argument('-f', '--format', choices=sorted(FORMATS),
+                        default='geojson', help='Output format')
+    parser.add_argument('--name-field', default='Language',
+                        help='Field holding the leaf names')
+    parser.add_argument('--id-field',
+                        help='Field holding a code such as a Glottocode')
+    parser.add_argument('--normalize', nargs='*', choices=list(NORMALIZERS),
+                        default=list(NORMALIZERS),
+                        help='Differences to ignore when matching names')
+    parser.add_argument('--fuzzy', type=float, default=0.8,
+                        help='Approximate match threshold, 0 disables')
+    parser.add_argument('--aggregation', choices=AGGREGATIONS,
+                        default='first',
+                        help='Linking of leaves matching several locations')
+    parser.add_argument('--summary', choices=METHODS,
+                        help='Lay out a summary tree of all the trees of '
+                             'each file, instead of the first one')
+    parser.add_argument('--layout', choices=LAYOUTS, default='beside')
+    parser.add_argument('--scale', type=float, nargs=2, default=(6., 8.),
+                        metavar=('X', 'Y'))
+    parser.add_argument('--center', type=float, nargs=2,
+                        default=(115., -33.), metavar=('X', 'Y'))
+    parser.add_argument('--tiles', choices=sorted(TILES),
+                        help='Also write vector tiles, in an MBTiles file '
+                             'or a z/x/y directory')
+    parser.add_argument('--min-zoom', type=int, default=0,
+                        help='Lowest zoom level of the tiles')
+    parser.add_argument('--max-zoom', type=int, default=12,
+                        help='Highest zoom level of the tiles')
+    parser.add_argument('-j', '--processes', type=int, default=None,
+                        help='Worker processes (default: one per CPU)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    os.makedirs(options.output, exist_ok=True)
+
+    if options.processes == 1 or len(options.trees) == 1:
+        # Tiles of a single tree are encoded in parallel instead
+        options.tile_processes = options.processes
+        _init_worker(options.locations, options)
+        summaries = [_run(path) for path in options.trees]
+    else:
+        options.tile_processes = 1
+        pool = ProcessPoolExecutor(options.processes,
+                                   initializer=_init_worker,
+                                   initargs=(options.locations, options))
+        with pool:
+            summaries = list(pool.map(_run, options.trees))
+
+    for s in summaries:
+        sys.stderr.write('{tree}: {edges} edges, {links} links, '
+                         '{matched} leaves matched in {seconds:.2f}s\n'
+                         .format(**s))
+    return 0
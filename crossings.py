@@ -0,0 +1,182 @@
+"""
+    Counting crossings between sets of line segments.
+
+    Segments are hashed into a uniform grid by the cells they actually
+    pass through, found all at once as in the vector tile export, and
+    only segments sharing a cell are tested against each other. A
+    segment passing through a corner of the grid is also given the
+    cells around the corner, so that two segments crossing there share
+    one. A crossing found in several cells is only counted in the first
+    cell both segments share, whatever cell the computed crossing point
+    falls in. Candidate pairs are generated and tested as arrays, a
+    bounded number at a time.
+
+    Only proper crossings count: segments touching at an end, as edges
+    meeting at a node or links leaving the same leaf do, or lying on
+    top of each other, do not cross.
+"""
+import numpy as np
+
+from phylo_tree.mvt import segments_tiles
+
+# Candidate pairs tested at once
+BATCH = 2 ** 22
+# Distance, in cells, at which a segment is taken to pass through a
+# corner of the grid
+CORNER = 1e-9
+
+
+def grid_size(segments, cells_per_segment=4):
+    """
+    Cell size for a set of (n, 4) segments: the typical segment length,
+    but large enough to keep the grid to a few cells per segment.
+    """
+    extent = np.maximum(np.abs(segments[:, 2] - segments[:, 0]),
+                        np.abs(segments[:, 3] - segments[:, 1]))
+    points = segments.reshape(-1, 2)
+    width, height = points.max(axis=0) - points.min(axis=0)
+    size = max(float(np.median(extent)),
+               np.sqrt(width * height / (cells_per_segment * len(segments))))
+    return size or 1.
+
+
+def crossing_pairs(a, b=None, cell=None, batch=BATCH):
+    """
+    Yield the crossings between the (n, 4) segments `a` and the (m, 4)
+    segments `b`, or between the segments of `a` if `b` is not given,
+    as arrays of indices (i, j) into `a` and `b`, in batches.
+
+    :param cell: Size of the grid cells, by default from `grid_size`.
+    """
+    a = np.asarray(a, dtype=np.float64).reshape(-1, 4)
+    same = b is None
+    b = a if same else np.asarray(b, dtype=np.float64).reshape(-1, 4)
+    if not len(a) or not len(b):
+        return
+    both = a if same else np.concatenate([a, b])
+    if cell is None:
+        cell = grid_size(both)
+    origin = both.reshape(-1, 2).min(axis=0)
+    # Segments in cell units, so that cells are the unit squares, but
+    # tested as given so that rounding doesn't make touching ones cross
+    units_a = (a - np.tile(origin, 2)) / cell
+    units_b = units_a if same else (b - np.tile(origin, 2)) / cell
+    ends = np.concatenate([units_a, units_b])
+    rows = int(np.floor(ends[:, [1, 3]].max())) + 3
+    span = (int(np.floor(ends[:, [0, 2]].max())) + 3) * rows
+
+    def hashed(segments):
+        owner, cx, cy = segments_tiles(segments)
+        corner, x, y = corner_cells(segments)
+        # Each cell once per segment, as segment * span + key
+        cells = np.unique(np.concatenate([owner, corner]) * span +
+                          (np.concatenate([cx, x]) + 1) * rows +
+                          np.concatenate([cy, y]) + 1)
+        owner, key = np.divmod(cells, span)
+        # First cell of each segment
+        first = key[np.searchsorted(cells, np.arange(len(segments)) * span)]
+        order = np.argsort(key, kind='stable')
+        return owner[order], key[order], (cells, first)
+
+    owner_a, key_a, cells_a = hashed(units_a)
+    owner_b, key_b, cells_b = (owner_a, key_a, cells_a) if same else \
+        hashed(units_b)
+    cells, first, count = np.unique(key_b, return_index=True,
+                                    return_counts=True)
+
+    # Entries of `b` paired with each entry of `a`: the whole cell, or
+    # for a single set only the entries after it in the same cell
+    if same:
+        start = np.arange(1, len(key_a) + 1)
+        pos = np.searchsorted(cells, key_a)
+        n = first[pos] + count[pos] - start
+    else:
+        pos = np.minimum(np.searchsorted(cells, key_a), len(cells) - 1)
+        found = cells[pos] == key_a
+        start = np.where(found, first[pos], 0)
+        n = np.where(found, count[pos], 0)
+
+    total = np.cumsum(n)
+    lo = 0
+    while lo < len(n):
+        base = total[lo - 1] if lo else 0
+        hi = max(lo + 1, int(np.searchsorted(total, base + batch)))
+        m = n[lo:hi]
+        entry = np.repeat(np.arange(lo, hi), m)
+        offset = np.arange(m.sum()) - np.repeat(np.cumsum(m) - m, m)
+        other = np.repeat(start[lo:hi], m) + offset
+        i, j = owner_a[entry], owner_b[other]
+        keep = np.flatnonzero(crossing(a[i], b[j]))
+        # Pairs found in the first cell they share
+        keep = keep[~shared_before(cells_a, cells_b, span, i[keep],
+                                   j[keep], key_a[entry][keep])]
+        if len(keep):
+            yield i[keep], j[keep]
+        lo = hi
+
+
+def corner_cells(segments):
+    """
+    Cells around the corners of the grid that segments in cell units
+    pass through, as arrays of segment indices and cell x and y. The
+    cells a segment crosses on the way only hold two of them.
+    """
+    x0, y0, x1, y1 = segments.T
+    fx0, fx1 = np.floor(x0), np.floor(x1)
+    n = np.abs(fx1 - fx0).astype(np.int64)
+    owner = np.repeat(np.arange(len(segments)), n)
+    k = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n) + 1
+    # Where the segment crosses the vertical lines of the grid
+    x = np.minimum(fx0, fx1)[owner] + k
+    y = y0[owner] + (x - x0[owner]) * (
+        (y1 - y0)[owner] / (x1 - x0)[owner])
+    at = np.flatnonzero(np.abs(y - np.round(y)) < CORNER)
+    owner, x, y = owner[at], x[at].astype(np.int64), \
+        np.round(y[at]).astype(np.int64)
+    return (np.repeat(owner, 4),
+            np.repeat(x, 4) - np.tile([1, 1, 0, 0], len(x)),
+            np.repeat(y, 4) - np.tile([1, 0, 1, 0], len(y)))
+
+
+def shared_before(cells_a, cells_b, span, i, j, key):
+    """
+    Mask of the pairs of segments `i` and `j` sharing a cell before the
+    cell of `key`, from their sorted cells as segment * span + key and
+    the first cell of each segment.
+    """
+    (cells_a, first_a), (cells_b, first_b) = cells_a, cells_b
+    out = np.zeros(len(i), dtype=bool)
+    # No cell shared before the later of their first cells
+    later = np.flatnonzero(key > np.maximum(first_a[i], first_b[j]))
+    i, j, key = i[later], j[later], key[later]
+    lo = np.searchsorted(cells_a, i * span)
+    m = np.searchsorted(cells_a, i * span + key) - lo
+    pair = np.repeat(np.arange(len(i)), m)
+    entry = np.arange(m.sum()) - np.repeat(np.cumsum(m) - m, m) + \
+        lo[pair]
+    probe = j[pair] * span + cells_a[entry] % span
+    at = np.minimum(np.searchsorted(cells_b, probe), len(cells_b) - 1)
+    out[later[pair[cells_b[at] == probe]]] = True
+    return out
+
+
+def crossing(a, b):
+    """Mask of the pairs of segments `a` and `b` crossing each other"""
+    px, py = a[:, 0], a[:, 1]
+    rx, ry = a[:, 2] - px, a[:, 3] - py
+    qx, qy = b[:, 0] - px, b[:, 1] - py
+    sx, sy = b[:, 2] - b[:, 0], b[:, 3] - b[:, 1]
+    denom = rx * sy - ry * sx
+    # Parallel pairs divide by zero, and are dropped
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = (qx * sy - qy * sx) / denom
+        u = (qx * ry - qy * rx) / denom
+        return (denom != 0) & (t > 0) & (t < 1) & (u > 0) & (u < 1)
+
+
+def count_crossings(a, b=None, cell=None):
+    """
+    Number of crossings between the segments `a` and `b`, or between
+    the segments of `a`. See `crossing_pairs`.
+    """
+    return sum(len(i) for i, _ in crossing_pairs(a, b, cell))
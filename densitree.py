@@ -0,0 +1,322 @@
+"""
+    Densitree drawings of samples of trees, as a raster.
+
+    Every tree of a sample, such as a Bayesian posterior, is drawn on
+    top of the others: its leaves in the same places, in the order of
+    the leaves of the majority-rule consensus tree, its nodes at their
+    height above the tips, and inner nodes above the middle of their
+    leaves. Rather than as line features, the edges are burnt into a
+    grid counting the trees with an edge through each cell, so memory
+    depends on the size of the grid and not on the number of trees.
+
+    A first pass over the file counts the clades, for the consensus
+    tree, and the topologies, so that the most frequent one can be
+    drawn as lines over the raster. In the second, batches of trees
+    are drawn by a pool of processes into grids of their own, added
+    up as they come back, only a few batches being read ahead.
+
+    Grids are written as ESRI ASCII grids, or by GDAL in the formats
+    it can write.
+"""
+import collections
+import itertools
+import math
+import multiprocessing
+import os
+
+import numpy as np
+
+from phylo_tree.trees.consensus import CladeStats, majority_rule, sample
+from phylo_tree.trees.taxa import TaxonTree
+
+# Trees drawn by a task of the pool
+BATCH = 100
+# Points taken along an edge per cell of its length
+SAMPLES = 2
+
+Drawing = collections.namedtuple(
+    'Drawing', ['grid', 'extent', 'cell', 'trees', 'topologies', 'top',
+                'top_trees', 'stats', 'position', 'height'])
+Drawing.__doc__ = """
+    A densitree drawing.
+
+    :ivar grid: Number of trees with an edge through each cell, uint32\
+        rows from the top.
+    :ivar extent: (xmin, ymin, xmax, ymax) of the grid.
+    :ivar cell: Width and height of a cell.
+    :ivar trees: Number of trees drawn.
+    :ivar topologies: Number of distinct topologies.
+    :ivar top: `TaxonTree` of the most frequent topology.
+    :ivar top_trees: Number of trees with that topology.
+    :ivar stats: `CladeStats` of the trees.
+    :ivar position: Position of each taxon along the tips, from 0 to 1.
+    :ivar height: Largest height of a tree.
+"""
+
+
+def read_sample(path, taxa, progress=None):
+    """
+    Clades and topologies of the trees of a file, in one streamed pass.
+
+    :return: Tuple of the `CladeStats` of the trees, the largest height\
+        of a tree, and for each topology, by a hash of its clades, the\
+        number of trees with it and the number of the first of them.
+    """
+    stats = CladeStats(taxa)
+    height = 0.
+    topologies = {}
+    for k, newick in enumerate(sample(path, taxa, progress)):
+        tree = TaxonTree.parse(newick, taxa, strip_comments=True)
+        keys = stats.add(tree)
+        height = max(height, float(tree.distances().max()))
+        inner = (~tree.is_leaf).tolist()
+        digest = hash(tuple(sorted(
+            key for key, is_inner in zip(keys, inner) if is_inner)))
+        entry = topologies.get(digest)
+        if entry is None:
+            topologies[digest] = [1, k]
+        else:
+            entry[0] += 1
+    return stats, height, topologies
+
+
+def leaf_positions(stats):
+    """
+    Position of each taxon along the tips, from 0 to 1, in the order of
+    the leaves of the majority-rule consensus tree of `stats`.
+    """
+    order = [node.taxon for node in majority_rule(stats).walk()
+             if node.is_leaf]
+    position = np.full(len(stats.taxa), .5)
+    if len(order) > 1:
+        position[order] = np.linspace(0., 1., len(order))
+    return position
+
+
+def node_points(tree, position, top, heights=None):
+    """
+    Points of the nodes of a `TaxonTree` in a unit square: tips along
+    the bottom at their `position`, inner nodes above the middle of
+    their leaves, at their height over `top`.
+
+    :param heights: Height of each node, by default its distance below\
+        the tip furthest from the root.
+    :return: Tuple of arrays (u, v).
+    """
+    rank, lo, hi = tree.leaf_ranks()
+    leaves = position[tree.taxon[rank >= 0]]
+    total = np.concatenate([[0.], np.cumsum(leaves)])
+    u = (total[hi] - total[lo]) / np.maximum(hi - lo, 1)
+    if heights is None:
+        distance = tree.distances()
+        heights = distance.max() - distance
+    v = np.asarray(heights) / top if top > 0 else np.zeros(len(tree))
+    return u, v
+
+
+def edges(tree, points, extent):
+    """
+    Segments from each node of a tree, but the root, to its parent,
+    as an (n - 1, 2, 2) array of map coordinates.
+
+    :param points: Points of the nodes in the unit square.
+    :param extent: (xmin, ymin, xmax, ymax) the square is drawn over.
+    """
+    xmin, ymin, xmax, ymax = extent
+    x = xmin + points[0] * (xmax - xmin)
+    y = ymin + points[1] * (ymax - ymin)
+    parent = tree.parent[1:]
+    return np.stack([np.stack([x[1:], y[1:]], axis=-1),
+                     np.stack([x[parent], y[parent]], axis=-1)], axis=1)
+
+
+def grid_shape(extent, columns):
+    """Cell size and (rows, columns) of a grid of square cells"""
+    xmin, ymin, xmax, ymax = extent
+    cell = (xmax - xmin) / columns
+    return cell, (max(1, int(math.ceil((ymax - ymin) / cell - 1e-9))),
+                  columns)
+
+
+def burn(grid, segments, xmin, ymax, cell):
+    """
+    Add one to each cell of `grid` crossed by one of `segments`, each
+    cell once however many of them cross it.
+    """
+    rows, columns = grid.shape
+    x = (segments[:, :, 0] - xmin) / cell
+    y = (ymax - segments[:, :, 1]) / cell
+    dx, dy = x[:, 1] - x[:, 0], y[:, 1] - y[:, 0]
+    steps = np.ceil(SAMPLES * np.hypot(dx, dy)).astype(np.int64) + 1
+    owner = np.repeat(np.arange(len(steps)), steps)
+    start = np.cumsum(steps) - steps
+    t = (np.arange(len(owner)) - start[owner]) / \
+        np.maximum(steps - 1, 1)[owner]
+    u = x[owner, 0] + t * dx[owner]
+    v = y[owner, 0] + t * dy[owner]
+    # Points on the right and bottom edges are in the last cells
+    inside = (u >= 0) & (u <= columns) & (v >= 0) & (v <= rows)
+    col = np.minimum(u[inside], columns - 1).astype(np.int64)
+    row = np.minimum(v[inside], rows - 1).astype(np.int64)
+    # Repeated indices are added to once, as the addition is buffered
+    grid.ravel()[row * columns + col] += 1
+
+
+def draw_tree(grid, tree, position, top, extent, cell):
+    """Burn the edges of a `TaxonTree` into `grid`"""
+    segments = edges(tree, node_points(tree, position, top), extent)
+    burn(grid, segments, extent[0], extent[3], cell)
+
+
+# Drawing parameters shared with the worker processes of a pool
+_shared = {}
+
+
+def _init_worker(taxa, position, top, extent, cell, shape):
+    # The worker's own copy, which must not number new taxa
+    taxa.frozen = True
+    _shared.update(taxa=taxa, position=position, top=top, extent=extent,
+                   cell=cell, shape=shape)
+
+
+def _worker_batch(batch):
+    s = _shared
+    grid = np.zeros(s['shape'], dtype=np.uint32)
+    for newick in batch:
+        tree = TaxonTree.parse(newick, s['taxa'], strip_comments=True)
+        draw_tree(grid, tree, s['position'], s['top'], s['extent'],
+                  s['cell'])
+    return grid
+
+
+def densitree(path, taxa, extent, columns, processes=None, progress=None,
+              context=None):
+    """
+    Densitree drawing of the trees of a Newick or NEXUS file.
+
+    :param taxa: `TaxonNamespace` the leaf labels are added to.
+    :param extent: (xmin, ymin, xmax, ymax) of the map area the trees\
+        are drawn over, tips along the bottom and roots at the top.
+    :param columns: Number of columns of the grid, whose cells are\
+        square. The grid reaches down past `ymin` to fit whole cells.
+    :param processes: Number of processes drawing batches of trees, or\
+        None to draw them in this one.
+    :param progress: Called with the fraction done, from time to time.
+    :param context: `multiprocessing` context the processes are started\
+        from, the default one if not given.
+    :return: `Drawing`.
+    """
+    first = second = None
+    if progress is not None:
+        first = lambda fraction: progress(.4 * fraction)
+        second = lambda fraction: progress(.4 + .6 * fraction)
+    stats, top, topologies = read_sample(path, taxa, first)
+    if not stats.trees:
+        raise ValueError('No trees in {}'.format(path))
+    position = leaf_positions(stats)
+    cell, shape = grid_shape(extent, columns)
+    xmin, _, xmax, ymax = extent
+    grid = np.zeros(shape, dtype=np.uint32)
+
+    count, index = max(topologies.values(), key=lambda e: (e[0], -e[1]))
+    newicks = sample(path, taxa, second)
+    best = []
+
+    def batches():
+        """Batches of the trees, keeping the most frequent topology"""
+        k = 0
+        while True:
+            batch = list(itertools.islice(newicks, BATCH))
+            if not batch:
+                return
+            if k <= index < k + len(batch):
+                best.append(batch[index - k])
+            k += len(batch)
+            yield batch
+
+    if processes:
+        pool = (context or multiprocessing).Pool(
+            processes, _init_worker,
+            (taxa, position, top, extent, cell, shape))
+        pending = collections.deque()
+        try:
+            for batch in batches():
+                # Only a few batches are read ahead of the workers
+                if len(pending) >= 2 * processes:
+                    grid += pending.popleft().get()
+                pending.append(pool.apply_async(_worker_batch, (batch,)))
+            while pending:
+                grid += pending.popleft().get()
+        except BaseException:
+            # Such as a cancelled progress callback
+            pool.terminate()
+            raise
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for batch in batches():
+            for newick in batch:
+                tree = TaxonTree.parse(newick, taxa, strip_comments=True)
+                draw_tree(grid, tree, position, top, extent, cell)
+    if progress is not None:
+        progress(1.)
+
+    top_tree = TaxonTree.parse(best[0], taxa, strip_comments=True)
+    grid_extent = (xmin, ymax - shape[0] * cell, xmax, ymax)
+    return Drawing(grid, grid_extent, cell, stats.trees, len(topologies),
+                   top_tree, count, stats, position, top)
+
+
+def summary_edges(drawing, extent):
+    """
+    Edges of the most frequent topology of a drawing, with its nodes at
+    the mean heights of their clades.
+
+    :return: Tuple of the (n - 1, 2, 2) segments, and the clade of each\
+        node as an int bitset.
+    """
+    tree, stats = drawing.top, drawing.stats
+    keys = stats.keys(tree)
+    heights = [stats.clades[key][2] / stats.clades[key][0] for key in keys]
+    # No node above its parent, which a clade's mean height may put it
+    for i, up in enumerate(tree.parent.tolist()[1:], 1):
+        heights[i] = min(heights[i], heights[up])
+    points = node_points(tree, drawing.position, drawing.height, heights)
+    return edges(tree, points, extent), keys
+
+
+def write_ascii(path, grid, extent, cell, wkt=None):
+    """
+    Write a grid as an ESRI ASCII grid, with its coordinate reference
+    system in a .prj file next to it if given as `wkt`.
+    """
+    rows, columns = grid.shape
+    with open(path, 'w') as f:
+        f.write('NCOLS {}\nNROWS {}\nXLLCORNER {!r}\nYLLCORNER {!r}\n'
+                'CELLSIZE {!r}\nNODATA_VALUE -9999\n'.format(
+                    columns, rows, float(extent[0]), float(extent[1]),
+                    float(cell)))
+        np.savetxt(f, grid, fmt='%d')
+    if wkt:
+        with open(os.path.splitext(path)[0] + '.prj', 'w') as f:
+            f.write(wkt)
+
+
+def write_raster(path, grid, extent, cell, wkt=None):
+    """
+    Write a grid as an ESRI ASCII grid if `path` ends in .asc, and as a
+    GeoTIFF with GDAL otherwise.
+    """
+    if path.lower().endswith('.asc'):
+        return write_ascii(path, grid, extent, cell, wkt)
+    from osgeo import gdal
+
+    rows, columns = grid.shape
+    out = gdal.GetDriverByName('GTiff').Create(
+        path, columns, rows, 1, gdal.GDT_UInt32, ['COMPRESS=DEFLATE'])
+    out.SetGeoTransform((extent[0], cell, 0., extent[3], 0., -cell))
+    if wkt:
+        out.SetProjection(wkt)
+    out.GetRasterBand(1).WriteArray(grid)
+    out.FlushCache()
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ PhyloTree
+                                 A QGIS plugin
+ Create, draw and link a phylogenetic tree to vector features
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2020-05-08
+        copyright            : (C) 2020 by Isaac Stead
+        email                : isaac.stead@protonmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+__author__ = 'Isaac Stead'
+__date__ = '2020-05-08'
+__copyright__ = '(C) 2020 by Isaac Stead'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+import time
+
+from qgis.PyQt.QtCore import QCoreApplication, QVariant
+from qgis.core import (QgsProcessing,
+                       QgsProcessingAlgorithm,
+                       QgsProcessingException,
+                       QgsProcessingParameterFile,
+                       QgsProcessingParameterExtent,
+                       QgsProcessingParameterNumber,
+                       QgsProcessingParameterRasterDestination,
+                       QgsProcessingParameterFeatureSink,
+                       QgsProcessingOutputNumber,
+                       QgsFeatureSink,
+                       QgsFeature,
+                       QgsGeometry,
+                       QgsPointXY,
+                       QgsWkbTypes)
+from phylo_tree.pipeline import Progress, Cancelled
+from phylo_tree.algorithm_utils import make_fields, worker_context
+from phylo_tree.trees.flat import flat_tree
+from phylo_tree.trees.consensus import as_node
+from phylo_tree.trees.taxa import TaxonNamespace
+from phylo_tree.densitree import densitree, summary_edges, write_raster
+
+
+class DensitreeAlgorithm(QgsProcessingAlgorithm):
+    """
+    Draws every tree of a sample, such as a Bayesian posterior, over
+    the same area of the map as a density raster: each cell counts the
+    trees with an edge through it. Leaves are placed in the order of
+    the consensus tree, and the most frequent topology can be drawn as
+    lines over the raster.
+    """
+
+    INPUTTREE = 'INPUTTREE'
+    EXTENT = 'EXTENT'
+    COLUMNS = 'COLUMNS'
+    PROCESSES = 'PROCESSES'
+    OUTPUT = 'OUTPUT'
+    OUTPUT_TOPOLOGY = 'OUTPUT_TOPOLOGY'
+    TREES = 'TREES'
+    TOPOLOGIES = 'TOPOLOGIES'
+    TOP_FREQUENCY = 'TOP_FREQUENCY'
+    DRAW_TIME = 'DRAW_TIME'
+
+    TOPOLOGY_FIELDS = {
+        'id':       QVariant.LongLong,
+        'label':    QVariant.String,
+        'support':  QVariant.Double,
+        'height':   QVariant.Double,
+    }
+
+    def initAlgorithm(self, config):
+        self.addParameter(
+            QgsProcessingParameterFile(
+                self.INPUTTREE,
+                self.tr('Tree file (Newick or NEXUS)')
+            )
+        )
+        # Tips along the bottom of the extent, roots at the top
+        self.addParameter(
+            QgsProcessingParameterExtent(
+                self.EXTENT,
+                self.tr('Drawing extent')
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.COLUMNS,
+                self.tr('Raster columns'),
+                QgsProcessingParameterNumber.Integer,
+                defaultValue=1000,
+                minValue=1
+            )
+        )
+        # Batches of trees are drawn by a pool of processes
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.PROCESSES,
+                self.tr('Processes (0 to run in this one)'),
+                QgsProcessingParameterNumber.Integer,
+                defaultValue=0,
+                minValue=0
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterRasterDestination(
+                self.OUTPUT,
+                self.tr('Tree density')
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterFeatureSink(
+                self.OUTPUT_TOPOLOGY,
+                self.tr('Most frequent topology'),
+                QgsProcessing.TypeVectorLine,
+                optional=True
+            )
+        )
+        outputs = [(self.TREES, 'Trees'),
+                   (self.TOPOLOGIES, 'Distinct topologies'),
+                   (self.TOP_FREQUENCY, 'Frequency of the most frequent '
+                                        'topology'),
+                   (self.DRAW_TIME, 'Drawing (s)')]
+        for name, description in outputs:
+            self.addOutput(
+                QgsProcessingOutputNumber(name, self.tr(description)))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        fname = self.parameterAsFile(parameters, self.INPUTTREE, context)
+        crs = self.parameterAsExtentCrs(parameters, self.EXTENT, context)
+        rect = self.parameterAsExtent(parameters, self.EXTENT, context, crs)
+        columns = self.parameterAsInt(parameters, self.COLUMNS, context)
+        processes = self.parameterAsInt(parameters, self.PROCESSES, context)
+        workers = worker_context() if processes else None
+        if processes and workers is None:
+            feedback.pushInfo('No Python interpreter to start processes '
+                              'with, running in this one')
+            processes = 0
+        output = self.parameterAsOutputLayer(parameters, self.OUTPUT, context)
+        if rect.isEmpty():
+            raise QgsProcessingException(self.tr('The extent is empty'))
+        extent = (rect.xMinimum(), rect.yMinimum(), rect.xMaximum(),
+                  rect.yMaximum())
+
+        progress = Progress(lambda f: feedback.setProgress(100 * f),
+                            feedback.isCanceled)
+        start = time.perf_counter()
+        try:
+            drawing = densitree(fname, TaxonNamespace(), extent, columns,
+                                processes=processes or None,
+                                progress=progress.stage(0., .9),
+                                context=workers)
+        except Cancelled:
+            return {}
+        except ValueError as e:
+            raise QgsProcessingException(str(e))
+        draw_time = time.perf_counter() - start
+        write_raster(output, drawing.grid, drawing.extent, drawing.cell,
+                     crs.toWkt())
+        feedback.pushInfo('Drew {} trees in {:.1f} s, {} distinct '
+                          'topologies'.format(drawing.trees, draw_time,
+                                              drawing.topologies))
+        results = {
+            self.OUTPUT:        output,
+            self.TREES:         drawing.trees,
+            self.TOPOLOGIES:    drawing.topologies,
+            self.TOP_FREQUENCY: drawing.top_trees / drawing.trees,
+            self.DRAW_TIME:     draw_time,
+        }
+
+        fields = make_fields(self.TOPOLOGY_FIELDS)
+        (sink, dest_id) = self.parameterAsSink(
+            parameters, self.OUTPUT_TOPOLOGY, context, fields,
+            QgsWkbTypes.LineString, crs
+        )
+        if sink is not None:
+            sink.addFeatures(self.create_topology(drawing, extent, fields),
+                             QgsFeatureSink.FastInsert)
+            results[self.OUTPUT_TOPOLOGY] = dest_id
+        progress(1.)
+        return results
+
+    def create_topology(self, drawing, extent, fields):
+        """
+        One line per edge of the most frequent topology, identified as
+        the edges of the tree algorithm are, by the clade of its node.
+        """
+        root = as_node(drawing.top, drawing.stats)
+        ids = flat_tree(root).clade_ids().tolist()
+        segments, _ = summary_edges(drawing, extent)
+        out = []
+        for i, node in enumerate(root.walk()):
+            if i:
+                (x0, y0), (x1, y1) = segments[i - 1].tolist()
+                feat = QgsFeature(fields)
+                feat.setGeometry(QgsGeometry.fromPolylineXY(
+                    [QgsPointXY(x1, y1), QgsPointXY(x0, y0)]))
+                feat['id'], feat['label'] = ids[i], node.name
+                feat['support'] = node.support
+                feat['height'] = node.height
+                out.append(feat)
+        return out
+
+    def name(self):
+        return 'Densitree raster'
+
+    def displayName(self):
+        return self.tr(self.name())
+
+    def group(self):
+        return self.tr(self.groupId())
+
+    def groupId(self):
+        return ''
+
+    def shortHelpString(self):
+        return self.tr('Draws all the trees of a Newick or NEXUS file, such '
+                       'as a posterior sample, on top of each other over the '
+                       'extent, as a raster counting the trees with an edge '
+                       'through each cell. Leaves keep the order of the '
+                       'consensus tree, and nodes sit at their height above '
+                       'the tips. Rasters ending in .asc are written as ESRI '
+                       'ASCII grids. The most frequent topology can be drawn '
+                       'as lines, at the mean heights of its clades.')
+
+    def tr(self, string):
+        return QCoreApplication.translate('Processing', string)
+
+    def createInstance(self):
+        return DensitreeAlgorithm()
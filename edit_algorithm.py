@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ PhyloTree
+                                 A QGIS plugin
+ Create, draw and link a phylogenetic tree to vector features
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2020-05-08
+        copyright            : (C) 2020 by Isaac Stead
+        email                : isaac.stead@protonmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+__author__ = 'Isaac Stead'
+__date__ = '2020-05-08'
+__copyright__ = '(C) 2020 by Isaac Stead'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+import json
+
+import numpy as np
+from qgis.PyQt.QtCore import QCoreApplication
+from qgis.core import (QgsProcessingAlgorithm,
+                       QgsProcessingException,
+                       QgsProcessingParameterFile,
+                       QgsProcessingParameterVectorLayer,
+                       QgsProcessingParameterString,
+                       QgsProcessingParameterEnum,
+                       QgsProcessingOutputVectorLayer,
+                       QgsProcessingOutputNumber,
+                       QgsFeature,
+                       QgsFeatureRequest,
+                       QgsGeometry,
+                       QgsPointXY,
+                       QgsUnitTypes)
+from phylo_tree.pipeline import TreePipeline
+from phylo_tree.phylo_tree_algorithm import PhyloTreeAlgorithm
+from phylo_tree.trees.lod import level_of_detail
+
+
+class TreeEditAlgorithm(QgsProcessingAlgorithm):
+    """
+    Collapses, expands or prunes a clade of a tree drawn by the
+    "Create and link phylogenetic tree" algorithm, rewriting in place only
+    the edges of the tree layer that the edit moved.
+
+    The edits made to a layer are kept in its custom properties, and
+    its layout in the tree cache, so successive edits build on each
+    other.
+    """
+
+    INPUTTREE = 'INPUTTREE'
+    TREELAYER = 'TREELAYER'
+    NODE = 'NODE'
+    OPERATION = 'OPERATION'
+    OUTPUT = 'OUTPUT'
+    MOVED = 'MOVED'
+    ADDED = 'ADDED'
+    DELETED = 'DELETED'
+
+    OPERATIONS = ['Collapse', 'Expand', 'Prune']
+
+    def flags(self):
+        # The tree layer is edited in place, which is only safe on the
+        # main thread
+        return super().flags() | QgsProcessingAlgorithm.FlagNoThreading
+
+    def initAlgorithm(self, config):
+        self.addParameter(
+            QgsProcessingParameterFile(
+                self.INPUTTREE,
+                self.tr('Tree file')
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterVectorLayer(
+                self.TREELAYER,
+                self.tr('Tree layer drawn from the file')
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterString(
+                self.NODE,
+                self.tr('Node label or id')
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.OPERATION,
+                self.tr('Edit'),
+                options=self.OPERATIONS,
+                defaultValue=0
+            )
+        )
+        self.addOutput(
+            QgsProcessingOutputVectorLayer(self.OUTPUT, self.tr('Tree')))
+        outputs = [(self.MOVED, 'Moved edges'), (self.ADDED, 'Added edges'),
+                   (self.DELETED, 'Deleted edges')]
+        for name, description in outputs:
+            self.addOutput(
+                QgsProcessingOutputNumber(name, self.tr(description)))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        fname = self.parameterAsFile(parameters, self.INPUTTREE, context)
+        layer = self.parameterAsVectorLayer(parameters, self.TREELAYER,
+                                            context)
+        label = self.parameterAsString(parameters, self.NODE, context)
+        operation = self.OPERATIONS[
+            self.parameterAsEnum(parameters, self.OPERATION, context)]
+
+        placement = layer.customProperty(
+            PhyloTreeAlgorithm.PLACEMENT_PROPERTY)
+        if not placement:
+            raise QgsProcessingException(
+                self.tr('{} is not a tree drawn beside the map').format(
+                    layer.name()))
+        transform = json.loads(placement)
+        # Edges drawn between scales get them worked out again as the
+        # tree algorithm did, from the size clades collapse below
+        scaled = layer.fields().indexOf('min_scale') >= 0
+        if scaled:
+            collapse = layer.customProperty(
+                PhyloTreeAlgorithm.COLLAPSE_PROPERTY)
+            if not collapse:
+                raise QgsProcessingException(
+                    self.tr('{} has scale ranges but not the clade size '
+                            'they were worked out from, draw the tree '
+                            'again to edit it').format(layer.name()))
+        # The layer may show a summary of the file rather than its
+        # first tree
+        summary = layer.customProperty(
+            PhyloTreeAlgorithm.SUMMARY_PROPERTY) or None
+        prop = PhyloTreeAlgorithm.EDITS_PROPERTY
+        edits = json.loads(layer.customProperty(prop, '[]'))
+        with TreePipeline(fname, summary=summary) as pipeline:
+            edited = pipeline.edited(layer.id(), edits, transform)
+        incremental, transform = edited.layout, edited.transform
+        ids = edited.ids
+
+        node = self.find_node(edited, label)
+        change = edited.apply(operation, node)
+        layer.setCustomProperty(prop, json.dumps(edited.edits))
+
+        # Edges hang from their child node, so a moved node also moves
+        # the edges to its children
+        moved = set(change.moved.tolist())
+        for i in change.moved.tolist():
+            moved.update(incremental.visible_children(i))
+        moved.difference_update(change.shown.tolist())
+        moved.discard(0)
+        shown = [i for i in change.shown.tolist() if i]
+        hidden = set(change.hidden.tolist())
+
+        scales = {}
+        if scaled:
+            scales = self.scale_ranges(layer, edited, float(collapse))
+
+        # Features of the moved and hidden edges, by node index, and
+        # the new scale ranges of the edges whose range changed
+        fids = {}
+        rescaled = {}
+        fields = layer.fields()
+        attributes = ['id'] + (['min_scale', 'max_scale'] if scaled else [])
+        request = QgsFeatureRequest().setFlags(QgsFeatureRequest.NoGeometry)
+        request.setSubsetOfAttributes(attributes, fields)
+        for feat in layer.getFeatures(request):
+            i = edited.index.get(feat['id'])
+            if i in moved or i in hidden:
+                fids[i] = feat.id()
+            if i in scales and \
+                    (feat['min_scale'], feat['max_scale']) != scales[i]:
+                rescaled[feat.id()] = dict(zip(
+                    [fields.indexOf('min_scale'),
+                     fields.indexOf('max_scale')], scales[i]))
+
+        provider = layer.dataProvider()
+        provider.changeAttributeValues(rescaled)
+        provider.changeGeometryValues({
+            fids[i]: self.edge(incremental, transform, i)
+            for i in moved if i in fids})
+        provider.deleteFeatures([fids[i] for i in hidden if i in fids])
+        names = incremental.tree.names
+        # Measures of the tree as drawn, for layers that have them
+        measures = [(name, values.tolist()) for name, values in
+                    zip(PhyloTreeAlgorithm.MEASURES,
+                        incremental.tree.measures())
+                    if layer.fields().indexOf(name) >= 0]
+        added = []
+        for i in shown:
+            feat = QgsFeature(layer.fields())
+            feat.setGeometry(self.edge(incremental, transform, i))
+            feat['id'], feat['label'] = ids[i], names[i]
+            for name, values in measures:
+                feat[name] = values[i]
+            if scaled:
+                feat['min_scale'], feat['max_scale'] = scales[i]
+            added.append(feat)
+        provider.addFeatures(added)
+        layer.triggerRepaint()
+
+        feedback.pushInfo('{} {}: {} edges moved, {} added, {} deleted, '
+                          '{} rescaled'.format(operation, node, len(moved),
+                                               len(added), len(hidden),
+                                               len(rescaled)))
+        return {
+            self.OUTPUT:  layer.id(),
+            self.MOVED:   len(moved),
+            self.ADDED:   len(added),
+            self.DELETED: len(hidden),
+        }
+
+    def scale_ranges(self, layer, edited, collapse):
+        """
+        Scale ranges of the edges of the tree as drawn after the edits,
+        by node index, from the size in pixels below which clades
+        collapse.
+        """
+        incremental = edited.layout
+        keep = np.flatnonzero(incremental.visible)
+        scale_x, offset_x, scale_y, offset_y = edited.transform
+        xs = scale_x * incremental.x[keep] + offset_x
+        ys = scale_y * incremental.depth[keep] + offset_y
+        unit = QgsUnitTypes.fromUnitToUnitFactor(
+            layer.crs().mapUnits(), QgsUnitTypes.DistanceMeters)
+        (min_scale, max_scale), _ = level_of_detail(
+            incremental.tree.subtree(keep), xs, ys, collapse, unit=unit)
+        return dict(zip(keep.tolist(), zip(min_scale.tolist(),
+                                           max_scale.tolist())))
+
+    def find_node(self, edited, label):
+        """Clade id of the node with the given label, or id"""
+        names = edited.layout.tree.names
+        if label in names:
+            return edited.ids[names.index(label)]
+        if label.lstrip('-').isdigit() and int(label) in edited.index:
+            return int(label)
+        raise QgsProcessingException(
+            self.tr('No node labelled {} in the tree').format(label))
+
+    def edge(self, incremental, transform, i):
+        """Line from the parent of node `i` to the node, on the map"""
+        scale_x, offset_x, scale_y, offset_y = transform
+        points = []
+        for j in (incremental.parent[i], i):
+            x, y = incremental.coords(j)
+            points.append(QgsPointXY(scale_x * x + offset_x,
+                                     scale_y * y + offset_y))
+        return QgsGeometry.fromPolylineXY(points)
+
+    def name(self):
+        return 'Edit tree'
+
+    def displayName(self):
+        return self.tr(self.name())
+
+    def group(self):
+        return self.tr(self.groupId())
+
+    def groupId(self):
+        return ''
+
+    def shortHelpString(self):
+        return self.tr('Collapses, expands or prunes the clade under a node '
+                       'of a drawn tree. Only the clade\'s ancestors are laid '
+                       'out again and only the edges that moved are '
+                       'rewritten, so edits are quick even on huge trees.')
+
+    def tr(self, string):
+        return QCoreApplication.translate('Processing', string)
+
+    def createInstance(self):
+        return TreeEditAlgorithm()
@@ -55,7 +55,7 @@ class Line(object):
         """Return the point of intersection this and `line`"""
         try:
             x = (self.intercept - line.intercept) / (line.slope - self.slope)
-            y = self.slope * (x + self.intercept)
+            y = self.slope * x + self.intercept
         except ZeroDivisionError:
             return False
         return (x, y)
@@ -98,6 +98,52 @@ def centroid(points):
     x, y = 1 / n * sum(xs), 1 / n * sum(ys)
     return (x, y)
 
+def polygon_centroid(ring):
+    """
+    Area weighted centroid of the polygon bounded by `ring`, a list
+    of (x, y) vertices. Falls back to the mean of the vertices for
+    rings without area.
+    """
+    area = cx = cy = 0.
+    for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1]):
+        f = x1 * y2 - x2 * y1
+        area += f
+        cx += (x1 + x2) * f
+        cy += (y1 + y2) * f
+    if area == 0:
+        return centroid(ring)
+    return (cx / (3 * area), cy / (3 * area))
+
+def cross(o, a, b):
+    """2D cross product of the vectors o->a and o->b"""
+    return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
 def convex_hull(points):
-    """Jarvis' algorithm: compute the convex hull of `points`"""
-    pass
\ No newline at end of file
+    """
+    Andrew's monotone chain: compute the convex hull of `points`.
+    Returns the hull vertices as a list of (x, y) tuples in
+    counter-clockwise order, without repeating the first vertex.
+    """
+    pts = sorted(set((x, y) for x, y in points))
+    if len(pts) < 3:
+        return pts
+
+    def half(seq):
+        chain = []
+        for p in seq:
+            while len(chain) >= 2 and cross(chain[-2], chain[-1], p) <= 0:
+                chain.pop()
+            chain.append(p)
+        return chain
+
+    lower = half(pts)
+    upper = half(reversed(pts))
+    return lower[:-1] + upper[:-1]
+
+def merge_hulls(hulls):
+    """
+    Convex hull of the union of several convex hulls. Only the
+    hull vertices are considered, so the cost depends on the size
+    of the hulls rather than on the number of points inside them.
+    """
+    return convex_hull(p for hull in hulls for p in hull)
\ No newline at end of file
@@ -0,0 +1,248 @@
+"""
+    Linking tree leaves to map features.
+
+    Leaf labels and feature names rarely agree exactly: Newick labels
+    use underscores for spaces, case and diacritics differ, and some
+    layers identify languages by ISO 639-3 code or Glottocode. A
+    `NameIndex` of normalized leaf labels is built once per run and
+    resolves each feature in constant time, with an n-gram index for
+    approximate matching of whatever is left over.
+
+    Several features may share a leaf's name, for example a language
+    spoken in several places. The features are streamed through a
+    `LinkAggregator` once, which keeps just enough per leaf to produce
+    its link targets afterwards.
+"""
+import re
+import unicodedata
+from collections import defaultdict
+
+AGGREGATIONS = ['first', 'centroid', 'nearest', 'all']
+
+# Codes embedded in leaf labels, e.g. "Malay [zlm]" or "Malay_stan1306"
+CODE = re.compile(r'\[([^\]]+)\]|(?<![^\W_])([a-z]{4}[0-9]{4})(?![^\W_])')
+
+
+def underscores(name):
+    return name.replace('_', ' ')
+
+
+def case(name):
+    return name.casefold()
+
+
+def diacritics(name):
+    decomposed = unicodedata.normalize('NFKD', name)
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def punctuation(name):
+    """Drop punctuation and collapse runs of whitespace"""
+    name = ''.join(' ' if unicodedata.category(c)[0] in 'PZ' else c
+                   for c in name)
+    return ' '.join(name.split())
+
+
+NORMALIZERS = {
+    'underscores': underscores,
+    'case':        case,
+    'diacritics':  diacritics,
+    'punctuation': punctuation,
+}
+
+
+def make_normalizer(names=NORMALIZERS):
+    """
+    Compose the normalizers listed in `names` into a single function.
+    """
+    steps = [NORMALIZERS[n] for n in NORMALIZERS if n in names]
+
+    def normalize(name):
+        if name is None:
+            return None
+        name = str(name)
+        for step in steps:
+            name = step(name)
+        return name.strip()
+    return normalize
+
+
+def ngrams(name, n=3):
+    """The set of character n-grams of `name`, padded with spaces"""
+    padded = ' ' * (n - 1) + name + ' ' * (n - 1)
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+
+class NameIndex(object):
+    """
+    Index of leaves by normalized label.
+
+    Each leaf is indexed under its normalized label and under any
+    code embedded in the label, so that features can be resolved by
+    name or by a secondary identifier such as a Glottocode. Labels and
+    codes are normalized once, and also indexed as given, so that the
+    names of features spelled exactly as a leaf are not normalized.
+
+    :param leaves: Iterable of leaf objects.
+    :param label: Function returning the label of a leaf.
+    :param normalize: Function normalizing labels and feature names.
+    """
+
+    def __init__(self, leaves, label=lambda leaf: leaf.name,
+                 normalize=make_normalizer()):
+        self.normalize = normalize
+        self.label = label
+        self.leaves = []
+        self._keys = {}
+        self._exact = {}
+        self._labels = []
+        self._matched = set()
+        for leaf in leaves:
+            self.leaves.append(leaf)
+            name = label(leaf)
+            key = normalize(name)
+            self._labels.append(key or '')
+            if key:
+                self._exact.setdefault(name, self._keys.setdefault(key, leaf))
+            for m in CODE.finditer(name or ''):
+                raw = m.group(1) or m.group(2)
+                code = normalize(raw)
+                if code:
+                    self._exact.setdefault(raw,
+                                           self._keys.setdefault(code, leaf))
+
+    def lookup(self, *names):
+        """
+        Leaf matching the first of `names` (e.g. a feature's name and
+        its code) found in the index, or None.
+        """
+        for name in names:
+            leaf = self._exact.get(name) if isinstance(name, str) else None
+            if leaf is None:
+                leaf = self._keys.get(self.normalize(name))
+            if leaf is not None:
+                self._matched.add(id(leaf))
+                return leaf
+        return None
+
+    def unmatched(self):
+        """Leaves not returned by any lookup so far"""
+        return [l for l in self.leaves if id(l) not in self._matched]
+
+    def approximate(self, names, threshold=0.8):
+        """
+        Match `names` that failed the exact lookup to the leaves that
+        are still unmatched, by the Dice coefficient of their trigram
+        sets. Candidates are drawn from an inverted trigram index, so
+        each name is only compared with leaves sharing a trigram with
+        it. Returns a {name: leaf} dictionary of matches scoring at
+        least `threshold`.
+        """
+        leaves, grams = [], []
+        for leaf, key in zip(self.leaves, self._labels):
+            if id(leaf) not in self._matched:
+                leaves.append(leaf)
+                grams.append(ngrams(key))
+        inverted = defaultdict(list)
+        for i, gs in enumerate(grams):
+            for g in gs:
+                inverted[g].append(i)
+
+        out = {}
+        for name in names:
+            query = ngrams(self.normalize(name) or '')
+            shared = defaultdict(int)
+            for g in query:
+                for i in inverted.get(g, ()):
+                    shared[i] += 1
+            best, score = None, threshold
+            for i, count in shared.items():
+                dice = 2.0 * count / (len(query) + len(grams[i]))
+                if dice >= score:
+                    best, score = i, dice
+            if best is not None:
+                out[name] = leaves[best]
+        for leaf in out.values():
+            self._matched.add(id(leaf))
+        return out
+
+
+class LinkAggregator(object):
+    """
+    Accumulate the locations of the features matched to each leaf and
+    reduce them to link targets according to `mode`:
+
+    first:    the first matched feature only
+    centroid: the mean location of all matched features
+    nearest:  the matched feature nearest to the leaf
+    all:      every matched feature
+
+    Running sums are kept for every mode, so `centroid` is always
+    available, for instance to place leaves on the map. Individual
+    locations are only kept by the modes that need them.
+    """
+
+    def __init__(self, mode='first'):
+        if mode not in AGGREGATIONS:
+            raise ValueError('Unknown aggregation {}'.format(mode))
+        self.mode = mode
+        self._first = {}
+        self._sums = {}
+        self._points = {}
+
+    def add(self, key, x, y):
+        """Record a feature at (x, y) matched to `key`"""
+        sums = self._sums.get(key)
+        if sums is None:
+            self._sums[key] = [x, y, 1]
+            self._first[key] = (x, y)
+        else:
+            sums[0] += x
+            sums[1] += y
+            sums[2] += 1
+        if self.mode in ('nearest', 'all'):
+            self._points.setdefault(key, []).append((x, y))
+
+    def __len__(self):
+        return len(self._sums)
+
+    def __contains__(self, key):
+        return key in self._sums
+
+    def keys(self):
+        return self._sums.keys()
+
+    def count(self, key):
+        """Number of features matched to `key`"""
+        return self._sums[key][2] if key in self._sums else 0
+
+    def centroid(self, key):
+        sx, sy, n = self._sums[key]
+        return (sx / n, sy / n)
+
+    def targets(self, key, origin=None):
+        """
+        List of (x, y) link targets for `key`. `origin` is the
+        position of the leaf, required by the `nearest` mode.
+        """
+        if self.mode == 'first':
+            return [self._first[key]]
+        elif self.mode == 'centroid':
+            return [self.centroid(key)]
+        points = self._points[key]
+        if self.mode == 'all':
+            return list(points)
+        if origin is None:
+            raise ValueError('Nearest aggregation needs the leaf position')
+        ox, oy = origin
+        return [min(points, key=lambda p: (p[0] - ox) ** 2 + (p[1] - oy) ** 2)]
+
+    def links(self, position=None):
+        """
+        Yield (key, (x, y)) pairs, one per link line. `position` maps
+        a key to the location of its leaf, if `nearest` is used.
+        """
+        for key in self._sums:
+            origin = position(key) if position else None
+            for target in self.targets(key, origin):
+                yield key, target
@@ -0,0 +1,164 @@
+"""
+    Mantel test of the correlation between two distance matrices.
+
+    The statistic is Pearson's r over the pairs of the upper triangle.
+    Permuting the rows and columns of one matrix together only moves
+    its entries around, leaving their mean and deviation unchanged, so
+    both matrices are standardized once and each permutation costs a
+    single sum of products, taken over blocks of rows gathered with
+    the permutation. Permutations are drawn and evaluated in chunks,
+    by a pool of processes if asked, each chunk seeded from the seed
+    and its number so that results don't depend on how many processes
+    ran them.
+"""
+import multiprocessing
+
+import numpy as np
+
+# Mean Earth radius in kilometres
+EARTH_RADIUS = 6371.0088
+# Permutations evaluated by a task of the pool
+CHUNK = 50
+# Rows gathered at once for a sum of products
+ROWS = 64
+
+
+def great_circle(lon, lat, radius=EARTH_RADIUS):
+    """
+    Matrix of the great circle distances between points given in
+    degrees, by the haversine formula, as float32.
+    """
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    n = len(lon)
+    out = np.empty((n, n), dtype=np.float32)
+    cos = np.cos(lat)
+    for lo in range(0, n, ROWS):
+        hi = min(lo + ROWS, n)
+        dlat = lat[None, :] - lat[lo:hi, None]
+        dlon = lon[None, :] - lon[lo:hi, None]
+        h = (np.sin(dlat / 2) ** 2 +
+             cos[lo:hi, None] * cos[None, :] * np.sin(dlon / 2) ** 2)
+        out[lo:hi] = 2 * radius * np.arcsin(np.sqrt(np.minimum(h, 1.)))
+    return out
+
+
+def standardize(matrix):
+    """
+    Copy of a square matrix as float32, less the mean and divided by
+    the standard deviation of the entries off its diagonal, with the
+    diagonal set to zero.
+    """
+    matrix = np.asarray(matrix)
+    n = len(matrix)
+    pairs = n * (n - 1)
+    diagonal = matrix.diagonal().astype(np.float64)
+    total = matrix.sum(dtype=np.float64) - diagonal.sum()
+    squares = np.einsum('ij,ij->', matrix, matrix, dtype=np.float64) - \
+        (diagonal ** 2).sum()
+    mean = total / pairs
+    std = np.sqrt(max(squares / pairs - mean ** 2, 0.))
+    out = np.asarray(matrix, dtype=np.float32) - np.float32(mean)
+    if std > 0:
+        out /= np.float32(std)
+    np.fill_diagonal(out, 0)
+    return out
+
+
+def cross(x, y, order=None):
+    """
+    Sum of the products of the entries of `x` and those of `y` with
+    rows and columns in `order`, accumulated in double precision.
+    """
+    total = 0.
+    for lo in range(0, len(x), ROWS):
+        hi = min(lo + ROWS, len(x))
+        if order is None:
+            block = y[lo:hi]
+        else:
+            block = y.take(order[lo:hi], axis=0).take(order, axis=1)
+        total += float(np.vdot(x[lo:hi], block))
+    return total
+
+
+# Matrices shared with the worker processes of a pool
+_shared = {}
+
+
+def _init_worker(x, y, seed):
+    _shared.update(x=x, y=y, seed=seed)
+
+
+def _worker_chunk(task):
+    return permuted(_shared['x'], _shared['y'], _shared['seed'], *task)
+
+
+def permuted(x, y, seed, chunk, count):
+    """
+    Sums of products of the standardized `x` and `y` under the `count`
+    permutations of chunk number `chunk`.
+    """
+    rng = np.random.default_rng([seed, chunk])
+    return np.array([cross(x, y, rng.permutation(len(x)))
+                     for _ in range(count)])
+
+
+def mantel(x, y, permutations=999, processes=None, seed=None,
+           progress=None, context=None):
+    """
+    Mantel test of two square distance matrices.
+
+    :param permutations: Number of permutations of `y`.
+    :param processes: Number of processes evaluating the permutations,\
+        or None to evaluate them in this one.
+    :param seed: Seed of the permutations, random if not given.
+    :param progress: Called with the fraction of permutations done.
+    :param context: `multiprocessing` context the processes are started\
+        from, the default one if not given.
+    :return: Tuple of Pearson's r and the one-sided p value of a\
+        correlation at least as strong, from the permutations.
+    """
+    n = len(x)
+    if n < 3 or np.shape(y) != np.shape(x):
+        raise ValueError('Need two square matrices of the same size, of at '
+                         'least three items')
+    x, y = standardize(x), standardize(y)
+    pairs = n * (n - 1)
+    observed = cross(x, y)
+    r = observed / pairs
+    if not permutations:
+        return r, float('nan')
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+
+    tasks = [(k, min(CHUNK, permutations - start))
+             for k, start in enumerate(range(0, permutations, CHUNK))]
+    greater = 0
+    done = 0
+    # Tolerance for sums that only differ by rounding
+    tolerance = 1e-7 * abs(observed)
+    if processes:
+        pool = (context or multiprocessing).Pool(processes, _init_worker,
+                                                 (x, y, seed))
+        try:
+            results = pool.imap_unordered(_worker_chunk, tasks)
+            for sums in results:
+                greater += int((sums >= observed - tolerance).sum())
+                done += len(sums)
+                if progress is not None:
+                    progress(done / permutations)
+        except BaseException:
+            # Such as a cancelled progress callback
+            pool.terminate()
+            raise
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for task in tasks:
+            sums = permuted(x, y, seed, *task)
+            greater += int((sums >= observed - tolerance).sum())
+            done += len(sums)
+            if progress is not None:
+                progress(done / permutations)
+    return r, (greater + 1) / (permutations + 1)
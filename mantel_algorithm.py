@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ PhyloTree
+                                 A QGIS plugin
+ Create, draw and link a phylogenetic tree to vector features
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2020-05-08
+        copyright            : (C) 2020 by Isaac Stead
+        email                : isaac.stead@protonmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+__author__ = 'Isaac Stead'
+__date__ = '2020-05-08'
+__copyright__ = '(C) 2020 by Isaac Stead'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+import time
+
+from qgis.PyQt.QtCore import QCoreApplication
+from qgis.core import (QgsProcessing,
+                       QgsProcessingAlgorithm,
+                       QgsProcessingException,
+                       QgsProcessingParameterFeatureSource,
+                       QgsProcessingParameterFile,
+                       QgsProcessingParameterField,
+                       QgsProcessingParameterEnum,
+                       QgsProcessingParameterNumber,
+                       QgsProcessingOutputNumber,
+                       QgsCoordinateReferenceSystem,
+                       QgsCoordinateTransform,
+                       QgsPointXY)
+from phylo_tree.pipeline import Progress, Cancelled, TreePipeline
+from phylo_tree.algorithm_utils import match_leaves, worker_context
+from phylo_tree.trees.flat import flat_tree
+from phylo_tree.trees.distances import patristic
+from phylo_tree.mantel import mantel, great_circle
+from phylo_tree.linking import (LinkAggregator, NameIndex, NORMALIZERS,
+                                make_normalizer)
+
+
+class MantelAlgorithm(QgsProcessingAlgorithm):
+    """
+    Tests whether distances along a tree track distances on the map:
+    matches the leaves of the tree to features as the tree algorithm
+    does, then runs a Mantel test between the patristic distances of
+    the matched leaves and the great circle distances between the
+    centroids of their features.
+    """
+
+    INPUTLAYER = 'INPUTLAYER'
+    INPUTTREE = 'INPUTTREE'
+    NAMEFIELD = 'NAMEFIELD'
+    IDFIELD = 'IDFIELD'
+    NORMALIZE = 'NORMALIZE'
+    FUZZY = 'FUZZY'
+    PERMUTATIONS = 'PERMUTATIONS'
+    PROCESSES = 'PROCESSES'
+    SEED = 'SEED'
+    R = 'R'
+    P = 'P'
+    MATCHED = 'MATCHED'
+    DISTANCE_TIME = 'DISTANCE_TIME'
+    PERMUTATION_TIME = 'PERMUTATION_TIME'
+
+    def initAlgorithm(self, config):
+        self.addParameter(
+            QgsProcessingParameterFeatureSource(
+                self.INPUTLAYER,
+                self.tr('Input layer'),
+                [QgsProcessing.TypeVectorAnyGeometry]
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterFile(
+                self.INPUTTREE,
+                self.tr('Tree file')
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterField(
+                self.NAMEFIELD,
+                self.tr('Name field'),
+                defaultValue='Language',
+                parentLayerParameterName=self.INPUTLAYER
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterField(
+                self.IDFIELD,
+                self.tr('Code field (e.g. ISO 639-3 or Glottocode)'),
+                parentLayerParameterName=self.INPUTLAYER,
+                optional=True
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.NORMALIZE,
+                self.tr('Ignore differences in'),
+                options=[self.tr(n) for n in NORMALIZERS],
+                allowMultiple=True,
+                defaultValue=list(range(len(NORMALIZERS))),
+                optional=True
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.FUZZY,
+                self.tr('Approximate match threshold'),
+                QgsProcessingParameterNumber.Double,
+                defaultValue=0.8,
+                minValue=0.0,
+                maxValue=1.0
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.PERMUTATIONS,
+                self.tr('Permutations'),
+                QgsProcessingParameterNumber.Integer,
+                defaultValue=999,
+                minValue=0
+            )
+        )
+        # Permutations are run in chunks by a pool of processes
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.PROCESSES,
+                self.tr('Processes (0 to run in this one)'),
+                QgsProcessingParameterNumber.Integer,
+                defaultValue=0,
+                minValue=0
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.SEED,
+                self.tr('Random seed'),
+                QgsProcessingParameterNumber.Integer,
+                optional=True,
+                minValue=0
+            )
+        )
+        outputs = [(self.R, 'Mantel r'), (self.P, 'p value'),
+                   (self.MATCHED, 'Matched leaves'),
+                   (self.DISTANCE_TIME, 'Distance matrices (s)'),
+                   (self.PERMUTATION_TIME, 'Mantel test (s)')]
+        for name, description in outputs:
+            self.addOutput(
+                QgsProcessingOutputNumber(name, self.tr(description)))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        layer = self.parameterAsSource(parameters, self.INPUTLAYER, context)
+        fname = self.parameterAsFile(parameters, self.INPUTTREE, context)
+        namefield = self.parameterAsString(parameters, self.NAMEFIELD, context)
+        idfield = self.parameterAsString(parameters, self.IDFIELD, context)
+        normalizers = [list(NORMALIZERS)[i] for i in
+                       self.parameterAsEnums(parameters, self.NORMALIZE, context)]
+        threshold = self.parameterAsDouble(parameters, self.FUZZY, context)
+        permutations = self.parameterAsInt(parameters, self.PERMUTATIONS,
+                                           context)
+        processes = self.parameterAsInt(parameters, self.PROCESSES, context)
+        workers = worker_context() if processes else None
+        if processes and workers is None:
+            feedback.pushInfo('No Python interpreter to start processes '
+                              'with, running in this one')
+            processes = 0
+        seed = None
+        if parameters.get(self.SEED) is not None:
+            seed = self.parameterAsInt(parameters, self.SEED, context)
+
+        progress = Progress(lambda f: feedback.setProgress(100 * f),
+                            feedback.isCanceled)
+        try:
+            with TreePipeline(fname) as pipeline:
+                flat = flat_tree(pipeline.parse(progress.stage(0., .1)))
+
+            # Each matched leaf sits at the centroid of its features
+            leaves = flat.leaves().tolist()
+            nodes = [flat.nodes[i] for i in leaves]
+            index = NameIndex(nodes, normalize=make_normalizer(normalizers))
+            aggregator = LinkAggregator('centroid')
+            keys = [namefield] + ([idfield] if idfield else [])
+            match_leaves(layer, keys, index, aggregator, threshold=threshold)
+            matched = [(i, node) for i, node in zip(leaves, nodes)
+                       if node in aggregator]
+            feedback.pushInfo('Matched {} of {} leaves'.format(
+                len(matched), len(leaves)))
+            if len(matched) < 3:
+                raise QgsProcessingException(
+                    self.tr('At least three leaves must match features'))
+            progress(.2)
+
+            start = time.perf_counter()
+            to_wgs84 = QgsCoordinateTransform(
+                layer.sourceCrs(), QgsCoordinateReferenceSystem('EPSG:4326'),
+                context.transformContext())
+            points = [to_wgs84.transform(QgsPointXY(*aggregator.centroid(n)))
+                      for _, n in matched]
+            geographic = great_circle([p.x() for p in points],
+                                      [p.y() for p in points])
+            # Without branch lengths, distances count the edges
+            distance = None
+            if not flat.has_lengths:
+                feedback.pushInfo('The tree has no branch lengths, '
+                                  'counting edges instead')
+                distance = flat.measures().depth
+            _, tree = patristic(flat, [i for i, _ in matched],
+                                distance=distance,
+                                processes=processes or None,
+                                progress=progress.stage(.2, .3),
+                                context=workers)
+            distance_time = time.perf_counter() - start
+            feedback.pushInfo('Distance matrices: {:.1f} s'.format(
+                distance_time))
+
+            start = time.perf_counter()
+            r, p = mantel(tree, geographic, permutations,
+                          processes=processes or None, seed=seed,
+                          progress=progress.stage(.3, 1.), context=workers)
+            permutation_time = time.perf_counter() - start
+        except Cancelled:
+            return {}
+
+        feedback.pushInfo('Mantel r = {:.4f}, p = {:.4g} from {} '
+                          'permutations in {:.1f} s'.format(
+                              r, p, permutations, permutation_time))
+        return {
+            self.R:                r,
+            self.P:                p,
+            self.MATCHED:          len(matched),
+            self.DISTANCE_TIME:    distance_time,
+            self.PERMUTATION_TIME: permutation_time,
+        }
+
+    def name(self):
+        return 'Tree and map distance correlation'
+
+    def displayName(self):
+        return self.tr(self.name())
+
+    def group(self):
+        return self.tr(self.groupId())
+
+    def groupId(self):
+        return ''
+
+    def shortHelpString(self):
+        return self.tr('Mantel test of the correlation between the distances '
+                       'along the tree between the leaves matched to the '
+                       'input features and the great circle distances '
+                       'between those features. The p value is the share '
+                       'of random permutations giving a correlation at '
+                       'least as strong.')
+
+    def tr(self, string):
+        return QCoreApplication.translate('Processing', string)
+
+    def createInstance(self):
+        return MantelAlgorithm()
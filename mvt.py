@@ -0,0 +1,904 @@
+"""
+    Mapbox Vector Tile pyramid export.
+
+    Writes line features (tree edges, links) to a pyramid of MVT tiles
+    for a range of zoom levels, either into a z/x/y.pbf directory or
+    into an MBTiles SQLite file. Coordinates are longitude/latitude.
+    Features are added to a `TileSet` as they are made and kept as
+    flat arrays, and each zoom level is indexed in strips of tile
+    columns, so memory stays a few dozen bytes a feature plus a
+    bounded index, whatever the number of tiles.
+
+    At every zoom level lines are snapped to the tile grid and
+    simplified with Douglas-Peucker at a tolerance of one grid unit,
+    and lines shorter than `min_length` grid units are left out, so
+    low zoom levels only carry what can actually be seen. Where a tile
+    would still hold more than `max_features` lines of a layer only the
+    longest are kept, as in other tilers. Tiles are encoded in a
+    process pool and MBTiles rows are written in large transactions.
+
+    The protobuf encoding is done here, following version 2.1 of the
+    Mapbox Vector Tile specification, so nothing beyond numpy is
+    needed. Straight lines, which trees and links are made of, are
+    indexed, clipped and encoded as arrays rather than one by one.
+"""
+import gzip
+import json
+import math
+import os
+import sqlite3
+import struct
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+EXTENT = 4096
+BUFFER = 64
+MAX_LATITUDE = 85.0511287798
+BATCH = 1000
+
+# Protobuf wire types
+VARINT = 0
+FIXED64 = 1
+LENGTH = 2
+
+# MVT geometry types and commands
+LINESTRING = 2
+MOVETO = 1
+LINETO = 2
+
+
+# Projection
+
+def project(lon, lat):
+    """Longitude/latitude to Web Mercator in the unit square, y down"""
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    x = (lon + 180.) / 360.
+    s = math.sin(math.radians(lat))
+    y = .5 - math.log((1 + s) / (1 - s)) / (4 * math.pi)
+    return x, y
+
+
+# Protobuf encoding
+
+# Most integers in a tile are small, their encoding is looked up
+SMALL = 1 << 14
+_VARINTS = [bytes([n]) if n < 0x80 else bytes([n & 0x7f | 0x80, n >> 7])
+            for n in range(SMALL)]
+
+
+def varint(n):
+    if n < SMALL:
+        return _VARINTS[n]
+    out = bytearray()
+    while True:
+        bits = n & 0x7f
+        n >>= 7
+        if n:
+            out.append(bits | 0x80)
+        else:
+            out.append(bits)
+            return bytes(out)
+
+
+def zigzag(n):
+    return (n << 1) ^ (n >> 63)
+
+
+def key(field, wiretype):
+    return varint((field << 3) | wiretype)
+
+
+def length_delimited(field, data):
+    return key(field, LENGTH) + varint(len(data)) + data
+
+
+def packed(field, values):
+    return length_delimited(field, b''.join(map(varint, values)))
+
+
+def encode_value(value):
+    """A Layer.Value message"""
+    if isinstance(value, bool):
+        return key(7, VARINT) + varint(int(value))
+    elif isinstance(value, int):
+        if value < 0:
+            return key(6, VARINT) + varint(zigzag(value))
+        return key(5, VARINT) + varint(value)
+    elif isinstance(value, float):
+        return key(3, FIXED64) + struct.pack('<d', value)
+    return length_delimited(1, str(value).encode('utf8'))
+
+
+def value_field(value):
+    """A value as a field of its layer"""
+    return length_delimited(4, encode_value(value))
+
+
+def encode_geometry(parts):
+    """Command integers for a (multi)linestring in tile coordinates"""
+    commands = []
+    cx = cy = 0
+    for part in parts:
+        x, y = part[0]
+        commands.append(MOVETO | (1 << 3))
+        commands.extend((zigzag(x - cx), zigzag(y - cy)))
+        cx, cy = x, y
+        commands.append(LINETO | ((len(part) - 1) << 3))
+        for x, y in part[1:]:
+            commands.extend((zigzag(x - cx), zigzag(y - cy)))
+            cx, cy = x, y
+    return commands
+
+
+def encode_feature(fid, tags, commands):
+    """A Tile.Feature message, wrapped as a field of its layer"""
+    feat = _FEATURE_ID + varint(fid)
+    if tags:
+        feat += packed(2, tags)
+    feat += _FEATURE_TYPE + packed(4, commands)
+    return length_delimited(2, feat)
+
+
+def encode_layer(name, features, keys, values):
+    """
+    A Tile.Layer message from its encoded `features`, the `keys` their
+    tags refer to and the encoded value fields, as from `value_field`.
+    """
+    layer = key(15, VARINT) + varint(2)
+    layer += length_delimited(1, name.encode('utf8'))
+    layer += features
+    layer += b''.join(length_delimited(3, k.encode('utf8')) for k in keys)
+    layer += values
+    layer += key(5, VARINT) + varint(EXTENT)
+    return layer
+
+
+_FEATURE_ID = key(1, VARINT)
+_FEATURE_TYPE = key(3, VARINT) + varint(LINESTRING)
+
+# Token layout of a straight line feature, see `encode_lines`
+_LINE_HEAD = [(2 << 3) | LENGTH, 0, (1 << 3) | VARINT, 0,
+              (2 << 3) | LENGTH, 0]
+_LINE_TAIL = [(3 << 3) | VARINT, LINESTRING, (4 << 3) | LENGTH, 0,
+              MOVETO | (1 << 3), 0, 0, LINETO | (1 << 3), 0, 0]
+
+
+def varint_sizes(values):
+    """Number of bytes of the varints of an array of integers"""
+    sizes = np.ones(values.shape, dtype=np.int64)
+    for bits in (7, 14, 21, 28, 35, 42, 49, 56, 63):
+        sizes += values >= (1 << bits)
+    return sizes
+
+
+def encode_varints(values):
+    """The varints of a 1D array of non-negative integers, concatenated"""
+    sizes = varint_sizes(values)
+    width = int(sizes.max()) if len(values) else 1
+    shifts = 7 * np.arange(width)
+    groups = (values[:, None] >> shifts) & 0x7f
+    groups |= (np.arange(width) < sizes[:, None] - 1) * 0x80
+    return groups[np.arange(width) < sizes[:, None]].astype(np.uint8).tobytes()
+
+
+def encode_lines(fids, tags, segments):
+    """
+    Encode straight line features all at once.
+
+    Every field of a feature is a varint, so each feature is laid out
+    as a row of integers, the message lengths are summed from their
+    varint sizes and the valid cells of all rows are encoded in one
+    go.
+
+    :param fids: Feature ids.
+    :param tags: (n, 2k) array of key and value indices, -1 where a\
+        feature has no value for a key.
+    :param segments: (n, 4) array of x0, y0, x1, y1 in tile coordinates.
+    """
+    n, ntags = tags.shape
+    head, tail = len(_LINE_HEAD), len(_LINE_TAIL)
+    tokens = np.empty((n, head + ntags + tail), dtype=np.int64)
+    tokens[:, :head] = _LINE_HEAD
+    tokens[:, head:head + ntags] = tags
+    tokens[:, head + ntags:] = _LINE_TAIL
+    tokens[:, 3] = fids
+    geometry = tokens[:, -tail:]
+    deltas = np.column_stack([segments[:, :2],
+                              segments[:, 2:] - segments[:, :2]])
+    deltas = (deltas << 1) ^ (deltas >> 63)
+    geometry[:, 5:7] = deltas[:, :2]
+    geometry[:, 8:10] = deltas[:, 2:]
+    valid = tokens >= 0
+    sizes = np.where(valid, varint_sizes(np.maximum(tokens, 0)), 0)
+
+    # Lengths of the packed geometry, the packed tags and the feature
+    geometry[:, 3] = sizes[:, -6:].sum(1)
+    sizes[:, -7] = varint_sizes(geometry[:, 3])
+    tokens[:, 5] = sizes[:, head:head + ntags].sum(1)
+    sizes[:, 5] = varint_sizes(tokens[:, 5])
+    tokens[:, 1] = sizes[:, 2:].sum(1)
+    return encode_varints(tokens[valid])
+
+
+# Geometry per zoom level
+
+def simplify(points, tolerance):
+    """Douglas-Peucker simplification of a polyline"""
+    if len(points) < 3:
+        return points
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        (x1, y1), (x2, y2) = points[first], points[last]
+        dx, dy = x2 - x1, y2 - y1
+        norm = math.hypot(dx, dy) or 1.
+        index, dmax = None, tolerance
+        for i in range(first + 1, last):
+            x, y = points[i]
+            d = abs(dy * (x - x1) - dx * (y - y1)) / norm
+            if d > dmax:
+                index, dmax = i, d
+        if index is not None:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return [p for p, k in zip(points, keep) if k]
+
+
+def zoom_geometry(points, zoom):
+    """
+    Snap projected `points` to the grid of `zoom`, in grid units of
+    the whole world, and simplify them.
+    """
+    scale = EXTENT * (1 << zoom)
+    snapped = []
+    for x, y in points:
+        p = (int(round(x * scale)), int(round(y * scale)))
+        if not snapped or p != snapped[-1]:
+            snapped.append(p)
+    return simplify(snapped, 1.)
+
+
+def line_length(points):
+    return sum(math.hypot(x2 - x1, y2 - y1)
+               for (x1, y1), (x2, y2) in zip(points, points[1:]))
+
+
+def segment_tiles(x0, y0, x1, y1):
+    """
+    Tiles crossed by a segment given in tile units, by walking the
+    tile grid along it (Amanatides & Woo).
+    """
+    tx, ty = int(math.floor(x0)), int(math.floor(y0))
+    ex, ey = int(math.floor(x1)), int(math.floor(y1))
+    tiles = [(tx, ty)]
+    dx, dy = x1 - x0, y1 - y0
+    step_x = 1 if dx > 0 else -1
+    step_y = 1 if dy > 0 else -1
+    inf = float('inf')
+    t_dx = abs(1. / dx) if dx else inf
+    t_dy = abs(1. / dy) if dy else inf
+    t_x = ((tx + (step_x > 0) - x0) / dx) if dx else inf
+    t_y = ((ty + (step_y > 0) - y0) / dy) if dy else inf
+    while (tx, ty) != (ex, ey):
+        if t_x < t_y:
+            if t_x > 1:
+                break
+            tx += step_x
+            t_x += t_dx
+        else:
+            if t_y > 1:
+                break
+            ty += step_y
+            t_y += t_dy
+        tiles.append((tx, ty))
+    return tiles
+
+
+def segments_tiles(segments, limit=2 ** 22):
+    """
+    Tiles crossed by each of an (n, 4) array of segments in tile
+    units, as arrays of segment indices and tile x and y.
+
+    The parameters at which a segment crosses tile boundaries split it
+    into pieces lying in a single tile each, found at their midpoints.
+    Segments are done in batches of about `limit` pieces.
+    """
+    x0, y0, x1, y1 = segments.T
+    fx0, fy0 = np.floor(x0), np.floor(y0)
+    fx1, fy1 = np.floor(x1), np.floor(y1)
+    nx = np.abs(fx1 - fx0).astype(np.int64)
+    ny = np.abs(fy1 - fy0).astype(np.int64)
+    counts = np.cumsum(nx + ny + 1)
+    out = []
+    start = 0
+    while start < len(segments):
+        base = counts[start - 1] if start else 0
+        stop = max(start + 1, int(np.searchsorted(counts, base + limit)))
+        idx = np.arange(start, stop)
+        ts = [np.zeros(len(idx)), np.ones(len(idx))]
+        owners = [idx, idx]
+        for n, f0, f1, a, b in ((nx, fx0, fx1, x0, x1),
+                                (ny, fy0, fy1, y0, y1)):
+            m = n[idx]
+            owner = np.repeat(idx, m)
+            k = np.arange(m.sum()) - np.repeat(np.cumsum(m) - m, m) + 1
+            # Boundaries between the tiles of both ends
+            boundary = np.minimum(f0, f1)[owner] + k
+            with np.errstate(divide='ignore', invalid='ignore'):
+                t = (boundary - a[owner]) / (b - a)[owner]
+            ts.append(t)
+            owners.append(owner)
+        t = np.concatenate(ts)
+        owner = np.concatenate(owners)
+        order = np.lexsort((t, owner))
+        t, owner = t[order], owner[order]
+        piece = (owner[1:] == owner[:-1]) & (t[1:] > t[:-1])
+        mid = (t[1:] + t[:-1])[piece] / 2
+        owner = owner[1:][piece]
+        tx = np.floor(x0[owner] + mid * (x1 - x0)[owner]).astype(np.int64)
+        ty = np.floor(y0[owner] + mid * (y1 - y0)[owner]).astype(np.int64)
+        out.append((owner, tx, ty))
+        start = stop
+    if not out:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    return tuple(np.concatenate(a) for a in zip(*out))
+
+
+def clip_segment(x0, y0, x1, y1, lo, hi):
+    """Liang-Barsky clipping of a segment to the square [lo, hi]"""
+    t0, t1 = 0., 1.
+    dx, dy = x1 - x0, y1 - y0
+    for p, q in ((-dx, x0 - lo), (dx, hi - x0), (-dy, y0 - lo), (dy, hi - y0)):
+        if p == 0:
+            if q < 0:
+                return None
+        else:
+            t = q / p
+            if p < 0:
+                if t > t1:
+                    return None
+                t0 = max(t0, t)
+            else:
+                if t < t0:
+                    return None
+                t1 = min(t1, t)
+    return ((x0 + t0 * dx, y0 + t0 * dy), (x0 + t1 * dx, y0 + t1 * dy))
+
+
+def clip_segments(segments, lo, hi):
+    """
+    Liang-Barsky clipping of an (n, 4) array of segments to the square
+    [lo, hi], returning the clipped segments and which were kept.
+    """
+    x0, y0, x1, y1 = segments.T
+    dx, dy = x1 - x0, y1 - y0
+    t0 = np.zeros(len(segments))
+    t1 = np.ones(len(segments))
+    keep = np.ones(len(segments), dtype=bool)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for p, q in ((-dx, x0 - lo), (dx, hi - x0),
+                     (-dy, y0 - lo), (dy, hi - y0)):
+            keep &= (p != 0) | (q >= 0)
+            t = q / p
+            t0 = np.where(p < 0, np.maximum(t0, t), t0)
+            t1 = np.where(p > 0, np.minimum(t1, t), t1)
+    keep &= t0 <= t1
+    clipped = np.column_stack([x0 + t0 * dx, y0 + t0 * dy,
+                               x0 + t1 * dx, y0 + t1 * dy])
+    return clipped[keep], keep
+
+
+def clip_line(points, tx, ty):
+    """
+    Parts of a line, in world grid units, falling in tile (tx, ty)
+    and its buffer, converted to tile coordinates.
+    """
+    ox, oy = tx * EXTENT, ty * EXTENT
+    lo, hi = -BUFFER, EXTENT + BUFFER
+    parts = []
+    current = []
+    for (x0, y0), (x1, y1) in zip(points, points[1:]):
+        clipped = clip_segment(x0 - ox, y0 - oy, x1 - ox, y1 - oy, lo, hi)
+        if clipped is None:
+            if len(current) > 1:
+                parts.append(current)
+            current = []
+            continue
+        a, b = [(int(round(x)), int(round(y))) for x, y in clipped]
+        if current and current[-1] == a:
+            current.append(b)
+        else:
+            if len(current) > 1:
+                parts.append(current)
+            current = [a, b]
+    if len(current) > 1:
+        parts.append(current)
+    return [[p for i, p in enumerate(part) if i == 0 or p != part[i - 1]]
+            for part in parts if part[0] != part[-1] or len(part) > 2]
+
+
+# Tiling
+
+class TileLayer(object):
+    """
+    The features of one layer, added one at a time, with their
+    properties turned into key and value indices.
+
+    Straight lines, which is what trees and links are made of, are
+    kept in flat arrays, their ends in longitude/latitude and the key
+    and value indices of their properties, some 50 bytes a feature,
+    and are handled all at once; other lines one by one.
+
+    :ivar keys: Property names.
+    :ivar values: Distinct property values, encoded as layer fields.
+    :ivar fields: 'String' or 'Number', by property name.
+    :ivar polylines: Dictionary of the other features' projected points.
+    """
+
+    def __init__(self):
+        self.keys = []
+        self.values = []
+        self.fields = {}
+        self.polylines = {}
+        self._columns = {}
+        self._values = {}
+        self._tags = array('q')
+        self._lines = array('q')
+        self._ends = array('d')
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def add(self, points, properties):
+        """Add a line feature, its points in longitude/latitude"""
+        for k in properties:
+            if k not in self._columns:
+                self._add_key(k)
+        row = [-1] * (2 * len(self.keys))
+        for k, v in properties.items():
+            if v is None:
+                continue
+            j = self._columns[k]
+            value = self._values.get((type(v), v))
+            if value is None:
+                value = self._values[type(v), v] = len(self.values)
+                self.values.append(value_field(v))
+                self.fields.setdefault(
+                    k, 'String' if isinstance(v, str) else 'Number')
+            row[2 * j] = j
+            row[2 * j + 1] = value
+        self._tags.extend(row)
+        if len(points) == 2:
+            self._lines.append(self._count)
+            self._ends.extend(points[0])
+            self._ends.extend(points[1])
+        else:
+            self.polylines[self._count] = [project(x, y) for x, y in points]
+        self._count += 1
+
+    def _add_key(self, name):
+        """Add a property, widening the tags of the features so far"""
+        tags = self.tags
+        self._columns[name] = len(self.keys)
+        self.keys.append(name)
+        wider = np.full((len(tags), 2 * len(self.keys)), -1, dtype=np.int64)
+        wider[:, :tags.shape[1]] = tags
+        del tags
+        self._tags = array('q', wider.tobytes())
+
+    @property
+    def tags(self):
+        """(n, 2 * len(keys)) array of the key and value indices of each\
+        feature, -1 for missing values"""
+        return np.frombuffer(self._tags, dtype=np.int64).reshape(
+            self._count, 2 * len(self.keys))
+
+    @property
+    def lines(self):
+        """Indices of the straight line features"""
+        return np.frombuffer(self._lines, dtype=np.int64)
+
+    @property
+    def segments(self):
+        """(len(lines), 4) array of their projected ends"""
+        lon, lat = np.frombuffer(self._ends, dtype=np.float64).reshape(
+            -1, 2).T
+        lat = np.radians(np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE))
+        s = np.sin(lat)
+        x = (lon + 180.) / 360.
+        y = .5 - np.log((1 + s) / (1 - s)) / (4 * math.pi)
+        return np.column_stack([x, y]).reshape(-1, 4)
+
+
+def clip_columns(segments, lo, hi):
+    """The parts of an (n, 4) array of segments from x = lo to x = hi"""
+    x0, y0, x1, y1 = segments.T
+    dx, dy = x1 - x0, y1 - y0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ta, tb = (lo - x0) / dx, (hi - x0) / dx
+    vertical = dx == 0
+    t0 = np.where(vertical, 0., np.clip(np.minimum(ta, tb), 0., 1.))
+    t1 = np.where(vertical, 1., np.clip(np.maximum(ta, tb), 0., 1.))
+    return np.column_stack([x0 + t0 * dx, y0 + t0 * dy,
+                            x0 + t1 * dx, y0 + t1 * dy])
+
+
+class TileSet(object):
+    """
+    Projected features of several layers, from which tiles are cut.
+
+    Features are added as they are made, so that only the arrays of
+    their layers are held and not the features themselves. Each zoom
+    level is indexed a strip of tile columns at a time, the strips
+    holding at most about `limit` pieces of lines, a piece for each
+    tile a line crosses, however many tiles the level has.
+
+    :param min_length: Lines shorter than this many grid units at a\
+        zoom level are left out of its tiles.
+    :param max_features: Features per layer and tile, beyond which\
+        only the longest are kept.
+    """
+
+    def __init__(self, min_length=16, max_features=20000, limit=2 ** 21):
+        self.layers = {}
+        self.min_length = min_length
+        self.max_features = max_features
+        self.limit = limit
+        self._zoom = None
+        self._geometry = None
+
+    def add(self, layer, points, properties):
+        """Add a line feature to a layer, its points in longitude/latitude"""
+        if layer not in self.layers:
+            self.layers[layer] = TileLayer()
+        self.layers[layer].add(points, properties)
+        self._zoom = None
+
+    def geometry(self, zoom):
+        """
+        Geometries of every layer at `zoom`, in grid units of the
+        whole world: {layer: (segments, polylines, lengths)}, with the
+        snapped segments of the straight lines, the simplified
+        polylines and the length of every feature, 0 when left out.
+        """
+        if self._zoom != zoom:
+            self._geometry = {}
+            scale = EXTENT * (1 << zoom)
+            for name, layer in self.layers.items():
+                lengths = np.zeros(len(layer))
+                segments = np.rint(layer.segments * scale).astype(np.int64)
+                lengths[layer.lines] = np.hypot(
+                    segments[:, 2] - segments[:, 0],
+                    segments[:, 3] - segments[:, 1])
+                polylines = {}
+                for i, points in layer.polylines.items():
+                    g = zoom_geometry(points, zoom)
+                    lengths[i] = line_length(g)
+                    polylines[i] = g
+                lengths[lengths < self.min_length] = 0
+                self._geometry[name] = (segments, polylines, lengths)
+            self._zoom = zoom
+        return self._geometry
+
+    def strips(self, zoom):
+        """
+        The features crossing each tile at `zoom`, a strip of tile
+        columns at a time: for each strip a dictionary of layer name
+        to arrays of tile numbers (x * 2**zoom + y) and of feature
+        indices, sorted by tile.
+        """
+        size = 1 << zoom
+        # Pieces of lines in each column, spread evenly over the
+        # columns of each line, to cut the strips by
+        load = np.zeros(size + 1)
+        shown = {}
+        for name, (segments, polylines, lengths) in \
+                self.geometry(zoom).items():
+            lines = self.layers[name].lines
+            keep = lengths[lines] > 0
+            ends = segments[keep] / EXTENT
+            first = np.clip(np.floor(np.minimum(ends[:, 0], ends[:, 2])),
+                            0, size - 1).astype(np.int64)
+            last = np.clip(np.floor(np.maximum(ends[:, 0], ends[:, 2])),
+                           0, size - 1).astype(np.int64)
+            pieces = last - first + 1 + np.abs(
+                np.floor(ends[:, 3]) - np.floor(ends[:, 1]))
+            share = pieces / (last - first + 1)
+            np.add.at(load, first, share)
+            np.add.at(load, last + 1, -share)
+
+            # The few other lines are indexed whole
+            owners, xs, ys = [], [], []
+            for i, g in polylines.items():
+                if not lengths[i]:
+                    continue
+                seen = set()
+                for (x0, y0), (x1, y1) in zip(g, g[1:]):
+                    seen.update(segment_tiles(x0 / EXTENT, y0 / EXTENT,
+                                              x1 / EXTENT, y1 / EXTENT))
+                owners.append(np.full(len(seen), i, dtype=np.int64))
+                xs.append(np.array([x for x, _ in seen], dtype=np.int64))
+                ys.append(np.array([y for _, y in seen], dtype=np.int64))
+            others = [np.concatenate(a) if a else np.zeros(0, np.int64)
+                      for a in (owners, xs, ys)]
+            columns = np.clip(others[1], 0, size - 1)
+            np.add.at(load, columns, 1)
+            np.add.at(load, columns + 1, -1)
+            shown[name] = (lines[keep], ends, first, last, others)
+
+        total = np.cumsum(np.cumsum(load[:-1]))
+        cuts = np.searchsorted(total, np.arange(
+            self.limit, total[-1] if size else 0, self.limit), 'right')
+        bounds = np.unique(np.concatenate([[0], cuts, [size]]))
+        for lo, hi in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+            index = {}
+            for name, (lines, ends, first, last, others) in shown.items():
+                crossing = np.flatnonzero((last >= lo) & (first < hi))
+                parts = clip_columns(ends[crossing], lo, hi)
+                # Lines ending on the edge of the strip only touch it
+                touching = (parts[:, 0] == parts[:, 2]) & \
+                    (parts[:, 1] == parts[:, 3])
+                crossing, parts = crossing[~touching], parts[~touching]
+                rows, xs, ys = segments_tiles(parts)
+                owner = np.concatenate([lines[crossing][rows], others[0]])
+                xs = np.concatenate([xs, others[1]])
+                ys = np.concatenate([ys, others[2]])
+                # Each feature crosses a tile once, tiles beyond the
+                # strip or the edges of the world are dropped
+                inside = (xs >= lo) & (xs < hi) & (ys >= 0) & (ys < size)
+                tile = xs[inside] * size + ys[inside]
+                owner = owner[inside]
+                order = np.argsort(tile, kind='stable')
+                index[name] = (tile[order], owner[order])
+            yield index
+
+    def jobs(self, zoom, chunk=256):
+        """
+        Yield the tiles of `zoom` in lists of `chunk`, each as a tuple
+        (x, y, {layer: feature indices}) ready for `encode`.
+        """
+        size = 1 << zoom
+        for index in self.strips(zoom):
+            keys = np.zeros(0, dtype=np.int64)
+            for tile, _ in index.values():
+                first = np.ones(len(tile), dtype=bool)
+                first[1:] = tile[1:] != tile[:-1]
+                keys = np.union1d(keys, tile[first])
+            for c in range(0, len(keys), chunk):
+                block = keys[c:c + chunk]
+                slices = {name: (np.searchsorted(tile, block, 'left'),
+                                 np.searchsorted(tile, block, 'right'),
+                                 owner)
+                          for name, (tile, owner) in index.items()}
+                job = []
+                for k, key in enumerate(block.tolist()):
+                    features = {name: owner[lo[k]:hi[k]]
+                                for name, (lo, hi, owner) in slices.items()
+                                if hi[k] > lo[k]}
+                    job.append(divmod(key, size) + (features,))
+                yield job
+
+    def encode(self, zoom, x, y, features):
+        """Gzipped MVT for tile (zoom, x, y) given its feature indices"""
+        geometry = self.geometry(zoom)
+        data = b''
+        for name, indices in features.items():
+            layer = self.layers[name]
+            segments, polylines, lengths = geometry[name]
+            if len(indices) > self.max_features:
+                longest = np.argpartition(-lengths[indices],
+                                          self.max_features)
+                indices = np.sort(indices[longest[:self.max_features]])
+
+            # Straight lines, clipped and encoded as arrays
+            rows = np.searchsorted(layer.lines, indices)
+            rows = np.minimum(rows, max(len(layer.lines) - 1, 0))
+            straight = (layer.lines[rows] == indices) if len(rows) and \
+                len(layer.lines) else np.zeros(len(indices), dtype=bool)
+            origin = np.array([x, y, x, y]) * EXTENT
+            clipped, kept = clip_segments(
+                (segments[rows[straight]] - origin).astype(np.float64),
+                -BUFFER, EXTENT + BUFFER)
+            clipped = np.rint(clipped).astype(np.int64)
+            fids = indices[straight][kept]
+            moving = ((clipped[:, 0] != clipped[:, 2]) |
+                      (clipped[:, 1] != clipped[:, 3]))
+            clipped, fids = clipped[moving], fids[moving]
+            # Features identical at this zoom are drawn once
+            _, first = np.unique(clipped, axis=0, return_index=True)
+            first.sort()
+            clipped, fids = clipped[first], fids[first]
+
+            # Other lines one by one
+            others = []
+            seen = set()
+            for i in indices[~straight].tolist():
+                parts = clip_line(polylines[i], x, y)
+                signature = tuple(tuple(p) for p in parts)
+                if parts and signature not in seen:
+                    seen.add(signature)
+                    others.append((i, parts))
+
+            if not len(fids) and not others:
+                continue
+            # Only the values used in the tile are written. Missing
+            # values stay -1 through the extra last slot of `remap`
+            tags = layer.tags[np.concatenate(
+                [fids, np.array([i for i, _ in others], dtype=np.int64)])]
+            used = np.unique(tags[:, 1::2])
+            used = used[used >= 0]
+            remap = np.full(len(layer.values) + 1, -1, dtype=np.int64)
+            remap[used] = np.arange(len(used))
+            tags[:, 1::2] = remap[tags[:, 1::2]]
+
+            encoded = encode_lines(fids, tags[:len(fids)], clipped)
+            for (i, parts), t in zip(others, tags[len(fids):].tolist()):
+                encoded += encode_feature(i, [v for v in t if v >= 0],
+                                          encode_geometry(parts))
+            values = b''.join(map(layer.values.__getitem__, used.tolist()))
+            data += length_delimited(
+                3, encode_layer(name, encoded, layer.keys, values))
+        return gzip.compress(data, 6) if data else None
+
+
+# Tiles are encoded in worker processes which each get a copy of the
+# tile set once, then only tile coordinates and feature indices
+
+_tileset = None
+
+
+def _init_worker(tileset):
+    global _tileset
+    _tileset = tileset
+
+
+def _encode(job):
+    zoom, jobs = job
+    return [(zoom, x, y, _tileset.encode(zoom, x, y, features))
+            for x, y, features in jobs]
+
+
+def _imap(pool, jobs, window):
+    """
+    Encode `jobs` in `pool` keeping at most `window` of them queued,
+    so the jobs and their tiles are never all held at once
+    """
+    pending = deque()
+    for job in jobs:
+        pending.append(pool.submit(_encode, job))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+class MBTilesWriter(object):
+    """Writes tiles into an MBTiles file in batched transactions"""
+
+    def __init__(self, path, metadata):
+        if os.path.exists(path):
+            os.remove(path)
+        self.db = sqlite3.connect(path)
+        self.db.executescript(
+            'PRAGMA synchronous = OFF;'
+            'PRAGMA journal_mode = MEMORY;'
+            'CREATE TABLE metadata (name TEXT, value TEXT);'
+            'CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER,'
+            ' tile_row INTEGER, tile_data BLOB);')
+        with self.db:
+            self.db.executemany('INSERT INTO metadata VALUES (?, ?)',
+                                metadata.items())
+        self.pending = []
+
+    def write(self, zoom, x, y, data):
+        # MBTiles rows count from the bottom (TMS)
+        self.pending.append((zoom, x, (1 << zoom) - 1 - y, data))
+        if len(self.pending) >= BATCH:
+            self.flush()
+
+    def flush(self):
+        with self.db:
+            self.db.executemany('INSERT INTO tiles VALUES (?, ?, ?, ?)',
+                                self.pending)
+        self.pending = []
+
+    def close(self):
+        self.flush()
+        with self.db:
+            self.db.execute('CREATE UNIQUE INDEX tile_index ON tiles '
+                            '(zoom_level, tile_column, tile_row)')
+        self.db.close()
+
+
+class DirectoryWriter(object):
+    """Writes tiles as z/x/y.pbf files, gzipped"""
+
+    def __init__(self, path, metadata):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, 'metadata.json'), 'w') as f:
+            json.dump(metadata, f)
+
+    def write(self, zoom, x, y, data):
+        folder = os.path.join(self.path, str(zoom), str(x))
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, '{}.pbf'.format(y)), 'wb') as f:
+            f.write(data)
+
+    def close(self):
+        pass
+
+
+def export_tiles(layers, path, min_zoom=0, max_zoom=12, processes=None,
+                 name='phylo_tree', min_length=16, max_features=20000,
+                 chunk=256):
+    """
+    Write `layers` as a vector tile pyramid to `path`, an MBTiles file
+    if it ends with .mbtiles and a directory otherwise.
+
+    :param layers: A `TileSet`, or a dictionary of layer name to an\
+        iterable of (points, properties) line features in\
+        longitude/latitude, added to a new one with `min_length` and\
+        `max_features`.
+    :param processes: Number of worker processes, 1 to encode in\
+        this process.
+    :param chunk: Number of tiles per job sent to a worker.
+    :return: Number of tiles written.
+    """
+    if isinstance(layers, TileSet):
+        tileset = layers
+    else:
+        tileset = TileSet(min_length, max_features)
+        for layer, features in layers.items():
+            for points, properties in features:
+                tileset.add(layer, points, properties)
+    metadata = {
+        'name': name,
+        'format': 'pbf',
+        'minzoom': str(min_zoom),
+        'maxzoom': str(max_zoom),
+        'json': json.dumps({'vector_layers': [
+            {'id': layer, 'fields': {k: tiles.fields.get(k, 'String')
+                                     for k in tiles.keys},
+             'minzoom': min_zoom, 'maxzoom': max_zoom}
+            for layer, tiles in tileset.layers.items()]}),
+    }
+    if path.endswith('.mbtiles'):
+        writer = MBTilesWriter(path, metadata)
+    else:
+        writer = DirectoryWriter(path, metadata)
+
+    pool = None
+    if processes != 1:
+        processes = processes or os.cpu_count() or 1
+        pool = ProcessPoolExecutor(processes, initializer=_init_worker,
+                                   initargs=(tileset,))
+    else:
+        _init_worker(tileset)
+
+    count = 0
+    try:
+        for zoom in range(min_zoom, max_zoom + 1):
+            jobs = ((zoom, job) for job in tileset.jobs(zoom, chunk))
+            if pool is None:
+                results = map(_encode, jobs)
+            else:
+                results = _imap(pool, jobs, 2 * processes)
+            for batch in results:
+                for z, x, y, data in batch:
+                    if data is not None:
+                        writer.write(z, x, y, data)
+                        count += 1
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        writer.close()
+    return count
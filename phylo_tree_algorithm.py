@@ -38,16 +38,92 @@ from qgis.core import (QgsProcessing,
                        QgsProcessingParameterFeatureSource,
                        QgsProcessingParameterFeatureSink,
                        QgsProcessingParameterFile,
-                       QgsFields,
-                       QgsField,
+                       QgsProcessingParameterEnum,
+                       QgsProcessingParameterField,
+                       QgsProcessingParameterNumber,
+                       QgsProcessingParameterBoolean,
+                       QgsProcessingParameterVectorLayer,
+                       QgsProcessingOutputNumber,
+                       QgsProcessingLayerPostProcessorInterface,
+                       QgsRuleBasedRenderer,
+                       QgsSymbol,
+                       QgsUnitTypes,
                        QgsFeature,
+                       QgsFeatureRequest,
                        QgsPoint,
                        QgsPointXY,
                        QgsLineString,
                        QgsGeometry,
-                       QgsWkbTypes)
+                       QgsWkbTypes,
+                       edit)
+import json
 from os.path import splitext
+import numpy as np
 from phylo_tree.trees import drawtree
+from phylo_tree.pipeline import Progress, Cancelled, TreePipeline
+from phylo_tree.trees.flat import FlatTree, flat_tree, mix
+from phylo_tree.trees import phylogram
+from phylo_tree.trees.consensus import METHODS
+from phylo_tree.trees.phylogeography import reconstruct_locations
+from phylo_tree.trees.lod import level_of_detail
+from phylo_tree.trees.ordering import order_children
+from phylo_tree.geometry import merge_hulls
+from phylo_tree.algorithm_utils import make_fields, match_leaves
+from phylo_tree.crossings import count_crossings
+from phylo_tree.bundling import bundle as bundle_links
+from phylo_tree.linking import (LinkAggregator, NameIndex, AGGREGATIONS,
+                                NORMALIZERS, make_normalizer)
+
+class ScaleRangeRenderer(QgsProcessingLayerPostProcessorInterface):
+    """
+    Gives a loaded output layer a rule based renderer drawing each
+    feature only between its min_scale and max_scale attributes.
+    """
+    FILTER = ('("min_scale" = 0 OR @map_scale < "min_scale") '
+              'AND @map_scale >= "max_scale"')
+    instance = None
+
+    def postProcessLayer(self, layer, context, feedback):
+        symbol = QgsSymbol.defaultSymbol(layer.geometryType())
+        root = QgsRuleBasedRenderer.Rule(None)
+        root.appendChild(QgsRuleBasedRenderer.Rule(symbol,
+                                                   filterExp=self.FILTER))
+        layer.setRenderer(QgsRuleBasedRenderer(root))
+        layer.triggerRepaint()
+
+    @classmethod
+    def create(cls):
+        # Processing does not keep a reference to post processors
+        if cls.instance is None:
+            cls.instance = ScaleRangeRenderer()
+        return cls.instance
+
+class TreeLayerProperties(QgsProcessingLayerPostProcessorInterface):
+    """
+    Sets custom properties of a loaded output layer, and draws it
+    according to its features' scales if they have them.
+    """
+    # Processing does not keep a reference to post processors either
+    pending = []
+
+    def __init__(self, properties, scaled):
+        super().__init__()
+        self.properties = properties
+        self.scaled = scaled
+
+    def postProcessLayer(self, layer, context, feedback):
+        for key, value in self.properties.items():
+            layer.setCustomProperty(key, value)
+        if self.scaled:
+            ScaleRangeRenderer.create().postProcessLayer(layer, context,
+                                                         feedback)
+        self.pending.remove(self)
+
+    @classmethod
+    def create(cls, properties, scaled=False):
+        instance = cls(properties, scaled)
+        cls.pending.append(instance)
+        return instance
 
 class PhyloTreeAlgorithm(QgsProcessingAlgorithm):
     """
@@ -68,14 +144,79 @@ class PhyloTreeAlgorithm(QgsProcessingAlgorithm):
     # calling from the QGIS console.
 
     OUTPUT = 'OUTPUT'
+    OUTPUT_LINKS = 'OUTPUT_LINKS'
+    OUTPUT_HULLS = 'OUTPUT_HULLS'
+    OUTPUT_WEDGES = 'OUTPUT_WEDGES'
+    OUTPUT_UNMATCHED_LEAVES = 'OUTPUT_UNMATCHED_LEAVES'
+    OUTPUT_UNMATCHED_FEATURES = 'OUTPUT_UNMATCHED_FEATURES'
     INPUTLAYER = 'INPUTLAYER'
     INPUTTREE = 'INPUTTREE'
+    SUMMARY = 'SUMMARY'
+    SUMMARIES = ['First tree', 'Majority-rule consensus',
+                 'Maximum clade credibility']
+    NAMEFIELD = 'NAMEFIELD'
+    IDFIELD = 'IDFIELD'
+    NORMALIZE = 'NORMALIZE'
+    FUZZY = 'FUZZY'
+    LAYOUT = 'LAYOUT'
+    LAYOUTS = ['Beside the map', 'Phylogeography', 'Phylogram beside the map']
+    ELBOWS = 'ELBOWS'
+    ORDER = 'ORDER'
+    SWEEPS = 'SWEEPS'
+    CROSSINGS_BEFORE = 'CROSSINGS_BEFORE'
+    CROSSINGS_AFTER = 'CROSSINGS_AFTER'
+    COUNT_CROSSINGS = 'COUNT_CROSSINGS'
+    EDGE_CROSSINGS = 'EDGE_CROSSINGS'
+    LINK_CROSSINGS = 'LINK_CROSSINGS'
+    ROTATION = 'ROTATION'
+    BUNDLE = 'BUNDLE'
+    AGGREGATION = 'AGGREGATION'
+    COLLAPSE = 'COLLAPSE'
+    UPDATE_LAYER = 'UPDATE_LAYER'
+    # Layer property logging the edits of the "Edit tree" algorithm
+    EDITS_PROPERTY = 'phylo_tree/edits'
+    # Layer property with the (scale_x, offset_x, scale_y, offset_y)
+    # taking the layout to the map, for trees drawn beside the map
+    PLACEMENT_PROPERTY = 'phylo_tree/placement'
+    # Layer property naming the summary of the file a tree and its
+    # links were drawn from, from `consensus.METHODS`, if not its first
+    # tree
+    SUMMARY_PROPERTY = 'phylo_tree/summary'
+    # Layer property with the size in pixels below which clades were
+    # collapsed, for trees whose edges have scale ranges
+    COLLAPSE_PROPERTY = 'phylo_tree/collapse'
     OUT_FIELDS = {
-        'id':     QVariant.Int,
+        'id':       QVariant.LongLong,
+        'label':    QVariant.String,
+        'depth':    QVariant.Int,
+        'distance': QVariant.Double,
+        'height':   QVariant.Double,
+        'tips':     QVariant.Int,
+        'support':  QVariant.Double,
+    }
+    # Per node measures from `FlatTree.measures`, in the edge features
+    MEASURES = ['depth', 'distance', 'height', 'tips']
+    LINK_FIELDS = {
+        'label':    QVariant.String,
+        'features': QVariant.Int,
+    }
+    UNMATCHED_FIELDS = {
         'label':  QVariant.String,
     }
+    HULL_FIELDS = {
+        'id':     QVariant.LongLong,
+        'label':  QVariant.String,
+        'leaves': QVariant.Int,
+    }
+    SCALE_FIELDS = {
+        'min_scale': QVariant.Double,
+        'max_scale': QVariant.Double,
+    }
+    WEDGE_FIELDS = dict(HULL_FIELDS, **SCALE_FIELDS)
     SCALE_X = 6.0
     SCALE_Y = 8.0
+    # Tree layer to update, and its features, once the run is over
+    pending_update = None
 
     def initAlgorithm(self, config):
         """
@@ -98,6 +239,131 @@ class PhyloTreeAlgorithm(QgsProcessingAlgorithm):
                 self.tr('Tree file')
             )
         )
+        # A file of many trees, such as a posterior sample, can be
+        # summarized by one tree, whose edges carry the support of
+        # their clade
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.SUMMARY,
+                self.tr('Trees of the file'),
+                options=[self.tr(o) for o in self.SUMMARIES],
+                defaultValue=0
+            )
+        )
+        # Fields of the input layer matched against the leaf labels
+        self.addParameter(
+            QgsProcessingParameterField(
+                self.NAMEFIELD,
+                self.tr('Name field'),
+                defaultValue='Language',
+                parentLayerParameterName=self.INPUTLAYER
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterField(
+                self.IDFIELD,
+                self.tr('Code field (e.g. ISO 639-3 or Glottocode)'),
+                parentLayerParameterName=self.INPUTLAYER,
+                optional=True
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.NORMALIZE,
+                self.tr('Ignore differences in'),
+                options=[self.tr(n) for n in NORMALIZERS],
+                allowMultiple=True,
+                defaultValue=list(range(len(NORMALIZERS))),
+                optional=True
+            )
+        )
+        # Similarity required for approximate matches, 0 disables them
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.FUZZY,
+                self.tr('Approximate match threshold'),
+                QgsProcessingParameterNumber.Double,
+                defaultValue=0.8,
+                minValue=0.0,
+                maxValue=1.0
+            )
+        )
+        # Either draw the tree next to the features, or estimate the
+        # location of the internal nodes and draw it over the map
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.LAYOUT,
+                self.tr('Layout'),
+                options=[self.tr(o) for o in self.LAYOUTS],
+                defaultValue=0
+            )
+        )
+        # Flip the children of the nodes so that the leaves follow the
+        # order of their features along the map, untangling the links
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.ORDER,
+                self.tr('Reorder leaves to reduce crossing links'),
+                defaultValue=False
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.SWEEPS,
+                self.tr('Reordering passes at nodes with over two '
+                        'children'),
+                QgsProcessingParameterNumber.Integer,
+                defaultValue=2,
+                minValue=0
+            )
+        )
+        for name, description in [
+                (self.CROSSINGS_BEFORE, 'Link crossings before reordering'),
+                (self.CROSSINGS_AFTER, 'Link crossings after reordering')]:
+            self.addOutput(
+                QgsProcessingOutputNumber(name, self.tr(description)))
+        # How tangled the drawing is, as an objective for tuning it
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.COUNT_CROSSINGS,
+                self.tr('Count crossings of the links'),
+                defaultValue=False
+            )
+        )
+        for name, description in [
+                (self.EDGE_CROSSINGS, 'Crossings of links and tree edges'),
+                (self.LINK_CROSSINGS, 'Crossings between links')]:
+            self.addOutput(
+                QgsProcessingOutputNumber(name, self.tr(description)))
+        # Pull links running the same way together into bundles
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.BUNDLE,
+                self.tr('Link bundling iterations (0 for straight links)'),
+                QgsProcessingParameterNumber.Integer,
+                defaultValue=0,
+                minValue=0
+            )
+        )
+        # Phylogram edges as one elbow line each rather than a
+        # horizontal and a vertical line
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.ELBOWS,
+                self.tr('Draw phylogram edges as elbows'),
+                defaultValue=False
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.ROTATION,
+                self.tr('Phylogram rotation (degrees)'),
+                QgsProcessingParameterNumber.Double,
+                defaultValue=0.0,
+                minValue=-360.0,
+                maxValue=360.0
+            )
+        )
         # We add a feature sink in which to store our processed features (this
         # usually takes the form of a newly created vector layer when the
         # algorithm is run in QGIS).
@@ -107,39 +373,336 @@ class PhyloTreeAlgorithm(QgsProcessingAlgorithm):
                 self.tr('Output layer')
             )
         )
+        # Rewrite only what changed in a layer drawn by an earlier run,
+        # instead of creating the output layer
+        self.addParameter(
+            QgsProcessingParameterVectorLayer(
+                self.UPDATE_LAYER,
+                self.tr('Update existing tree layer'),
+                [QgsProcessing.TypeVectorLine],
+                optional=True
+            )
+        )
+        # How to link a leaf matching several features
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.AGGREGATION,
+                self.tr('Leaves matching several features'),
+                options=[self.tr('Link to the first feature'),
+                         self.tr('Link to the centroid of all features'),
+                         self.tr('Link to the feature nearest to the tree'),
+                         self.tr('Link to all features')],
+                defaultValue=0
+            )
+        )
+        # Lines linking each leaf to its features, which were written to
+        # the output layer before they had a layer of their own, so they
+        # are still created by runs that don't name a destination
+        self.addParameter(
+            QgsProcessingParameterFeatureSink(
+                self.OUTPUT_LINKS,
+                self.tr('Links'),
+                QgsProcessing.TypeVectorLine,
+                defaultValue=QgsProcessing.TEMPORARY_OUTPUT,
+                createByDefault=True
+            )
+        )
+        # Reports of what could not be matched
+        self.addParameter(
+            QgsProcessingParameterFeatureSink(
+                self.OUTPUT_UNMATCHED_LEAVES,
+                self.tr('Unmatched leaves'),
+                QgsProcessing.TypeVector,
+                optional=True
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterFeatureSink(
+                self.OUTPUT_UNMATCHED_FEATURES,
+                self.tr('Unmatched features'),
+                QgsProcessing.TypeVectorAnyGeometry,
+                optional=True
+            )
+        )
+        # One convex hull per clade, covering the features linked to
+        # the clade's leaves
+        self.addParameter(
+            QgsProcessingParameterFeatureSink(
+                self.OUTPUT_HULLS,
+                self.tr('Clade hulls'),
+                QgsProcessing.TypeVectorPolygon,
+                optional=True
+            )
+        )
+        # Clades drawn smaller than this on screen are collapsed into
+        # a wedge, the edges and wedges carrying the scales at which
+        # they are drawn
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.COLLAPSE,
+                self.tr('Collapse clades smaller than (pixels, 0 to '
+                        'draw every edge)'),
+                QgsProcessingParameterNumber.Double,
+                defaultValue=0.0,
+                minValue=0.0
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterFeatureSink(
+                self.OUTPUT_WEDGES,
+                self.tr('Collapsed clades'),
+                QgsProcessing.TypeVectorPolygon,
+                optional=True
+            )
+        )
     
     def processAlgorithm(self, parameters, context, feedback):
         
         layer = self.parameterAsSource(parameters, self.INPUTLAYER, context)
         fname = self.parameterAsFile(parameters, self.INPUTTREE, context)
+        layout = self.parameterAsEnum(parameters, self.LAYOUT, context)
+        summary = ([None] + METHODS)[
+            self.parameterAsEnum(parameters, self.SUMMARY, context)]
+        mode = AGGREGATIONS[
+            self.parameterAsEnum(parameters, self.AGGREGATION, context)]
+        namefield = self.parameterAsString(parameters, self.NAMEFIELD, context)
+        idfield = self.parameterAsString(parameters, self.IDFIELD, context)
+        normalizers = [list(NORMALIZERS)[i] for i in
+                       self.parameterAsEnums(parameters, self.NORMALIZE, context)]
+        threshold = self.parameterAsDouble(parameters, self.FUZZY, context)
+        collapse = self.parameterAsDouble(parameters, self.COLLAPSE, context)
+        elbows = self.parameterAsBool(parameters, self.ELBOWS, context)
+        order = self.parameterAsBool(parameters, self.ORDER, context)
+        sweeps = self.parameterAsInt(parameters, self.SWEEPS, context)
+        count = self.parameterAsBool(parameters, self.COUNT_CROSSINGS,
+                                     context)
+        rotation = self.parameterAsDouble(parameters, self.ROTATION, context)
+        bundle = self.parameterAsInt(parameters, self.BUNDLE, context)
 
-        # Set up fields for the output layer
-        out_fields = QgsFields()
-        for name, typ in self.OUT_FIELDS.items():
-            out_fields.append(QgsField(name, typ))
+        # Set up fields for the output layers
+        if collapse > 0:
+            out_fields = make_fields(
+                dict(self.OUT_FIELDS, **self.SCALE_FIELDS))
+        else:
+            out_fields = make_fields(self.OUT_FIELDS)
+        link_fields = make_fields(self.LINK_FIELDS)
+        hull_fields = make_fields(self.HULL_FIELDS)
         
-        (sink, dest_id) = self.parameterAsSink(
-            parameters, self.OUTPUT, context, out_fields,
+        update_layer = self.parameterAsVectorLayer(
+            parameters, self.UPDATE_LAYER, context)
+        if update_layer is None:
+            (sink, dest_id) = self.parameterAsSink(
+                parameters, self.OUTPUT, context, out_fields,
+                QgsWkbTypes.LineString, layer.sourceCrs()
+            )
+        else:
+            sink, dest_id = None, update_layer.id()
+        (link_sink, link_id) = self.parameterAsSink(
+            parameters, self.OUTPUT_LINKS, context, link_fields,
             QgsWkbTypes.LineString, layer.sourceCrs()
         )
+        (hull_sink, hull_id) = self.parameterAsSink(
+            parameters, self.OUTPUT_HULLS, context, hull_fields,
+            QgsWkbTypes.Polygon, layer.sourceCrs()
+        )
 
         feedback.pushConsoleInfo(str(layer.wkbType()))
 
-        tree = drawtree.buildtree(fname)
-        center = (115, -33)
-        tree.scale(self.SCALE_X, self.SCALE_Y)
-        tree.translate(center)
+        # Parsed and laid out trees are cached between runs, and the
+        # stages stop at their next progress report once cancelled
+        progress = Progress(lambda f: feedback.setProgress(100 * f),
+                            feedback.isCanceled)
+        pipeline = TreePipeline(fname, summary=summary)
+        try:
+            pipeline.parse(progress.stage(0., .3))
+            tree = pipeline.layout(progress.stage(.3, .5))
+
+            # Match leaves to input layer features in a single pass
+            index = NameIndex(tree.leaves(),
+                              normalize=make_normalizer(normalizers))
+            aggregator = LinkAggregator(mode)
+            leaf_hulls = {} if hull_sink is not None else None
+            keys = [namefield] + ([idfield] if idfield else [])
+            unmatched = match_leaves(layer, keys, index, aggregator,
+                                     leaf_hulls, threshold)
+            feedback.pushInfo('Matched {} of {} leaves, {} features unmatched'
+                              .format(len(aggregator), len(index.leaves),
+                                      len(unmatched)))
+            progress(.6)
+
+            lines = None
+            crossings = None
+            placement = None
+            if layout == 1:
+                self.place_on_map(tree, aggregator)
+            elif layout == 2:
+                lines = self.place_phylogram(tree, elbows, rotation)
+            else:
+                center = (115, -33)
+                if order:
+                    crossings = self.order_leaves(tree, aggregator, sweeps)
+                    tree.scale(self.SCALE_X, self.SCALE_Y)
+                    tree.translate(center)
+                    feedback.pushInfo('Link crossings: {} before reordering, '
+                                      '{} after'.format(*crossings))
+                else:
+                    x, y = tree.x, tree.y
+                    tree = pipeline.place((self.SCALE_X, self.SCALE_Y),
+                                          center)
+                    placement = [self.SCALE_X, tree.x - self.SCALE_X * x,
+                                 self.SCALE_Y, tree.y - self.SCALE_Y * y]
+            progress(.7)
+
+            # Node ids follow the clades, not their order in the file
+            flat = flat_tree(tree.tree)
+            ids = flat.clade_ids().tolist()
+            measures = flat.measures()
+
+            # Scale ranges of the edges and of the collapsed clades
+            edge_scales, wedges = None, []
+            if collapse > 0:
+                unit = QgsUnitTypes.fromUnitToUnitFactor(
+                    layer.sourceCrs().mapUnits(), QgsUnitTypes.DistanceMeters)
+                nodes = list(tree.walk())
+                edge_scales, wedges = level_of_detail(
+                    flat, [n.x for n in nodes],
+                    [n.y for n in nodes], collapse, unit=unit)
+
+            # Draw the tree on the map
+            if lines is not None:
+                polylines = self.create_phylogram(tree, lines, out_fields,
+                                                  ids, measures, edge_scales)
+            else:
+                polylines = self.create_line_tree(tree, out_fields, ids,
+                                                  measures, edge_scales)
+            results = {self.OUTPUT: dest_id}
+            if crossings is not None:
+                results[self.CROSSINGS_BEFORE] = crossings[0]
+                results[self.CROSSINGS_AFTER] = crossings[1]
+            if update_layer is None:
+                sink.addFeatures(polylines, QgsFeatureSink.FastInsert)
+                self.layer_properties(dest_id, context, placement,
+                                      summary, collapse)
+            else:
+                # A project layer, edited by postProcessAlgorithm on the
+                # main thread
+                self.pending_update = (update_layer, polylines, placement,
+                                       summary, collapse)
+            if collapse > 0:
+                (wedge_sink, wedge_id) = self.parameterAsSink(
+                    parameters, self.OUTPUT_WEDGES, context,
+                    make_fields(self.WEDGE_FIELDS),
+                    QgsWkbTypes.Polygon, layer.sourceCrs()
+                )
+                if wedge_sink is not None:
+                    feats = self.create_wedges(
+                        tree, wedges, make_fields(self.WEDGE_FIELDS),
+                        ids)
+                    wedge_sink.addFeatures(feats, QgsFeatureSink.FastInsert)
+                    results[self.OUTPUT_WEDGES] = wedge_id
+                    self.render_scale_ranges(wedge_id, context)
+            progress(.8)
+
+            # Link tree to input layer features. In the phylogeography
+            # layout the leaves already sit on their features.
+            if link_sink is not None and layout != 1:
+                links = self.link_leaves(aggregator, link_fields, bundle)
+                link_sink.addFeatures(links, QgsFeatureSink.FastInsert)
+                self.layer_properties(link_id, context, None, summary)
+                results[self.OUTPUT_LINKS] = link_id
+            if count and layout != 1:
+                edges, links = self.count_crossings(tree, aggregator, lines)
+                feedback.pushInfo('Links cross tree edges {} times and each '
+                                  'other {} times'.format(edges, links))
+                results[self.EDGE_CROSSINGS] = edges
+                results[self.LINK_CROSSINGS] = links
 
-        # Draw the tree on the map
-        polylines = self.create_line_tree(tree, out_fields)
-        sink.addFeatures(polylines, QgsFeatureSink.FastInsert)
+            progress(.9)
 
-        # Link tree to input layer features
-        features = layer.getFeatures()
-        links = self.link_leaves(tree, features, 'Language')
-        sink.addFeatures(links, QgsFeatureSink.FastInsert)
+            # Unmatched leaves and features
+            (leaf_sink, leaf_id) = self.parameterAsSink(
+                parameters, self.OUTPUT_UNMATCHED_LEAVES, context,
+                make_fields(self.UNMATCHED_FIELDS),
+                QgsWkbTypes.NoGeometry
+            )
+            if leaf_sink is not None:
+                fields = make_fields(self.UNMATCHED_FIELDS)
+                for leaf in index.unmatched():
+                    feat = QgsFeature(fields)
+                    feat['label'] = leaf.name
+                    leaf_sink.addFeature(feat, QgsFeatureSink.FastInsert)
+                results[self.OUTPUT_UNMATCHED_LEAVES] = leaf_id
+
+            (feat_sink, feat_id) = self.parameterAsSink(
+                parameters, self.OUTPUT_UNMATCHED_FEATURES, context,
+                layer.fields(), layer.wkbType(), layer.sourceCrs()
+            )
+            if feat_sink is not None:
+                request = QgsFeatureRequest().setFilterFids(unmatched)
+                feat_sink.addFeatures(layer.getFeatures(request),
+                                      QgsFeatureSink.FastInsert)
+                results[self.OUTPUT_UNMATCHED_FEATURES] = feat_id
+
+            # Clade hulls
+            if hull_sink is not None:
+                hulls = self.create_clade_hulls(tree, leaf_hulls,
+                                                hull_fields, ids)
+                hull_sink.addFeatures(hulls, QgsFeatureSink.FastInsert)
+                results[self.OUTPUT_HULLS] = hull_id
+
+            progress(1.)
+            return results
+        except Cancelled:
+            return {}
+        finally:
+            pipeline.close()
+
+    def postProcessAlgorithm(self, context, feedback):
+        """
+        Update the existing tree layer, if one was given. Unlike
+        processAlgorithm this runs on the main thread, where a project
+        layer can safely be edited.
+        """
+        if self.pending_update is None:
+            return {}
+        layer, polylines, placement, summary, collapse = \
+            self.pending_update
+        self.pending_update = None
+        added, deleted, changed = self.update_features(layer, polylines)
+        # The layer now shows the tree without any edits
+        layer.removeCustomProperty(self.EDITS_PROPERTY)
+        if placement is None:
+            layer.removeCustomProperty(self.PLACEMENT_PROPERTY)
+        else:
+            layer.setCustomProperty(self.PLACEMENT_PROPERTY,
+                                    json.dumps(placement))
+        if summary is None:
+            layer.removeCustomProperty(self.SUMMARY_PROPERTY)
+        else:
+            layer.setCustomProperty(self.SUMMARY_PROPERTY, summary)
+        if collapse > 0:
+            layer.setCustomProperty(self.COLLAPSE_PROPERTY, collapse)
+        else:
+            layer.removeCustomProperty(self.COLLAPSE_PROPERTY)
+        feedback.pushInfo('Updated {}: {} edges added, {} deleted, '
+                          '{} changed'.format(layer.name(), added, deleted,
+                                              changed))
+        return {}
+
+    def place_on_map(self, tree, aggregator):
+        """
+        Phylogeography layout: move each leaf onto its linked features
+        and estimate the location of the internal nodes from them by
+        branch length weighted squared-change parsimony.
+        """
+        nodes = list(tree.walk())
+        # Leaves linked to several features sit at their mean position
+        locations = {i: aggregator.centroid(node)
+                     for i, node in enumerate(nodes) if node in aggregator}
 
-        return {self.OUTPUT: dest_id}
+        xs, ys = reconstruct_locations(flat_tree(tree.tree), locations)
+        for node, x, y in zip(nodes, xs.tolist(), ys.tolist()):
+            node.x, node.y = x, y
 
     def position_tree(self, tree, inputlayer):
         """
@@ -148,49 +711,226 @@ class PhyloTreeAlgorithm(QgsProcessingAlgorithm):
         """
         pass
 
-    def link_leaves(self, tree, feats, fieldname):
+    def link_leaves(self, aggregator, fields, iterations=0):
         """
         Create Polylines linking leaves of tree to input layer
-        features
-        """
-        # Match leaf nodes up with features in input layer
-        matches = []
-        leaf_table = {leaf.name: leaf for leaf in tree.leaves()}
-        for f in feats:
-            try:
-                name = f[fieldname]
-                leaf = leaf_table[name]
-                matches.append( (leaf, f) )
-            except KeyError:
-                pass
-        # Create lines linking each pair
+        features, bundled by `iterations` of edge bundling if given
+        """
+        # Create lines linking each leaf to its targets
+        links = list(aggregator.links(lambda l: (l.x, l.y)))
+        segments = np.array([(leaf.x, leaf.y, x, y) for leaf, (x, y) in links])
+        lines = bundle_links(segments, iterations)
         out = []
-        for leaf, feat in matches:
-            start = QgsPointXY(leaf.x, leaf.y)
-            end   = feat.geometry().asPoint()
-            line  = QgsGeometry.fromPolylineXY([start, end])
-            feat  = QgsFeature()
+        for (leaf, _), points in zip(links, lines.tolist()):
+            line  = QgsGeometry.fromPolylineXY(
+                [QgsPointXY(x, y) for x, y in points])
+            feat  = QgsFeature(fields)
             feat.setGeometry(line)
+            feat['label'] = leaf.name
+            feat['features'] = aggregator.count(leaf)
             out.append(feat)
         return out
 
-    def create_square_tree(self, tree, fields):
-        linedata = tree.construct_squaretree()
-        polylines = []
-        for line in linedata:
-            name, start, end = line
-            x1, y1 = start
-            x2, y2 = end
-            startp = QgsPointXY(x1, y1)
-            endp   = QgsPointXY(x2, y2)
-            geom   = QgsGeometry.fromPolylineXY([startp, endp])
-            feat   = QgsFeature(fields)
-            feat.setGeometry(geom)
-            feat['label'] = name
-            polylines.append(feat)
-        return polylines
+    def count_crossings(self, tree, aggregator, lines=None):
+        """
+        Numbers of crossings of the links with the edges of the tree,
+        or with the phylogram `lines` from `place_phylogram`, and
+        between links.
+        """
+        if lines is not None:
+            lines = lines[0]
+            edges = np.concatenate([lines[:, k:k + 2].reshape(-1, 4)
+                                    for k in range(lines.shape[1] - 1)])
+        else:
+            edges = np.array([(n.parent.x, n.parent.y, n.x, n.y)
+                              for n in tree.walk() if n.parent])
+        links = np.array([(leaf.x, leaf.y, x, y) for leaf, (x, y) in
+                          aggregator.links(lambda l: (l.x, l.y))])
+        return count_crossings(links, edges), count_crossings(links)
 
-    def create_line_tree(self, tree, fields):
+    def create_clade_hulls(self, tree, hulls, fields, ids):
+        """
+        Create one polygon per internal node of the tree covering the
+        features linked to its descendant leaves, with the node's id
+        from `ids`. `hulls` holds the hull of each leaf's features, as
+        built by `match_leaves`. The clade hulls are built bottom up,
+        each clade's hull being the merge of its children's hulls, so
+        no clade goes back to the individual features.
+        """
+        nodes = list(tree.walk())
+        counts = {}
+        out = []
+        # Reversed preorder visits every child before its parent
+        for i in reversed(range(len(nodes))):
+            node = nodes[i]
+            if not node.children:
+                counts[id(node)] = 1
+                continue
+            counts[id(node)] = sum(counts[id(c)] for c in node.children)
+            hull = merge_hulls(hulls.get(id(c), []) for c in node.children)
+            hulls[id(node)] = hull
+            if len(hull) < 3:
+                continue
+            ring = [QgsPointXY(x, y) for x, y in hull]
+            ring.append(ring[0])
+            feat = QgsFeature(fields)
+            feat.setGeometry(QgsGeometry.fromPolygonXY([ring]))
+            feat['id'], feat['label'] = ids[i], node.name
+            feat['leaves'] = counts[id(node)]
+            out.append(feat)
+        return out
+
+    def create_wedges(self, tree, wedges, fields, ids):
+        """
+        Create one triangle per collapsible clade, as given by
+        `level_of_detail`, with the scales it is drawn between.
+        """
+        nodes = list(tree.walk())
+        leaves = [0] * len(nodes)
+        index = {id(node): i for i, node in enumerate(nodes)}
+        # Reversed preorder visits every child before its parent
+        for i in reversed(range(len(nodes))):
+            node = nodes[i]
+            if not node.children:
+                leaves[i] = 1
+            if node.parent:
+                leaves[index[id(node.parent)]] += leaves[i]
+        out = []
+        for i, min_scale, max_scale, ring in wedges:
+            feat = QgsFeature(fields)
+            feat.setGeometry(QgsGeometry.fromPolygonXY(
+                [[QgsPointXY(x, y) for x, y in ring]]))
+            feat['id'], feat['label'] = ids[i], nodes[i].name
+            feat['leaves'] = leaves[i]
+            feat['min_scale'], feat['max_scale'] = min_scale, max_scale
+            out.append(feat)
+        return out
+
+    def render_scale_ranges(self, dest_id, context):
+        """Draw the output layer according to its features' scales"""
+        if context.willLoadLayerOnCompletion(dest_id):
+            details = context.layerToLoadOnCompletionDetails(dest_id)
+            details.setPostProcessor(ScaleRangeRenderer.create())
+
+    def layer_properties(self, dest_id, context, placement, summary,
+                         collapse=0.):
+        """
+        Record on an output layer, once loaded, how the layout was placed
+        on the map, which tree of the file was drawn and the size below
+        which clades collapse, and draw it according to its features'
+        scales if they have them.
+        """
+        if not context.willLoadLayerOnCompletion(dest_id):
+            return
+        properties = {}
+        if placement is not None:
+            properties[self.PLACEMENT_PROPERTY] = json.dumps(placement)
+        if summary is not None:
+            properties[self.SUMMARY_PROPERTY] = summary
+        if collapse > 0:
+            properties[self.COLLAPSE_PROPERTY] = collapse
+        if properties:
+            details = context.layerToLoadOnCompletionDetails(dest_id)
+            details.setPostProcessor(
+                TreeLayerProperties.create(properties, collapse > 0))
+
+    def order_leaves(self, tree, aggregator, sweeps=2):
+        """
+        Reorder the children of the nodes of a laid out tree so that
+        its leaves follow the order of their linked features along x,
+        then lay it out again. Returns the numbers of crossings between
+        links before and after, as counted by `order_children`.
+        """
+        nodes = list(tree.walk())
+        values = [aggregator.centroid(node)[0] if node in aggregator
+                  else np.nan for node in nodes]
+        flat = FlatTree(tree.tree)
+        children, before, after = order_children(flat, values, sweeps)
+        ordered = drawtree.buchheim(tree.tree, children=children)
+        xs = {id(node.tree): node.x for node in ordered.walk()}
+        for node in nodes:
+            node.x = xs[id(node.tree)]
+        return before, after
+
+    def place_phylogram(self, tree, elbows=False, rotation=0.):
+        """
+        Rectangular phylogram layout beside the map. Moves the nodes of
+        `tree` to the tips of their horizontal lines and returns the
+        lines, as from `phylogram.segments` or, with `elbows`, from
+        `phylogram.elbows` along with the index of their nodes.
+        """
+        flat = flat_tree(tree.tree)
+        x, y = phylogram.coordinates(flat)
+        if elbows:
+            lines = phylogram.elbows(flat, x, y)
+            owners = np.arange(len(flat))
+        else:
+            lines, owners = phylogram.segments(flat, x, y)
+        tips = np.column_stack([x + phylogram.HALF, y])
+
+        # Scale, move and rotate the lines and tips together
+        points = np.concatenate([lines.reshape(-1, 2), tips])
+        points = phylogram.place(points, (self.SCALE_X, self.SCALE_Y),
+                                 (115, -33))
+        if rotation:
+            points = phylogram.rotate(points, rotation)
+        tips = points[-len(tips):].tolist()
+        for node, (tx, ty) in zip(tree.walk(), tips):
+            node.x, node.y = tx, ty
+        return points[:-len(tips)].reshape(lines.shape), owners
+
+    def create_phylogram(self, tree, lines, fields, ids, measures,
+                         scales=None):
+        """
+        Create one feature per line of a phylogram, as returned by
+        `place_phylogram`. A horizontal line or elbow takes the id of
+        its node, and the vertical line joining the children of a node
+        a hash of it, so that ids stay unique. Lines carry the
+        `measures` of their node.
+        """
+        lines, owners = lines
+        nodes = list(tree.walk())
+        vertical = np.arange(len(owners)) >= len(nodes)
+        line_ids = np.asarray(ids, dtype=np.int64)[owners]
+        unsigned = line_ids.view(np.uint64)
+        unsigned[vertical] = [mix(i) for i in unsigned[vertical].tolist()]
+        line_ids = line_ids.tolist()
+        if scales is not None:
+            # Vertical lines are drawn as long as the edges to the
+            # node's children
+            min_scales, max_scales = scales
+            first = [n.children[0] if n.children else n for n in nodes]
+            index = {id(node): i for i, node in enumerate(nodes)}
+            child = np.array([index[id(c)] for c in first])
+            edge = np.where(vertical, child[owners], owners)
+            min_scales = min_scales[edge].tolist()
+            max_scales = max_scales[edge].tolist()
+        values = [m.tolist() for m in measures]
+        out = []
+        for k, (line, i) in enumerate(zip(lines.tolist(), owners.tolist())):
+            feat = QgsFeature(fields)
+            feat.setGeometry(QgsGeometry.fromPolylineXY(
+                [QgsPointXY(x, y) for x, y in line]))
+            feat['id'], feat['label'] = line_ids[k], nodes[i].name
+            feat['support'] = getattr(nodes[i].tree, 'support', None)
+            for name, value in zip(self.MEASURES, values):
+                feat[name] = value[i]
+            if scales is not None:
+                feat['min_scale'] = min_scales[k]
+                feat['max_scale'] = max_scales[k]
+            out.append(feat)
+        return out
+
+    def create_line_tree(self, tree, fields, ids, measures, scales=None):
+        """
+        Create one line per edge, identified by the id of the node it
+        leads to in `ids` and carrying the node's `measures`. `scales`,
+        if given, holds the (min_scale, max_scale) arrays of the edges
+        by node index.
+        """
+        if scales is not None:
+            min_scales, max_scales = [s.tolist() for s in scales]
+        values = [m.tolist() for m in measures]
         out = []
         for i, node in enumerate(tree.walk()):
             if node.parent:
@@ -201,10 +941,63 @@ class PhyloTreeAlgorithm(QgsProcessingAlgorithm):
                 feat  = QgsFeature(fields)
                 feat.setGeometry(line)
                 # Tree labels
-                feat['id'], feat['label'] = i, node.name
+                feat['id'], feat['label'] = ids[i], node.name
+                # Only summary trees have the support of their clades
+                feat['support'] = getattr(node.tree, 'support', None)
+                for name, value in zip(self.MEASURES, values):
+                    feat[name] = value[i]
+                if scales is not None:
+                    feat['min_scale'] = min_scales[i]
+                    feat['max_scale'] = max_scales[i]
                 out.append(feat)
         return out
     
+    def update_features(self, layer, features):
+        """
+        Make `layer` hold `features` by matching the two on their id,
+        adding, deleting and changing only the features that differ,
+        all in one edit session.
+
+        :return: Tuple of the numbers of added, deleted and changed\
+            features.
+        """
+        new = {feat['id']: feat for feat in features}
+        fields = layer.fields()
+        names = [f.name() for f in features[0].fields()
+                 if fields.indexOf(f.name()) >= 0] if features else []
+        deleted = []
+        geometries = {}
+        attributes = {}
+        for old in layer.getFeatures():
+            feat = new.pop(old['id'], None)
+            if feat is None:
+                deleted.append(old.id())
+                continue
+            if not old.geometry().equals(feat.geometry()):
+                geometries[old.id()] = feat.geometry()
+            changes = {fields.indexOf(name): feat[name] for name in names
+                       if old[name] != feat[name]}
+            if changes:
+                attributes[old.id()] = changes
+
+        added = []
+        for feat in new.values():
+            out = QgsFeature(fields)
+            out.setGeometry(feat.geometry())
+            for name in names:
+                out[name] = feat[name]
+            added.append(out)
+
+        with edit(layer):
+            layer.deleteFeatures(deleted)
+            for fid, geometry in geometries.items():
+                layer.changeGeometry(fid, geometry)
+            for fid, changes in attributes.items():
+                layer.changeAttributeValues(fid, changes)
+            layer.addFeatures(added)
+        return (len(added), len(deleted),
+                len(set(geometries) | set(attributes)))
+
     def create_point_tree(self, tree):
         out = []
         for i, node in enumerate(tree.walk()):
@@ -32,6 +32,12 @@ __revision__ = '$Format:%H$'
 
 from qgis.core import QgsProcessingProvider
 from .phylo_tree_algorithm import PhyloTreeAlgorithm
+from .cache_algorithm import TreeCacheAlgorithm
+from .edit_algorithm import TreeEditAlgorithm
+from .clade_index_algorithm import CladeIndexAlgorithm
+from .mantel_algorithm import MantelAlgorithm
+from .densitree_algorithm import DensitreeAlgorithm
+from . import cache
 
 
 class PhyloTreeProvider(QgsProcessingProvider):
@@ -47,13 +53,18 @@ class PhyloTreeProvider(QgsProcessingProvider):
         Unloads the provider. Any tear-down steps required by the provider
         should be implemented here.
         """
-        pass
+        cache.clear()
 
     def loadAlgorithms(self):
         """
         Loads all algorithms belonging to this provider.
         """
         self.addAlgorithm(PhyloTreeAlgorithm())
+        self.addAlgorithm(TreeCacheAlgorithm())
+        self.addAlgorithm(TreeEditAlgorithm())
+        self.addAlgorithm(CladeIndexAlgorithm())
+        self.addAlgorithm(MantelAlgorithm())
+        self.addAlgorithm(DensitreeAlgorithm())
         # add additional algorithms here
         # self.addAlgorithm(MyOtherAlgorithm())
 
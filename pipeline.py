@@ -0,0 +1,232 @@
+"""
+    Staged tree pipeline: parse -> layout -> placement.
+
+    Parsed trees and layouts are kept in the shared cache, so running
+    again with other placement parameters skips the parse and the
+    layout. Stages report fractional progress through a callback and
+    check for cancellation cooperatively from inside their loops,
+    which lets them run on the Processing worker thread and be
+    stopped part way through.
+
+    Nothing in here depends on QGIS.
+"""
+import os
+import threading
+
+from phylo_tree.trees import drawtree
+from phylo_tree.trees.flat import FlatTree
+from phylo_tree.trees.incremental import IncrementalLayout
+from phylo_tree.cache import tree_cache, DRAWTREE_NODE_BYTES, NODE_BYTES
+
+# Memory taken by a parsed tree per character of Newick
+PARSE_BYTES_PER_CHAR = 20
+
+
+class Cancelled(Exception):
+    """Raised from inside a stage when the caller asked it to stop"""
+
+
+class Progress(object):
+    """
+    Progress callback handed to the stages.
+
+    Maps the fraction done by a stage onto the [start, end] part of
+    the whole run before passing it to `report`, and raises
+    `Cancelled` as soon as `cancelled()` returns True.
+    """
+
+    def __init__(self, report=None, cancelled=None, start=0., end=1.):
+        self.report = report
+        self.cancelled = cancelled
+        self.start = start
+        self.end = end
+
+    def __call__(self, fraction):
+        if self.cancelled is not None and self.cancelled():
+            raise Cancelled()
+        if self.report is not None:
+            self.report(self.start + (self.end - self.start) * fraction)
+
+    def stage(self, start, end):
+        """Progress for a stage covering [start, end] of this one"""
+        span = self.end - self.start
+        return Progress(self.report, self.cancelled,
+                        self.start + span * start, self.start + span * end)
+
+
+def file_identity(path):
+    """Path, modification time and size, to notice a changed file"""
+    st = os.stat(path)
+    return (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+
+
+class LayoutEntry(object):
+    """
+    A laid out tree kept in the cache, with the layout coordinates so
+    it can be reset after a run has moved its nodes. Only the run
+    holding `lock` may use the DrawTree itself.
+    """
+
+    def __init__(self, tree):
+        self.drawtree = tree
+        self.coords = [(n.x, n.y) for n in tree.walk()]
+        self.lock = threading.Lock()
+
+    @property
+    def size(self):
+        return DRAWTREE_NODE_BYTES * len(self.coords)
+
+    def reset(self):
+        for node, (x, y) in zip(self.drawtree.walk(), self.coords):
+            node.x, node.y = x, y
+
+
+class EditedTree(object):
+    """
+    The incremental layout of a tree layer with the edits applied to
+    it, kept in the tree cache between runs.
+
+    :ivar transform: (scale_x, offset_x, scale_y, offset_y) from the\
+        layout to map coordinates.
+    :ivar ids: Clade id of each node, as in the layer's id field.
+    """
+
+    def __init__(self, layout, transform):
+        self.layout = layout
+        self.transform = transform
+        self.edits = []
+        self.ids = layout.tree.clade_ids().tolist()
+        self.index = {c: i for i, c in enumerate(self.ids)}
+
+    @property
+    def size(self):
+        return self.layout.size
+
+    def apply(self, operation, node):
+        """Apply an edit to the node with clade id `node`"""
+        change = getattr(self.layout, operation.lower())(self.index[node])
+        self.edits.append([operation, node])
+        return change
+
+
+class TreePipeline(object):
+    """
+    The stages turning a tree file into a laid out DrawTree.
+
+    Parsed trees and layouts are shared with other runs through
+    `cache`, keyed by the identity of the file and, for layouts, by
+    `layout_params`. Use the pipeline as a context manager so that
+    the cached layout is handed back when the run is over:
+
+        with TreePipeline(path) as pipeline:
+            tree = pipeline.layout(progress)
+
+    `summary` names a summary tree of all the trees of the file, from
+    `consensus.METHODS`, to use instead of the first one.
+
+    :ivar nodetree: The parsed tree, or None before `parse`.
+    :ivar drawtree: The laid out tree, or None before `layout`.
+    """
+
+    def __init__(self, path, layout_params=(), cache=tree_cache,
+                 summary=None):
+        self.path = path
+        self.layout_params = tuple(layout_params)
+        self.cache = cache
+        self.summary = summary
+        self.identity = None
+        self.nodetree = None
+        self.drawtree = None
+        self._entry = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Hand the cached layout back to other runs"""
+        if self._entry is not None:
+            self._entry.lock.release()
+            self._entry = None
+
+    def parse(self, progress=None):
+        """Parse the tree file, unless it was parsed already"""
+        if self.nodetree is None:
+            self.identity = file_identity(self.path)
+            if self.summary:
+                # Summaries of the same file are different trees
+                self.identity += (self.summary,)
+            self.nodetree = self.cache.get_or_create(
+                ('parse', self.identity),
+                lambda: drawtree.readtree(self.path, progress, self.summary),
+                self._parsed_size)
+        if progress is not None:
+            progress(1.)
+        return self.nodetree
+
+    def _parsed_size(self, tree):
+        if self.summary:
+            # A summary is a single tree of a file of many
+            return NODE_BYTES * sum(1 for _ in tree.walk())
+        # Parsed trees take roughly this much per byte of file
+        return self.identity[2] * PARSE_BYTES_PER_CHAR
+
+    def layout(self, progress=None):
+        """
+        Lay out the parsed tree. A cached layout has its coordinates
+        reset, undoing the placement of any previous run.
+        """
+        nodetree = self.parse()
+        key = ('layout', self.identity, self.layout_params)
+        entry = self._entry or self.cache.get(key)
+        if entry is None:
+            entry = LayoutEntry(drawtree.layout(nodetree, progress))
+            self.cache.put(key, entry, entry.size)
+
+        if entry is self._entry or entry.lock.acquire(blocking=False):
+            self._entry = entry
+            entry.reset()
+            self.drawtree = entry.drawtree
+        else:
+            # Another run is using the cached tree, work on a copy
+            self.drawtree = drawtree.with_coords(nodetree, entry.coords)
+        if progress is not None:
+            progress(1.)
+        return self.drawtree
+
+    def edited(self, name, edits, transform):
+        """
+        The layout with `edits` applied, as an `EditedTree` kept in the
+        cache under `name`, such as the id of the layer drawn from it.
+        It is rebuilt if the edits or the transform are not the cached
+        ones, skipping the edits of clades no longer in the tree.
+
+        :param edits: List of [operation, clade id] pairs.
+        :param transform: Placement of the layout on the map.
+        """
+        self.parse()
+        key = ('edit', self.identity, name)
+        edited = self.cache.get(key)
+        if edited is None or edited.edits != edits or \
+                edited.transform != transform:
+            tree = self.layout()
+            incremental = IncrementalLayout(FlatTree(tree.tree),
+                                            [n.x for n in tree.walk()])
+            edited = EditedTree(incremental, transform)
+            for operation, node in edits:
+                if node in edited.index:
+                    edited.apply(operation, node)
+            self.cache.put(key, edited, edited.size)
+        return edited
+
+    def place(self, scale, center, progress=None):
+        """
+        Lay out the tree, then scale it by (scale_x, scale_y) and
+        move it so that its bounding box is centered on `center`.
+        """
+        tree = self.layout(progress)
+        tree.scale(*scale)
+        tree.translate(center)
+        return tree
@@ -0,0 +1,79 @@
+"""
+    Benchmark of split counting and Robinson-Foulds distances.
+
+    Builds a sample of trees over the same taxa, like the posterior of
+    a Bayesian analysis: one random topology with a few leaves swapped
+    in each tree. Then times counting their splits and computing the
+    distance matrix, in this process and with a pool:
+
+        python scripts/benchmark_rf.py --trees 1000 --taxa 500 -j 4
+
+    with the directory above the plugin on PYTHONPATH, so that
+    `phylo_tree` is importable.
+"""
+import argparse
+import random
+import time
+
+from phylo_tree.trees.rf import rf_matrix
+from phylo_tree.trees.splits import count_splits
+from phylo_tree.trees.taxa import TaxonNamespace
+
+
+def sample(trees, taxa, swaps, seed):
+    """Newick strings of `trees` trees of `taxa` leaves"""
+    rng = random.Random(seed)
+    # Pairs of nodes joined, the same in every tree
+    merges = []
+    count = taxa
+    while count > 1:
+        i, j = sorted(rng.sample(range(count), 2))
+        merges.append((i, j))
+        count -= 1
+    labels = ['taxon_{}'.format(i) for i in range(taxa)]
+    for _ in range(trees):
+        order = labels[:]
+        for _ in range(swaps):
+            i, j = rng.randrange(taxa), rng.randrange(taxa)
+            order[i], order[j] = order[j], order[i]
+        nodes = ['{}:{:.4f}'.format(label, rng.random()) for label in order]
+        for i, j in merges:
+            b, a = nodes.pop(j), nodes.pop(i)
+            nodes.append('({},{}):{:.4f}'.format(a, b, rng.random()))
+        yield nodes[0] + ';'
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--trees', type=int, default=1000)
+    parser.add_argument('--taxa', type=int, default=500)
+    parser.add_argument('--swaps', type=int, default=5,
+                        help='Leaves swapped in each tree')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('-j', '--processes', type=int, default=0,
+                        help='Also time a pool of this many processes')
+    args = parser.parse_args(args)
+
+    start = time.time()
+    trees = list(sample(args.trees, args.taxa, args.swaps, args.seed))
+    print('{} trees of {} taxa built in {:.2f} s'.format(
+        args.trees, args.taxa, time.time() - start))
+
+    for processes in [None] + ([args.processes] if args.processes else []):
+        label = '{} processes'.format(processes) if processes else 'serial'
+        start = time.time()
+        counter, total = count_splits(trees, TaxonNamespace(),
+                                      processes=processes)
+        print('{}: {} distinct splits counted in {:.2f} s'.format(
+            label, len(counter), time.time() - start))
+        start = time.time()
+        matrix, summary = rf_matrix(trees, TaxonNamespace(),
+                                    processes=processes)
+        print('{}: RF matrix in {:.2f} s, mean distance {:.1f}, '
+              'most central tree {}'.format(
+                  label, time.time() - start, summary.mean.mean(),
+                  int(summary.mean.argmin())))
+
+
+if __name__ == '__main__':
+    main()
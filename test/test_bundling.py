@@ -0,0 +1,59 @@
+"""
+    Tests for edge bundling of links
+"""
+import unittest
+
+import numpy as np
+
+from phylo_tree.bundling import bundle, compatibility, neighbours
+
+
+class BundlingTest(unittest.TestCase):
+
+    def setUp(self):
+        rnd = np.random.RandomState(2)
+        # Two groups of nearly parallel links, one running the other way,
+        # and a link across both
+        first = np.column_stack([rnd.rand(20), rnd.rand(20) * 2,
+                                 10 + rnd.rand(20), 3 + rnd.rand(20) * 2])
+        second = np.column_stack([10 + rnd.rand(20), 20 + rnd.rand(20),
+                                  rnd.rand(20), 20 + rnd.rand(20)])
+        self.links = np.vstack([first, second, [[5, -5, 5, 30]]])
+
+    def test_neighbours(self):
+        i, j, c = neighbours(self.links, threshold=.5, limit=100)
+        expected = set()
+        n = len(self.links)
+        for a in range(n):
+            for b in range(n):
+                if a != b and compatibility(self.links, [a], [b])[0] >= .5:
+                    expected.add((a, b))
+        self.assertEqual(set(zip(i.tolist(), j.tolist())), expected)
+        self.assertTrue(np.allclose(c, compatibility(self.links, i, j)))
+        # Only the most compatible neighbours are kept
+        i, _, _ = neighbours(self.links, threshold=.5, limit=3)
+        self.assertLessEqual(np.bincount(i).max(), 3)
+
+    def test_bundle(self):
+        lines = bundle(self.links, iterations=30)
+        self.assertEqual(lines.shape, (41, 33, 2))
+        # Ends stay put
+        self.assertTrue(np.allclose(lines[:, 0], self.links[:, :2]))
+        self.assertTrue(np.allclose(lines[:, -1], self.links[:, 2:]))
+        # Middles of each group are pulled together
+        for group in (slice(0, 20), slice(20, 40)):
+            straight = (self.links[group, :2] + self.links[group, 2:]) / 2
+            middle = lines[group, 16]
+            self.assertLess(middle.std(axis=0).sum(),
+                            straight.std(axis=0).sum() / 2)
+        # The lone link has nothing to bundle with
+        self.assertTrue(np.allclose(lines[40, :, 0], 5, atol=1e-3))
+
+    def test_straight(self):
+        lines = bundle(self.links, iterations=0)
+        self.assertTrue(np.array_equal(lines.reshape(-1, 4), self.links))
+        self.assertEqual(bundle(np.empty((0, 4))).shape, (0, 2, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
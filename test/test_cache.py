@@ -0,0 +1,63 @@
+"""
+    Tests for the tree cache shared between runs
+"""
+import unittest
+from os import path
+
+from phylo_tree.cache import LRUCache
+from phylo_tree.pipeline import TreePipeline
+
+NEWICKFILE = path.join(path.dirname(__file__), 'test_tree.nwk')
+
+
+class LRUCacheTest(unittest.TestCase):
+
+    def test_eviction(self):
+        cache = LRUCache(budget=10)
+        cache.put('a', 1, 4)
+        cache.put('b', 2, 4)
+        cache.get('a')
+        cache.put('c', 3, 4)
+        # b was the least recently used
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertEqual(cache.size, 8)
+
+    def test_oversized(self):
+        cache = LRUCache(budget=10)
+        cache.put('a', 1, 11)
+        self.assertNotIn('a', cache)
+
+    def test_stats_and_clear(self):
+        cache = LRUCache()
+        calls = []
+        create = lambda: calls.append(1) or 'value'
+        cache.get_or_create('k', create, lambda v: 1)
+        cache.get_or_create('k', create, lambda v: 1)
+        self.assertEqual(len(calls), 1)
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+        self.assertEqual(cache.clear(), 1)
+        self.assertEqual(len(cache), 0)
+
+
+class SharedPipelineTest(unittest.TestCase):
+
+    def test_runs_share_layout(self):
+        cache = LRUCache()
+        with TreePipeline(NEWICKFILE, cache=cache) as first:
+            tree = first.place((6., 8.), (115., -33.))
+            # A concurrent run gets its own copy of the layout
+            with TreePipeline(NEWICKFILE, cache=cache) as second:
+                copy = second.layout()
+                self.assertIsNot(copy, tree)
+                self.assertIs(second.nodetree, first.nodetree)
+        with TreePipeline(NEWICKFILE, cache=cache) as third:
+            self.assertIs(third.layout(), tree)
+            self.assertEqual([(n.x, n.y) for n in tree.walk()],
+                             [(n.x, n.y) for n in copy.walk()])
+
+
+if __name__ == '__main__':
+    unittest.main()
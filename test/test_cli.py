@@ -0,0 +1,73 @@
+"""
+    Tests for the command line pipeline
+"""
+import csv
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from phylo_tree import cli
+
+NEWICKFILE = os.path.join(os.path.dirname(__file__), 'test_tree.nwk')
+LOCATIONS = [('Raccoon', 100, 10), ('bear', 101, 12), ('Sea Lion', 120, -10),
+             ('seal', 121, -11), ('dog', 85, 6), ('dog', 86, 7)]
+
+
+class CommandLineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.locations = os.path.join(self.dir, 'locations.csv')
+        with open(self.locations, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['Language', 'lon', 'lat'])
+            writer.writerows(LOCATIONS)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_geojson(self):
+        cli.main([NEWICKFILE, '-l', self.locations, '-o', self.dir,
+                  '--aggregation', 'all', '-j', '1'])
+        with open(os.path.join(self.dir, 'test_tree-edges.geojson')) as f:
+            edges = json.load(f)['features']
+        with open(os.path.join(self.dir, 'test_tree-links.geojson')) as f:
+            links = json.load(f)['features']
+        self.assertEqual(len(edges), 13)
+        self.assertEqual(len(links), 6)
+        self.assertEqual(links[0]['geometry']['type'], 'LineString')
+
+    def test_csv_phylogeography(self):
+        cli.main([NEWICKFILE, '-l', self.locations, '-o', self.dir,
+                  '-f', 'csv', '--layout', 'phylogeography'])
+        with open(os.path.join(self.dir, 'test_tree-edges.csv')) as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(len(rows), 13)
+        self.assertTrue(rows[0]['wkt'].startswith('LINESTRING ('))
+        self.assertFalse(os.path.exists(
+            os.path.join(self.dir, 'test_tree-links.csv')))
+
+    def test_summary(self):
+        # The same tree twice, so all clades have full support
+        with open(NEWICKFILE) as f:
+            tree = f.read().strip()
+        path = os.path.join(self.dir, 'sample.nwk')
+        with open(path, 'w') as f:
+            f.write(tree + '\n' + tree + '\n')
+        cli.main([path, '-l', self.locations, '-o', self.dir,
+                  '--summary', 'consensus', '-j', '1'])
+        with open(os.path.join(self.dir, 'sample-edges.geojson')) as f:
+            edges = json.load(f)['features']
+        self.assertEqual(len(edges), 13)
+        self.assertEqual({e['properties']['support'] for e in edges}, {1.})
+
+    def test_wkt_point(self):
+        self.assertEqual(cli.wkt_point('POINT (1 2)'), (1.0, 2.0))
+        self.assertEqual(
+            cli.wkt_point('POLYGON ((0 0, 2 0, 2 2, 0 2, 0 0))'), (1.0, 1.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+"""
+    Tests for NEXUS tree files and summary trees of tree samples
+"""
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from phylo_tree.cache import LRUCache
+from phylo_tree.pipeline import TreePipeline
+from phylo_tree.trees import nexus
+from phylo_tree.trees.consensus import (
+    CladeStats, majority_rule, max_clade_credibility, summarize)
+from phylo_tree.trees.flat import FlatTree
+from phylo_tree.trees.taxa import TaxonNamespace, TaxonTree
+
+NEXUS = """#NEXUS
+
+[written by hand]
+Begin taxa;
+    Dimensions ntax=4;
+    Taxlabels A B C 'D d';
+End;
+Begin trees;
+    Translate
+        1 A,
+        2 B,
+        3 C,
+        4 'D d'
+        ;
+tree STATE_0 [&lnP=-12.5,joint=-3.1] = [&R] ((1[&rate=1.0]:1.0,2:1.0)[&posterior=1,height_95%_HPD={0.1,0.2}]:1.0,(3:1.5,4:1.5):0.5);
+tree STATE_1 = [&R] ((1:1.0,2:1.0):1.0,(3:1.0,4:1.0):1.0);
+tree STATE_2 = [&R] (((1:1.0,2:1.0):0.5,3:1.5):0.5,4:2.0);
+tree STATE_3 = [&R] ((1:1.0,3:1.0):1.0,(2:1.0,4:1.0):1.0);
+End;
+"""
+
+
+def clades(root):
+    """Leaf label sets of the inner nodes, with their support"""
+    return {tuple(sorted(n.name for n in node.walk() if n.is_leaf)):
+            node.support for node in root.walk() if not node.is_leaf}
+
+
+class ConsensusTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'sample.trees')
+        with open(self.path, 'w') as f:
+            f.write(NEXUS)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def stats(self):
+        taxa = TaxonNamespace()
+        stats = CladeStats(taxa)
+        trees = list(nexus.trees(io.StringIO(NEXUS), taxa))
+        for tree in trees:
+            stats.add(TaxonTree.parse(tree, taxa))
+        return stats, trees
+
+    def test_nexus(self):
+        taxa = TaxonNamespace()
+        trees = list(nexus.trees(io.StringIO(NEXUS), taxa))
+        self.assertEqual(len(trees), 4)
+        self.assertEqual(trees[1], '((1:1.0,2:1.0):1.0,(3:1.0,4:1.0):1.0)')
+        self.assertEqual(taxa.labels, ['A', 'B', 'C', 'D d'])
+        self.assertEqual(taxa['4'], 3)
+        self.assertTrue(nexus.is_nexus(self.path))
+        root = nexus.read_tree(self.path)
+        self.assertEqual([n.name for n in root.walk() if n.is_leaf],
+                         ['A', 'B', 'C', 'D d'])
+
+    def test_stats(self):
+        stats, _ = self.stats()
+        self.assertEqual(stats.trees, 4)
+        ab = 0b0011
+        self.assertEqual(stats.support(ab), .75)
+        count, length, height = stats.clades[ab]
+        self.assertEqual((count, length, height), (3, 2.5, 3.))
+
+    def test_majority_rule(self):
+        stats, _ = self.stats()
+        root = majority_rule(stats)
+        self.assertEqual(clades(root), {('A', 'B', 'C', 'D d'): 1.,
+                                        ('A', 'B'): .75})
+        ab = [n for n in root.walk() if n.support == .75][0]
+        self.assertAlmostEqual(ab.length, 2.5 / 3)
+        self.assertAlmostEqual(ab.height, 1.)
+        # A higher threshold leaves a star tree
+        self.assertEqual(len(majority_rule(stats, .8).descendants), 4)
+        with self.assertRaises(ValueError):
+            majority_rule(stats, .3)
+
+    def test_mcc(self):
+        stats, trees = self.stats()
+        root = max_clade_credibility(trees, stats, mean_heights=False)
+        # The first tree with the best clades, CD being found twice
+        self.assertEqual(clades(root), {('A', 'B', 'C', 'D d'): 1.,
+                                        ('A', 'B'): .75, ('C', 'D d'): .5})
+        self.assertEqual([n.length for n in root.descendants], [1., .5])
+        root = max_clade_credibility(trees, stats)
+        # The mean heights of AB and CD are 1 and 1.25, of the root 2
+        self.assertEqual([n.length for n in root.descendants], [1., .75])
+
+    def test_summarize(self):
+        progress = []
+        root = summarize(self.path, 'mcc', progress=progress.append)
+        self.assertEqual(len(clades(root)), 3)
+        self.assertEqual(progress[-1], 1.)
+        self.assertTrue(all(a <= b for a, b in zip(progress, progress[1:])))
+        newick = os.path.join(self.dir, 'sample.nwk')
+        with open(newick, 'w') as f:
+            f.write('((A,B),(C,D));\n((A,B),C,D);\n((A,C),(B,D));\n')
+        self.assertEqual(clades(summarize(newick)),
+                         {('A', 'B', 'C', 'D'): 1., ('A', 'B'): 2 / 3})
+
+    def test_pipeline(self):
+        with TreePipeline(self.path, summary='consensus') as pipeline:
+            tree = pipeline.layout()
+            self.assertEqual(len(list(tree.walk())), 6)
+            self.assertEqual(pipeline.identity[-1], 'consensus')
+        with TreePipeline(self.path) as pipeline:
+            # The first tree of the file
+            self.assertEqual(len(list(pipeline.layout().walk())), 7)
+
+    def test_edit(self):
+        transform = [1., 0., 1., 0.]
+        with TreePipeline(self.path, summary='consensus',
+                          cache=LRUCache()) as pipeline:
+            flat = FlatTree(pipeline.parse())
+            edited = pipeline.edited('layer', [], transform)
+            # The ids of the layer drawn from the summary
+            self.assertEqual(edited.ids, flat.clade_ids().tolist())
+            # (A, B) is the only inner clade of the consensus
+            inner = [i for i in range(1, len(flat)) if not flat.is_leaf[i]]
+            self.assertEqual(len(inner), 1)
+            edited.apply('Collapse', edited.ids[inner[0]])
+        # Edits recorded on the layer are replayed on the summary
+        with TreePipeline(self.path, summary='consensus',
+                          cache=LRUCache()) as pipeline:
+            replayed = pipeline.edited('layer', edited.edits, transform)
+        self.assertEqual(replayed.edits, edited.edits)
+        self.assertEqual(replayed.layout.visible_children(inner[0]), [])
+        with TreePipeline(self.path, cache=LRUCache()) as pipeline:
+            first = pipeline.edited('layer', [], transform)
+        self.assertNotEqual(first.ids, replayed.ids)
+
+
+if __name__ == '__main__':
+    unittest.main()
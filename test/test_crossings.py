@@ -0,0 +1,70 @@
+"""
+    Tests for the segment crossing counter
+"""
+import itertools
+import unittest
+
+import numpy as np
+
+from phylo_tree.crossings import count_crossings, crossing_pairs
+
+
+def crosses(s, t):
+    """Whether two segments cross, by brute force"""
+    def orient(ax, ay, bx, by, cx, cy):
+        return np.sign((bx - ax) * (cy - ay) - (by - ay) * (cx - ax))
+    return (orient(*s, *t[:2]) * orient(*s, *t[2:]) < 0 and
+            orient(*t, *s[:2]) * orient(*t, *s[2:]) < 0)
+
+
+class CrossingTest(unittest.TestCase):
+
+    def setUp(self):
+        rnd = np.random.RandomState(1)
+        self.a = rnd.rand(150, 4) * 10
+        # Some short segments, inside a single cell
+        self.a[:40, 2:] = self.a[:40, :2] + rnd.rand(40, 2) * .3
+        self.b = rnd.rand(100, 4) * 10
+
+    def test_between_sets(self):
+        expected = sum(crosses(s, t) for s in self.a.tolist()
+                       for t in self.b.tolist())
+        self.assertEqual(count_crossings(self.a, self.b), expected)
+        # The grid only changes the speed
+        self.assertEqual(count_crossings(self.a, self.b, cell=.7), expected)
+
+    def test_within_set(self):
+        expected = sum(crosses(s, t) for s, t in
+                       itertools.combinations(self.a.tolist(), 2))
+        self.assertEqual(count_crossings(self.a), expected)
+        pairs = set()
+        for i, j in crossing_pairs(self.a, batch=100):
+            pairs.update(zip(i.tolist(), j.tolist()))
+        self.assertEqual(len(pairs), expected)
+
+    def test_touching(self):
+        fan = np.array([[0, 0, 1, 1], [0, 0, 1, -1], [0, 0, -1, 0],
+                        [1, 1, 2, 0]], dtype=float)
+        self.assertEqual(count_crossings(fan), 0)
+        self.assertEqual(count_crossings(fan, [[.5, -1, .5, 1]]), 2)
+        self.assertEqual(count_crossings(np.empty((0, 4)), fan), 0)
+
+    def test_lattice(self):
+        # Crossings on the lines and at the corners of the grid
+        diagonals = np.array([[0, 0, 4, 4], [0, 4, 4, 0]], dtype=float)
+        self.assertEqual(count_crossings(diagonals[:1], diagonals[1:],
+                                         cell=1.), 1)
+        self.assertEqual(count_crossings(diagonals, cell=1.), 1)
+        rnd = np.random.RandomState(2)
+        a = rnd.randint(0, 8, (60, 4)).astype(float)
+        b = rnd.randint(0, 8, (50, 4)).astype(float)
+        between = sum(crosses(s, t) for s in a.tolist() for t in b.tolist())
+        within = sum(crosses(s, t) for s, t in
+                     itertools.combinations(a.tolist(), 2))
+        for cell in (None, 1., 2., .5):
+            self.assertEqual(count_crossings(a, b, cell=cell), between)
+            self.assertEqual(count_crossings(a, cell=cell), within)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+"""
+    Tests for densitree rasters of tree samples
+"""
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from phylo_tree import densitree as dt
+from phylo_tree.trees.taxa import TaxonNamespace
+
+NEXUS = """#NEXUS
+Begin trees;
+    Translate 1 A, 2 B, 3 C, 4 D;
+tree STATE_0 = [&R] ((1:1.0,2:1.0):1.0,(3:1.0,4:1.0):1.0);
+tree STATE_1 = [&R] ((1:1.0,2:1.0):1.0,(3:1.0,4:1.0):1.0);
+tree STATE_2 = [&R] (((1:1.0,2:1.0):0.5,3:1.5):0.5,4:2.0);
+tree STATE_3 = [&R] ((2:0.5,1:0.5):1.5,(4:1.0,3:1.0):1.0);
+End;
+"""
+EXTENT = (0., 0., 30., 20.)
+
+
+class DensitreeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'sample.trees')
+        with open(self.path, 'w') as f:
+            f.write(NEXUS)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_burn(self):
+        grid = np.zeros((4, 4), dtype=np.uint32)
+        # Two segments through the same cells count once
+        segments = np.array([[[.5, 3.5], [3.5, 3.5]],
+                             [[.5, 3.5], [2.5, 3.5]],
+                             [[.5, .5], [.5, 2.5]]])
+        dt.burn(grid, segments, 0., 4., 1.)
+        self.assertEqual(grid[0].tolist(), [1, 1, 1, 1])
+        self.assertEqual(grid[:, 0].tolist(), [1, 1, 1, 1])
+        self.assertEqual(int(grid.sum()), 7)
+        # Outside the grid
+        dt.burn(grid, np.array([[[-5., 1.], [-1., 1.]]]), 0., 4., 1.)
+        self.assertEqual(int(grid.sum()), 7)
+
+    def test_grid_shape(self):
+        cell, shape = dt.grid_shape(EXTENT, 30)
+        self.assertEqual((cell, shape), (1., (20, 30)))
+        cell, shape = dt.grid_shape(EXTENT, 4)
+        self.assertEqual((cell, shape), (7.5, (3, 4)))
+
+    def test_draw(self):
+        drawing = dt.densitree(self.path, TaxonNamespace(), EXTENT, 30)
+        self.assertEqual(drawing.trees, 4)
+        # Trees 0, 1 and 3 have the same clades
+        self.assertEqual(drawing.topologies, 2)
+        self.assertEqual(drawing.top_trees, 3)
+        self.assertEqual(drawing.grid.shape, (20, 30))
+        self.assertEqual(drawing.height, 2.)
+        # Tips in the order of the consensus tree along the bottom
+        taxa = drawing.stats.taxa
+        order = sorted(taxa.labels, key=lambda l: drawing.position[taxa[l]])
+        self.assertEqual(order, ['A', 'B', 'C', 'D'])
+        self.assertEqual(drawing.grid[-1, [0, 10, 20, 29]].tolist(),
+                         [4, 4, 4, 4])
+        # Every tree reaches its root at the top
+        self.assertEqual(drawing.grid[0].max(), 4)
+
+    def test_processes(self):
+        serial = dt.densitree(self.path, TaxonNamespace(), EXTENT, 30)
+        pooled = dt.densitree(self.path, TaxonNamespace(), EXTENT, 30,
+                              processes=2)
+        np.testing.assert_array_equal(serial.grid, pooled.grid)
+        # Workers spawned as they are from inside QGIS
+        spawned = dt.densitree(self.path, TaxonNamespace(), EXTENT, 30,
+                               processes=2,
+                               context=multiprocessing.get_context('spawn'))
+        np.testing.assert_array_equal(serial.grid, spawned.grid)
+
+    def test_topology(self):
+        drawing = dt.densitree(self.path, TaxonNamespace(), EXTENT, 30)
+        segments, keys = dt.summary_edges(drawing, EXTENT)
+        self.assertEqual(segments.shape, (6, 2, 2))
+        # Children below their parents
+        self.assertTrue((segments[:, 0, 1] <= segments[:, 1, 1]).all())
+        # Leaves at the bottom
+        leaves = [k for k in keys if not k & (k - 1)]
+        self.assertEqual(len(leaves), 4)
+        self.assertEqual(sorted(segments[:, 0, 1].tolist())[:4],
+                         [0.] * 4)
+
+    def test_write_ascii(self):
+        path = os.path.join(self.dir, 'density.asc')
+        grid = np.arange(6, dtype=np.uint32).reshape(2, 3)
+        dt.write_raster(path, grid, (10., 20., 13., 22.), 1., 'WKT')
+        with open(path) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[:6], ['NCOLS 3', 'NROWS 2', 'XLLCORNER 10.0',
+                                     'YLLCORNER 20.0', 'CELLSIZE 1.0',
+                                     'NODATA_VALUE -9999'])
+        self.assertEqual(lines[6:], ['0 1 2', '3 4 5'])
+        with open(os.path.join(self.dir, 'density.prj')) as f:
+            self.assertEqual(f.read(), 'WKT')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+"""
+    Tests for patristic distances between leaves
+"""
+import os
+import unittest
+
+import numpy as np
+
+from phylo_tree.trees.newick import Node
+from phylo_tree.trees.flat import FlatTree
+from phylo_tree.trees import distances
+
+
+def random_tree(rnd, n):
+    nodes = [Node.create(name=str(i), length=str(rnd.rand()))
+             for i in range(n)]
+    while len(nodes) > 1:
+        k = min(len(nodes), rnd.randint(2, 4))
+        picked = [nodes.pop(rnd.randint(len(nodes))) for _ in range(k)]
+        nodes.append(Node.create(length=str(rnd.rand()),
+                                 descendants=picked))
+    return nodes[0]
+
+
+def naive(flat, a, b):
+    """Distance between nodes a and b summing lengths up to their MRCA"""
+    parent = flat.parent.tolist()
+    up = {}
+    total = 0.
+    while a >= 0:
+        up[a] = total
+        total += flat.length[a]
+        a = parent[a]
+    total = 0.
+    while b not in up:
+        total += flat.length[b]
+        b = parent[b]
+    return total + up[b]
+
+
+class PatristicTest(unittest.TestCase):
+
+    def setUp(self):
+        self.flat = FlatTree(random_tree(np.random.RandomState(6), 60))
+
+    def test_full(self):
+        leaves, matrix = distances.patristic(self.flat)
+        expected = [[naive(self.flat, a, b) for b in leaves.tolist()]
+                    for a in leaves.tolist()]
+        self.assertTrue(np.allclose(matrix, expected, atol=1e-5))
+
+    def test_condensed(self):
+        leaves = self.flat.leaves()[::2]
+        _, full = distances.patristic(self.flat, leaves)
+        _, condensed = distances.patristic(self.flat, leaves, condensed=True)
+        upper = full[np.triu_indices(len(leaves), 1)]
+        self.assertTrue(np.array_equal(condensed, upper))
+        with self.assertRaises(ValueError):
+            distances.patristic(self.flat, leaves[::-1])
+
+    def test_memory_mapped(self):
+        _, full = distances.patristic(self.flat)
+        old = distances.BLOCK_BYTES
+        distances.BLOCK_BYTES = 1000  # several blocks
+        try:
+            _, mapped = distances.patristic(self.flat, memory=0)
+            _, pooled = distances.patristic(self.flat, condensed=True,
+                                            memory=0, processes=2)
+        finally:
+            distances.BLOCK_BYTES = old
+        self.assertIsInstance(mapped, np.memmap)
+        self.assertTrue(np.array_equal(mapped, full))
+        self.assertTrue(np.array_equal(
+            pooled, full[np.triu_indices(len(full), 1)]))
+        for m in (mapped, pooled):
+            name = m.filename
+            del m
+            os.remove(name)
+        del mapped, pooled
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+"""
+    Tests for the flat tree arrays
+"""
+import unittest
+
+from phylo_tree.trees.newick import loads
+from phylo_tree.trees.flat import FlatTree, flat_tree
+
+
+def clade_ids(newick):
+    flat = FlatTree(loads(newick)[0])
+    return dict(zip(flat.names, flat.clade_ids().tolist()))
+
+
+class CladeIdTest(unittest.TestCase):
+
+    def test_order_independent(self):
+        a = clade_ids('((A,B)ab,(C,D)cd)root;')
+        b = clade_ids('((D,C)cd,(B,A)ab)root;')
+        self.assertEqual(a, b)
+
+    def test_unchanged_clades_keep_ids(self):
+        a = clade_ids('((A,B)ab,(C,D)cd)root;')
+        b = clade_ids('((A,B)ab,(C,(D,E)de)cd)root;')
+        self.assertEqual(a['ab'], b['ab'])
+        self.assertEqual(a['D'], b['D'])
+        self.assertNotEqual(a['cd'], b['cd'])
+        self.assertNotEqual(a['root'], b['root'])
+
+    def test_unique(self):
+        flat = FlatTree(loads('(((A)a)aa,(A,B));')[0])
+        ids = flat.clade_ids().tolist()
+        self.assertEqual(len(set(ids)), len(ids))
+
+
+class IntervalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = loads('((A,B)ab,(C,(D,E)de,F)cf,G)root;')[0]
+        self.flat = FlatTree(self.root)
+
+    def test_intervals(self):
+        pre, post = self.flat.intervals()
+        nodes = self.flat.nodes
+        for a in range(len(nodes)):
+            under = {id(n) for n in nodes[a].walk()}
+            for d in range(len(nodes)):
+                self.assertEqual(pre[a] <= pre[d] <= post[a],
+                                 id(nodes[d]) in under)
+
+    def test_leaf_ranks(self):
+        rank, lo, hi = self.flat.leaf_ranks()
+        names = self.flat.names
+        leaves = self.flat.leaves()
+        self.assertEqual([names[i] for i in leaves], list('ABCDEFG'))
+        self.assertEqual(rank[leaves].tolist(), list(range(7)))
+        for node in self.root.walk():
+            i = names.index(node.name)
+            self.assertEqual([names[j] for j in leaves[lo[i]:hi[i]]],
+                             node.get_leaf_names())
+
+    def test_subtree(self):
+        names = self.flat.names
+        # Clade cf collapsed and leaf A pruned
+        keep = [i for i, name in enumerate(names)
+                if name not in ('A', 'C', 'de', 'D', 'E', 'F')]
+        sub = self.flat.subtree(keep)
+        self.assertEqual(sub.names, ['root', 'ab', 'B', 'cf', 'G'])
+        self.assertEqual(sub.parent.tolist(), [-1, 0, 1, 0, 0])
+        self.assertEqual(sub.children, [[1, 3, 4], [2], [], [], []])
+        self.assertEqual(sub.measures().tips.tolist(), [3, 1, 1, 1, 1])
+
+
+class MeasuresTest(unittest.TestCase):
+
+    def test_measures(self):
+        flat = FlatTree(loads('((A:1,B:2)ab:1,(C:1,D:3)cd:2)root;')[0])
+        m = dict(zip(flat.names, zip(*[a.tolist() for a in
+                                       flat.measures()])))
+        self.assertEqual(m['root'], (0, 0., 5., 4))
+        self.assertEqual(m['ab'], (1, 1., 4., 2))
+        self.assertEqual(m['B'], (2, 3., 2., 1))
+        self.assertEqual(m['D'], (2, 5., 0., 1))
+        self.assertIs(flat.measures(), flat.measures())
+
+    def test_cached(self):
+        root = loads('((A,B)ab,(C,D)cd)root;')[0]
+        flat = flat_tree(root)
+        self.assertIs(flat_tree(root), flat)
+        root.prune_by_names(['A'])
+        self.assertEqual(len(flat_tree(root)), len(flat) - 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
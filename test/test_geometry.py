@@ -0,0 +1,53 @@
+"""
+    Tests for the plugin geometry routines
+"""
+import unittest
+import random
+
+from phylo_tree.geometry import Line, convex_hull, merge_hulls
+from phylo_tree.trees import drawtree
+from phylo_tree.trees.newick import loads
+
+
+class HullTest(unittest.TestCase):
+
+    def test_convex_hull(self):
+        points = [(0, 0), (2, 0), (2, 2), (0, 2), (1, 1), (1, 0)]
+        self.assertEqual(convex_hull(points),
+                         [(0, 0), (2, 0), (2, 2), (0, 2)])
+
+    def test_degenerate_hull(self):
+        self.assertEqual(convex_hull([(1, 1), (1, 1)]), [(1, 1)])
+        self.assertEqual(convex_hull([(0, 0), (1, 1), (2, 2)]),
+                         [(0, 0), (2, 2)])
+
+    def test_merge_hulls(self):
+        rnd = random.Random(1)
+        groups = [[(rnd.random(), rnd.random()) for _ in range(50)]
+                  for _ in range(4)]
+        merged = merge_hulls(convex_hull(g) for g in groups)
+        everything = convex_hull(p for g in groups for p in g)
+        self.assertEqual(merged, everything)
+
+
+class LineTest(unittest.TestCase):
+
+    def test_intersection(self):
+        # The diagonals of a box off the origin cross at its centre
+        a = Line((1, 1), (5, 3))
+        b = Line((1, 3), (5, 1))
+        self.assertEqual(a.intersection(b), (3, 2))
+        self.assertFalse(a.intersection(Line((0, 0), (4, 2))))
+
+    def test_translate_tree(self):
+        tree = drawtree.layout(loads('(((A,B),C),(D,(E,(F,G))));')[0])
+        tree.scale(6., 8.)
+        tree.translate((115, -33))
+        xs = [node.x for node in tree.walk()]
+        ys = [node.y for node in tree.walk()]
+        self.assertAlmostEqual((min(xs) + max(xs)) / 2, 115)
+        self.assertAlmostEqual((min(ys) + max(ys)) / 2, -33)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+"""
+    Tests for the incremental tree layout
+"""
+import unittest
+
+import numpy as np
+
+from phylo_tree.trees import drawtree
+from phylo_tree.trees.newick import loads
+from phylo_tree.trees.flat import FlatTree
+from phylo_tree.trees.incremental import IncrementalLayout
+
+
+class IncrementalLayoutTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = loads('(((A,B),C),(D,(E,(F,G))),((H,I),(J,K)));')[0]
+        self.flat = FlatTree(self.root)
+        self.names = self.flat.names
+
+    def fresh(self, layout):
+        """Lay out the edited tree from scratch for comparison"""
+        other = IncrementalLayout(self.flat)
+        other.collapsed[:] = layout.collapsed
+        other.pruned[:] = layout.pruned
+        for i in range(len(other) - 1, -1, -1):
+            other._place(i)
+        other._positions(0)
+        return other
+
+    def assertSameLayout(self, layout):
+        visible = layout.visible
+        self.assertTrue(np.allclose(self.fresh(layout).x[visible],
+                                    layout.x[visible]))
+
+    def test_starts_from_layout(self):
+        tree = drawtree.layout(self.root)
+        xs = [n.x for n in tree.walk()]
+        layout = IncrementalLayout(self.flat, xs)
+        self.assertEqual(layout.x.tolist(), xs)
+        self.assertEqual(layout.depth.tolist(), [n.y for n in tree.walk()])
+
+    def test_edits(self):
+        layout = IncrementalLayout(self.flat)
+        clade = self.names.index('E') - 1  # (E,(F,G))
+        for edit in ('collapse', 'expand', 'prune'):
+            before = layout.x.copy()
+            change = getattr(layout, edit)(clade)
+            self.assertSameLayout(layout)
+            # Every visible node that moved is reported
+            moved = np.flatnonzero((before != layout.x) & layout.visible)
+            self.assertTrue(set(moved) <= set(change.moved) |
+                            set(change.shown))
+        self.assertFalse(layout.visible[clade:layout.end[clade]].any())
+
+    def test_nested(self):
+        layout = IncrementalLayout(self.flat)
+        inner = self.names.index('F') - 1
+        outer = self.names.index('E') - 1
+        layout.collapse(inner)
+        change = layout.collapse(outer)
+        self.assertEqual(sorted(change.hidden),
+                         [self.names.index('E'), inner])
+        change = layout.expand(outer)
+        # The inner clade stays collapsed
+        self.assertEqual(sorted(change.shown),
+                         [self.names.index('E'), inner])
+        self.assertSameLayout(layout)
+
+    def test_uneven_edits(self):
+        # Subtrees of very different heights, whose contours are
+        # followed along threads into their siblings
+        self.root = loads('((((A,(B,(C,D))),E),F),(G,((H,I),(J,(K,L)))),'
+                          '(M,N,O));')[0]
+        self.flat = FlatTree(self.root)
+        self.names = self.flat.names
+        layout = IncrementalLayout(self.flat)
+        edits = [('collapse', 'B'), ('prune', 'J'), ('collapse', 'A'),
+                 ('expand', 'A'), ('prune', 'G'), ('expand', 'B'),
+                 ('collapse', 'H'), ('prune', 'M')]
+        for edit, name in edits:
+            # The clade above the named node
+            i = int(self.flat.parent[self.names.index(name)])
+            getattr(layout, edit)(i)
+            self.assertSameLayout(layout)
+
+    def test_prune_root(self):
+        layout = IncrementalLayout(self.flat)
+        self.assertRaises(ValueError, layout.prune, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+"""
+    Tests for the lowest common ancestor index
+"""
+import unittest
+
+import numpy as np
+
+from phylo_tree.trees.newick import loads, Node
+from phylo_tree.trees.lca import LCAIndex, lca_index
+
+
+def random_tree(rnd, n):
+    nodes = [Node.create(name=str(i)) for i in range(n)]
+    while len(nodes) > 1:
+        k = min(len(nodes), rnd.randint(2, 4))
+        picked = [nodes.pop(rnd.randint(len(nodes))) for _ in range(k)]
+        nodes.append(Node.create(descendants=picked))
+    return nodes[0]
+
+
+def naive_mrca(flat, a, b):
+    parent = flat.parent.tolist()
+    path = set()
+    while a >= 0:
+        path.add(a)
+        a = parent[a]
+    while b not in path:
+        b = parent[b]
+    return b
+
+
+class LCATest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = random_tree(np.random.RandomState(3), 300)
+        self.index = LCAIndex(self.root)
+
+    def test_pairs(self):
+        flat = self.index.tree
+        rnd = np.random.RandomState(4)
+        a = rnd.randint(len(flat), size=500)
+        b = rnd.randint(len(flat), size=500)
+        expected = [naive_mrca(flat, x, y) for x, y in zip(a, b)]
+        self.assertEqual(self.index.mrca(a, b).tolist(), expected)
+        self.assertEqual(self.index.mrca(a[0], b[0]), expected[0])
+        self.assertEqual(self.index.mrca(a[0], a[0]), a[0])
+
+    def test_sets(self):
+        flat = self.index.tree
+        leaves = flat.leaves()
+        rnd = np.random.RandomState(5)
+        groups = rnd.randint(4, size=len(leaves))
+        groups[groups == 2] = 3  # leave set 2 empty
+        out = self.index.mrca_of(leaves, groups)
+        for g in range(4):
+            members = leaves[groups == g].tolist()
+            if not members:
+                self.assertEqual(out[g], -1)
+                continue
+            expected = members[0]
+            for m in members[1:]:
+                expected = naive_mrca(flat, expected, m)
+            self.assertEqual(out[g], expected)
+            self.assertEqual(self.index.mrca_of(members), expected)
+
+    def test_stale(self):
+        root = loads('((A,B)ab,(C,D)cd)root;')[0]
+        index = lca_index(root)
+        self.assertIs(lca_index(root), index)
+        names = index.tree.names
+        self.assertEqual(
+            names[index.mrca(names.index('A'), names.index('C'))], 'root')
+        root.prune_by_names(['D'])
+        self.assertTrue(index.stale)
+        with self.assertRaises(ValueError):
+            index.mrca(0, 1)
+        fresh = lca_index(root)
+        self.assertIsNot(fresh, index)
+        self.assertEqual(len(fresh.tree), 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
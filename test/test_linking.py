@@ -0,0 +1,90 @@
+"""
+    Tests for linking leaves to map features
+"""
+import unittest
+
+from phylo_tree.linking import LinkAggregator, NameIndex, make_normalizer
+
+
+class Leaf(object):
+
+    def __init__(self, name):
+        self.name = name
+
+
+class NameIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.leaves = [Leaf(n) for n in
+                       ('sea_lion', 'Malay_[zlm]', 'Tagalog', 'Kapampangan',
+                        'Bahasa_Indonesia_indo1316')]
+        self.index = NameIndex(self.leaves)
+
+    def test_normalizer(self):
+        normalize = make_normalizer()
+        self.assertEqual(normalize('Ñandú_(Grande)'), 'nandu grande')
+        self.assertEqual(make_normalizer(['case'])('A_B'), 'a_b')
+
+    def test_lookup(self):
+        self.assertIs(self.index.lookup('Sea Lion'), self.leaves[0])
+        self.assertIs(self.index.lookup('Malay'), None)
+        # Codes embedded in labels are looked up as secondary names
+        self.assertIs(self.index.lookup(None, 'ZLM'), self.leaves[1])
+        self.assertIs(self.index.lookup('x', 'indo1316'), self.leaves[4])
+
+    def test_exact_names(self):
+        leaves = [Leaf('Malay'), Leaf('malay'), Leaf('Tagalog')]
+        index = NameIndex(leaves)
+        # Names spelled as a leaf find the leaf their normalized form does
+        self.assertIs(index.lookup('malay'), leaves[0])
+        self.assertIs(index.lookup('Tagalog'), leaves[2])
+        self.assertIs(index.lookup(1316), None)
+        self.assertEqual(index.unmatched(), [leaves[1]])
+
+    def test_approximate(self):
+        self.index.lookup('Tagalog')
+        matches = self.index.approximate(['Tagalogg', 'Kapampagan', 'Zzz'])
+        # Tagalog was matched exactly, so only Kapampangan remains
+        self.assertEqual(matches, {'Kapampagan': self.leaves[3]})
+        self.assertNotIn(self.leaves[3], self.index.unmatched())
+
+
+class AggregatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.points = [('a', 0.0, 0.0), ('b', 5.0, 5.0),
+                       ('a', 4.0, 2.0), ('a', 2.0, 1.0)]
+
+    def aggregate(self, mode):
+        agg = LinkAggregator(mode)
+        for key, x, y in self.points:
+            agg.add(key, x, y)
+        return agg
+
+    def test_first(self):
+        agg = self.aggregate('first')
+        self.assertEqual(agg.targets('a'), [(0.0, 0.0)])
+        self.assertEqual(agg.count('a'), 3)
+
+    def test_centroid(self):
+        agg = self.aggregate('centroid')
+        self.assertEqual(agg.targets('a'), [(2.0, 1.0)])
+        self.assertEqual(agg.targets('b'), [(5.0, 5.0)])
+
+    def test_nearest(self):
+        agg = self.aggregate('nearest')
+        self.assertEqual(agg.targets('a', (5.0, 1.0)), [(4.0, 2.0)])
+        self.assertRaises(ValueError, agg.targets, 'a')
+
+    def test_all(self):
+        agg = self.aggregate('all')
+        links = list(agg.links())
+        self.assertEqual(len(links), 4)
+        self.assertEqual(sorted(k for k, _ in links), ['a', 'a', 'a', 'b'])
+
+    def test_unknown_mode(self):
+        self.assertRaises(ValueError, LinkAggregator, 'median')
+
+
+if __name__ == '__main__':
+    unittest.main()
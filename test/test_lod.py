@@ -0,0 +1,110 @@
+"""
+    Tests for level of detail clade collapsing
+"""
+import unittest
+
+import numpy as np
+
+from phylo_tree.trees import drawtree
+from phylo_tree.trees.newick import loads
+from phylo_tree.trees.flat import FlatTree
+from phylo_tree.trees.lod import (collapse_scales, level_of_detail,
+                                  visible, INCH)
+
+
+class LevelOfDetailTest(unittest.TestCase):
+
+    def setUp(self):
+        root = loads('(((A,B),C),(D,(E,(F,G))));')[0]
+        tree = drawtree.layout(root)
+        self.flat = FlatTree(root)
+        self.xs = [n.x for n in tree.walk()]
+        self.ys = [n.y for n in tree.walk()]
+
+    def test_scales(self):
+        scales, (min_x, min_y, max_x, max_y) = collapse_scales(
+            self.flat, self.xs, self.ys, pixels=1., dpi=INCH)
+        # At these settings the scale is the subtree's size
+        self.assertEqual(scales[0], max(max_x[0] - min_x[0],
+                                        max_y[0] - min_y[0]))
+        leaves = self.flat.is_leaf
+        self.assertTrue((scales[leaves] == 0).all())
+        parent = self.flat.parent[1:]
+        self.assertTrue((scales[1:] <= scales[parent]).all())
+
+    def test_every_leaf_drawn_once(self):
+        (min_scale, max_scale), wedges = level_of_detail(
+            self.flat, self.xs, self.ys, pixels=1., dpi=INCH)
+        wedge_min = np.array([w[1] for w in wedges])
+        wedge_max = np.array([w[2] for w in wedges])
+        parent = self.flat.parent.tolist()
+        for scale in (0.5, 1.5, 2.5, 4., 100.):
+            edges = visible(min_scale, max_scale, scale)
+            shown = visible(wedge_min, wedge_max, scale)
+            collapsed = [w[0] for w, s in zip(wedges, shown) if s]
+            # Each leaf is reached by its edges or is inside exactly
+            # one drawn wedge
+            for leaf in self.flat.leaves().tolist():
+                path = []
+                i = leaf
+                while i >= 0:
+                    path.append(i)
+                    i = parent[i]
+                covering = [i for i in path if i in collapsed]
+                if covering:
+                    self.assertEqual(len(covering), 1)
+                    self.assertFalse(edges[path[:path.index(covering[0])]]
+                                     .any())
+                else:
+                    self.assertTrue(edges[path[:-1]].all())
+
+    def test_wedge_ring(self):
+        _, wedges = level_of_detail(self.flat, self.xs, self.ys)
+        i, _, _, ring = wedges[0]
+        self.assertEqual(i, 0)
+        self.assertEqual(len(ring), 4)
+        self.assertEqual(ring[0], ring[-1])
+        self.assertEqual(ring[0], (self.xs[0], self.ys[0]))
+
+    def test_budget(self):
+        # Every leaf of a caterpillar tree hangs from the root's clade
+        newick = 'L0'
+        for k in range(1, 150):
+            newick = '({},L{})'.format(newick, k)
+        root = loads(newick + ';')[0]
+        tree = drawtree.layout(root)
+        flat = FlatTree(root)
+        xs = np.array([n.x for n in tree.walk()])
+        ys = np.array([n.y for n in tree.walk()])
+        budget, (width, height) = 40, (20, 10)
+
+        def most_on_a_screen(budget):
+            (min_scale, max_scale), wedges = level_of_detail(
+                flat, xs, ys, pixels=1., dpi=INCH, budget=budget,
+                screen=(width, height))
+            wedge_at = np.array([w[0] for w in wedges])
+            wedge_min = np.array([w[1] for w in wedges])
+            wedge_max = np.array([w[2] for w in wedges])
+            most = 0
+            for scale in np.geomspace(.5, 10., 8):
+                edges = visible(min_scale, max_scale, scale)
+                # The root has no edge of its own
+                edges[0] = False
+                shown = wedge_at[visible(wedge_min, wedge_max, scale)]
+                x = np.concatenate([xs[edges], xs[shown]])
+                y = np.concatenate([ys[edges], ys[shown]])
+                w, h = width * scale, height * scale
+                for left in np.arange(xs.min() - w, xs.max(), w / 2):
+                    for bottom in np.arange(ys.min() - h, ys.max(), h / 2):
+                        most = max(most, ((x >= left) & (x < left + w) &
+                                          (y >= bottom) &
+                                          (y < bottom + h)).sum())
+            # Zoomed in far enough, the whole tree is drawn
+            self.assertTrue(visible(min_scale, max_scale, .001).all())
+            return most
+
+        self.assertGreater(most_on_a_screen(None), budget)
+        self.assertLessEqual(most_on_a_screen(budget), budget)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+"""
+    Tests for the Mantel test
+"""
+import multiprocessing
+import unittest
+
+import numpy as np
+
+from phylo_tree import mantel
+
+
+class MantelTest(unittest.TestCase):
+
+    def setUp(self):
+        rnd = np.random.RandomState(7)
+        n = 40
+        self.lon = rnd.uniform(100, 150, n)
+        self.lat = rnd.uniform(-40, 0, n)
+        self.x = mantel.great_circle(self.lon, self.lat)
+        noisy = mantel.great_circle(self.lon + rnd.normal(0, 3, n),
+                                    self.lat + rnd.normal(0, 3, n))
+        self.y = noisy
+        z = rnd.rand(n, n)
+        self.z = (z + z.T).astype(np.float32)
+        np.fill_diagonal(self.z, 0)
+
+    def test_great_circle(self):
+        d = mantel.great_circle([0, 90, 0], [0, 0, 90])
+        quarter = np.pi / 2 * mantel.EARTH_RADIUS
+        self.assertTrue(np.allclose(d, [[0, quarter, quarter],
+                                        [quarter, 0, quarter],
+                                        [quarter, quarter, 0]]))
+
+    def test_statistic(self):
+        upper = np.triu_indices(len(self.x), 1)
+        expected = np.corrcoef(self.x[upper], self.y[upper])[0, 1]
+        r, p = mantel.mantel(self.x, self.y, permutations=0)
+        self.assertAlmostEqual(r, expected, places=5)
+
+    def test_permutations(self):
+        r, p = mantel.mantel(self.x, self.y, permutations=199, seed=1)
+        self.assertGreater(r, .5)
+        self.assertAlmostEqual(p, 1 / 200)
+        _, q = mantel.mantel(self.x, self.z, permutations=199, seed=1)
+        self.assertGreater(q, .01)
+        # The same seed gives the same permutations however they are run
+        self.assertEqual(
+            mantel.mantel(self.x, self.z, permutations=120, seed=2),
+            mantel.mantel(self.x, self.z, permutations=120, seed=2,
+                          processes=2))
+        # Workers spawned as they are from inside QGIS
+        self.assertEqual(
+            mantel.mantel(self.x, self.z, permutations=120, seed=2),
+            mantel.mantel(self.x, self.z, permutations=120, seed=2,
+                          processes=2,
+                          context=multiprocessing.get_context('spawn')))
+        with self.assertRaises(ValueError):
+            mantel.mantel(self.x, self.z[:5, :5])
+
+
+if __name__ == '__main__':
+    unittest.main()
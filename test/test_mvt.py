@@ -0,0 +1,99 @@
+"""
+    Tests for the vector tile export
+"""
+import gzip
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import numpy as np
+
+from phylo_tree import mvt
+
+
+class VectorTileTest(unittest.TestCase):
+
+    def test_encoding(self):
+        self.assertEqual(mvt.varint(300), b'\xac\x02')
+        self.assertEqual([mvt.zigzag(n) for n in (0, -1, 1, -2)],
+                         [0, 1, 2, 3])
+        # Example from the specification: LINESTRING (2 2, 2 10, 10 10)
+        self.assertEqual(mvt.encode_geometry([[(2, 2), (2, 10), (10, 10)]]),
+                         [9, 4, 4, 18, 0, 16, 16, 0])
+
+    def test_segment_tiles(self):
+        self.assertEqual(mvt.segment_tiles(.5, .5, 2.5, .5),
+                         [(0, 0), (1, 0), (2, 0)])
+        self.assertEqual(mvt.segment_tiles(.5, .5, .6, .7), [(0, 0)])
+        tiles = mvt.segment_tiles(.5, .5, 1.5, 1.6)
+        self.assertEqual(tiles[0], (0, 0))
+        self.assertEqual(tiles[-1], (1, 1))
+        self.assertEqual(len(tiles), 3)
+
+    def test_segments_tiles(self):
+        segments = np.array([[.5, .5, 2.5, .5], [.5, .5, .6, .7],
+                             [.5, .5, 1.5, 1.6], [3.2, 4.9, .1, .3]])
+        rows, xs, ys = mvt.segments_tiles(segments, limit=4)
+        for i, segment in enumerate(segments):
+            tiles = list(zip(xs[rows == i].tolist(), ys[rows == i].tolist()))
+            self.assertEqual(sorted(tiles),
+                             sorted(mvt.segment_tiles(*segment)))
+
+    def test_encode_lines(self):
+        segments = np.array([[2, 2, 2, 10], [-64, 300, 4160, 0]])
+        tags = np.array([[0, 0, 1, 200], [0, 1, -1, -1]])
+        expected = b''.join(
+            mvt.encode_feature(fid, [t for t in tag if t >= 0],
+                               mvt.encode_geometry([[(x0, y0), (x1, y1)]]))
+            for fid, tag, (x0, y0, x1, y1) in zip(
+                [3, 70000], tags.tolist(), segments.tolist()))
+        self.assertEqual(
+            mvt.encode_lines(np.array([3, 70000]), tags, segments), expected)
+
+    def test_simplify(self):
+        points = [(0, 0), (1, 0.1), (2, 0), (3, 5), (4, 0)]
+        self.assertEqual(mvt.simplify(points, 1.),
+                         [(0, 0), (2, 0), (3, 5), (4, 0)])
+
+    def test_mbtiles(self):
+        folder = tempfile.mkdtemp()
+        try:
+            path = os.path.join(folder, 'tree.mbtiles')
+            layers = {
+                'edges': [([(100, 10), (110, 10)], {'id': 1, 'label': 'a'}),
+                          ([(110, 10), (110, 20)], {'id': 2, 'label': None})],
+                'links': [([(100, 10), (100.0001, 10)], {'features': 1})],
+            }
+            count = mvt.export_tiles(layers, path, 0, 3, processes=1)
+            db = sqlite3.connect(path)
+            rows = db.execute('SELECT zoom_level, tile_column, tile_row, '
+                              'tile_data FROM tiles').fetchall()
+            metadata = dict(db.execute('SELECT * FROM metadata'))
+            db.close()
+        finally:
+            shutil.rmtree(folder)
+        self.assertEqual(len(rows), count)
+        self.assertIn((0, 0, 0), [r[:3] for r in rows])
+        self.assertEqual(metadata['maxzoom'], '3')
+        tile = gzip.decompress(rows[0][3])
+        self.assertIn(b'edges', tile)
+        # The link is far shorter than a pixel at these zoom levels
+        self.assertNotIn(b'links', tile)
+
+    def test_directory(self):
+        folder = tempfile.mkdtemp()
+        try:
+            layers = {'edges': [([(-10, 0), (10, 0)], {'id': 1})]}
+            count = mvt.export_tiles(layers, folder, 1, 1, processes=2)
+            tiles = sorted(os.listdir(os.path.join(folder, '1')))
+        finally:
+            shutil.rmtree(folder)
+        # The line crosses the prime meridian, between two tiles
+        self.assertEqual(count, 2)
+        self.assertEqual(tiles, ['0', '1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
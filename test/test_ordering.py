@@ -0,0 +1,96 @@
+"""
+    Tests for the leaf ordering
+"""
+import itertools
+import unittest
+
+import numpy as np
+
+from phylo_tree.trees import drawtree
+from phylo_tree.trees.newick import loads
+from phylo_tree.trees.flat import FlatTree
+from phylo_tree.trees.ordering import (order_children, crossings, cross,
+                                       count_below, leaf_order)
+
+
+def brute_force(values):
+    return sum(1 for a, b in itertools.combinations(values, 2) if a > b)
+
+
+class OrderingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = loads('((A,B,C),(D,(E,F)),G);')[0]
+        self.flat = FlatTree(self.root)
+        self.values = np.full(len(self.flat), np.nan)
+        self.values[self.flat.leaves()] = [5, 1, 3, 0, 4, 2, 6]
+
+    def test_cross(self):
+        a, b = np.array([1., 4., 6.]), np.array([2., 3., 5., 7.])
+        self.assertEqual(cross(a, b), 5)
+        self.assertEqual(cross(b, a), 7)
+        self.assertEqual(cross(a, np.empty(0)), 0)
+
+    def test_crossings(self):
+        rnd = np.random.RandomState(1)
+        values = np.concatenate([[np.nan], rnd.rand(200)])
+        children = [list(range(1, 201))] + [[]] * 200
+        self.assertEqual(crossings(children, values),
+                         brute_force(values[1:].tolist()))
+
+    def test_order(self):
+        children, before, after = order_children(self.flat, self.values)
+        self.assertEqual(before, crossings(self.flat.children, self.values))
+        self.assertEqual(after, crossings(children, self.values))
+        self.assertLess(after, before)
+        # Same nodes under each parent
+        for old, new in zip(self.flat.children, children):
+            self.assertEqual(sorted(old), sorted(new))
+        # The clade (D,(E,F)) comes first, its leaves in order
+        order = self.values[leaf_order(children)].tolist()
+        self.assertEqual(order[:3], [0, 2, 4])
+
+    def test_count_below(self):
+        rnd = np.random.RandomState(2)
+        ranks = rnd.randint(0, 10, 300)
+        starts = rnd.randint(0, 300, 500)
+        stops = np.minimum(starts + rnd.randint(0, 300, 500), 300)
+        thresholds = rnd.randint(0, 11, 500)
+        for strict in (True, False):
+            expected = [int((ranks[a:b] < t if strict else
+                             ranks[a:b] <= t).sum())
+                        for a, b, t in zip(starts, stops, thresholds)]
+            self.assertEqual(count_below(ranks, starts, stops, thresholds,
+                                         strict).tolist(), expected)
+
+    def test_deep_tree(self):
+        # Every node of a caterpillar has a leaf and a large clade
+        newick = 'L0'
+        for k in range(1, 300):
+            newick = '({},L{})'.format(newick, k)
+        flat = FlatTree(loads(newick + ';')[0])
+        values = np.full(len(flat), np.nan)
+        values[flat.leaves()] = np.random.RandomState(3).rand(300)
+        children, before, after = order_children(flat, values)
+        self.assertEqual(before, crossings(flat.children, values))
+        self.assertEqual(after, crossings(children, values))
+        self.assertLess(after, before)
+
+    def test_layout(self):
+        children, _, _ = order_children(self.flat, self.values)
+        tree = drawtree.buchheim(self.root, children=children)
+        leaves = sorted((node.x, node.tree.name) for node in tree.walk()
+                        if not node.children)
+        names = self.flat.names
+        self.assertEqual([name for _, name in leaves],
+                         [names[i] for i in leaf_order(children)])
+
+    def test_unlinked_leaves(self):
+        self.values[self.flat.leaves()[:3]] = np.nan
+        children, before, after = order_children(self.flat, self.values)
+        self.assertEqual(after, crossings(children, self.values))
+        self.assertLessEqual(after, before)
+
+
+if __name__ == '__main__':
+    unittest.main()
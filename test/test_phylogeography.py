@@ -0,0 +1,36 @@
+"""
+    Tests for ancestral location reconstruction
+"""
+import unittest
+
+from phylo_tree.trees.newick import loads
+from phylo_tree.trees.flat import FlatTree
+from phylo_tree.trees.phylogeography import reconstruct_locations
+
+
+class ReconstructionTest(unittest.TestCase):
+
+    def test_star_tree(self):
+        # The root of a star tree is the mean of its leaves weighted
+        # by inverse branch length
+        flat = FlatTree(loads('(A:1,B:1,C:2);')[0])
+        xs, ys = reconstruct_locations(
+            flat, {1: (0.0, 0.0), 2: (2.0, 0.0), 3: (5.0, 5.0)})
+        self.assertAlmostEqual(xs[0], 1.8)
+        self.assertAlmostEqual(ys[0], 1.0)
+
+    def test_unlocated_leaves(self):
+        flat = FlatTree(loads('((A:1,B:1):1,C:1);')[0])
+        xs, ys = reconstruct_locations(flat, {2: (1.0, 1.0), 4: (3.0, 1.0)})
+        # B has no location of its own and follows its parent
+        self.assertEqual((xs[3], ys[3]), (xs[1], ys[1]))
+        self.assertAlmostEqual(xs[0], 7.0 / 3)
+        self.assertAlmostEqual(xs[1], 5.0 / 3)
+
+    def test_no_locations(self):
+        flat = FlatTree(loads('(A,B);')[0])
+        self.assertRaises(ValueError, reconstruct_locations, flat, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+"""
+    Tests for the phylogram geometry
+"""
+import unittest
+
+import numpy as np
+
+from phylo_tree.trees import drawtree, phylogram
+from phylo_tree.trees.newick import loads
+from phylo_tree.trees.flat import FlatTree
+
+
+class PhylogramTest(unittest.TestCase):
+
+    def setUp(self):
+        self.flat = FlatTree(loads('((A,B),C);')[0])
+
+    def test_coordinates(self):
+        x, y = phylogram.coordinates(self.flat)
+        self.assertEqual(x.tolist(), [0, 1, 2, 2, 2])
+        self.assertEqual(y.tolist(), [1.25, .5, 0, 1, 2])
+
+    def test_segments(self):
+        lines, owners = phylogram.segments(self.flat)
+        self.assertEqual(lines.shape, (7, 2, 2))
+        self.assertEqual(owners.tolist(), [0, 1, 2, 3, 4, 0, 1])
+        # Leaf C hangs from the root's vertical line
+        self.assertEqual(lines[4].tolist(), [[.5, 2], [2.5, 2]])
+        self.assertEqual(lines[5].tolist(), [[.5, .5], [.5, 2]])
+
+    def test_elbows_cover_segments(self):
+        lines, _ = phylogram.segments(self.flat)
+        elbows = phylogram.elbows(self.flat)
+        self.assertEqual(elbows.shape, (5, 3, 2))
+        # The corner of each elbow lies on its parent's vertical line
+        # and its end is the end of the node's horizontal line
+        self.assertTrue((elbows[1:, 0, 0] == lines[[0, 1, 1, 0], 1, 0]).all())
+        self.assertTrue((elbows[:, 2] == lines[:5, 1]).all())
+
+    def test_rotate(self):
+        points = np.array([[[0., 0.], [2., 0.]]])
+        rotated = phylogram.rotate(points, 90)
+        self.assertTrue(np.allclose(rotated, [[[1, -1], [1, 1]]]))
+
+    def test_drawtree(self):
+        tree = drawtree.layout(self.flat.nodes[0])
+        lines = tree.construct_phylogram()
+        self.assertEqual(lines.shape, (7, 2, 2))
+        tree.phylogram()
+        self.assertEqual(tree.max_depth, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
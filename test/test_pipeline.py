@@ -0,0 +1,44 @@
+"""
+    Tests for the staged parse and layout pipeline
+"""
+import unittest
+from os import path
+
+from phylo_tree.cache import LRUCache
+from phylo_tree.pipeline import TreePipeline, Progress, Cancelled
+
+NEWICKFILE = path.join(path.dirname(__file__), 'test_tree.nwk')
+
+
+class PipelineTest(unittest.TestCase):
+
+    def test_progress_stages(self):
+        reports = []
+        progress = Progress(reports.append).stage(.5, 1.)
+        progress.stage(0., .5)(1.)
+        progress(1.)
+        self.assertEqual(reports, [.75, 1.])
+
+    def test_cancel(self):
+        pipeline = TreePipeline(NEWICKFILE, cache=LRUCache())
+        progress = Progress(cancelled=lambda: True)
+        self.assertRaises(Cancelled, pipeline.parse, progress)
+        self.assertIsNone(pipeline.nodetree)
+
+    def test_reuse(self):
+        pipeline = TreePipeline(NEWICKFILE)
+        nodetree = pipeline.parse()
+        tree = pipeline.layout()
+        before = [(n.x, n.y) for n in tree.walk()]
+        pipeline.place((6., 8.), (115., -33.))
+        # Laying out again skips the parse and undoes the placement
+        self.assertIs(pipeline.layout(), tree)
+        self.assertIs(pipeline.nodetree, nodetree)
+        self.assertEqual([(n.x, n.y) for n in tree.walk()], before)
+        self.assertEqual(sorted(l.name for l in tree.leaves()),
+                         ['bear', 'cat', 'dog', 'monkey', 'raccoon',
+                          'sea_lion', 'seal', 'weasel'])
+
+
+if __name__ == '__main__':
+    unittest.main()
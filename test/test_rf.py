@@ -0,0 +1,71 @@
+"""
+    Tests for Robinson-Foulds distances between trees
+"""
+import io
+import multiprocessing
+import unittest
+
+import numpy as np
+
+from phylo_tree.trees.rf import read_rf, rf_matrix
+from phylo_tree.trees.splits import as_ints, splits
+from phylo_tree.trees.taxa import TaxonNamespace, loads
+
+
+class RFTest(unittest.TestCase):
+
+    trees = ('((A,B),(C,(D,E)),F);\n'
+             '((B,A),((E,D),C),F);\n'
+             '((A,C),(B,(D,E)),F);\n'
+             '((A,F),(B,(C,(D,E))));\n'
+             '(((A,B),C),(D,(E,F)));\n')
+
+    def brute_force(self, rooted=False):
+        taxa = TaxonNamespace()
+        sets = [set(as_ints(splits(tree, rooted=rooted)))
+                for tree in loads(self.trees, taxa)]
+        return np.array([[len(a ^ b) for b in sets] for a in sets])
+
+    def test_matrix(self):
+        for rooted in (False, True):
+            matrix, summary = rf_matrix(
+                self.trees.split(';')[:-1], TaxonNamespace(), rooted)
+            expected = self.brute_force(rooted)
+            self.assertEqual(matrix.tolist(), expected.tolist())
+            self.assertEqual(summary.mean.tolist(),
+                             (expected.sum(axis=1) / 4).tolist())
+            self.assertEqual(summary.max.tolist(),
+                             expected.max(axis=1).tolist())
+        # The first two are the same tree
+        self.assertEqual(matrix[0, 1], 0)
+        # Six leaves have at most three nontrivial splits each unrooted
+        matrix, summary = rf_matrix(self.trees.split(';')[:-1],
+                                    TaxonNamespace())
+        self.assertEqual(summary.splits.tolist(), [3, 3, 3, 3, 3])
+        self.assertTrue(np.all(summary.normalized <= 1))
+
+    def test_read(self):
+        taxa = TaxonNamespace()
+        matrix, _ = read_rf(io.StringIO(self.trees), taxa)
+        pooled, _ = read_rf(io.StringIO(self.trees), taxa, processes=2)
+        self.assertEqual(pooled.tolist(), matrix.tolist())
+        # Workers spawned as they are from inside QGIS
+        spawned, _ = read_rf(io.StringIO(self.trees), taxa, processes=2,
+                             context=multiprocessing.get_context('spawn'))
+        self.assertEqual(spawned.tolist(), matrix.tolist())
+        self.assertEqual(matrix.tolist(), self.brute_force().tolist())
+
+    def test_other_taxa(self):
+        with self.assertRaises(ValueError):
+            rf_matrix(['((A,B),(C,D));', '((A,B),(C,E));'],
+                      TaxonNamespace())
+
+    def test_empty(self):
+        matrix, summary = rf_matrix([], TaxonNamespace())
+        self.assertEqual(matrix.shape, (0, 0))
+        matrix, summary = rf_matrix(['((A,B),(C,D));'], TaxonNamespace())
+        self.assertEqual(matrix.tolist(), [[0]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+"""
+    Tests for splits of trees as bitsets of taxa
+"""
+import io
+import multiprocessing
+import unittest
+
+from phylo_tree.trees.taxa import TaxonNamespace, loads, stream
+from phylo_tree.trees.splits import (
+    as_ints, count_splits, leaf_ranges, members, read_splits, splits)
+
+
+def labelled(split_ints, taxa):
+    return sorted(''.join(sorted(members(s, taxa))) for s in split_ints)
+
+
+class SplitsTest(unittest.TestCase):
+
+    newick = '((A:1,B:2)ab:1,(C:1,(D:.5,E)de:3)90:2)root;'
+
+    def test_leaf_ranges(self):
+        taxa = TaxonNamespace()
+        taxon, lo, hi = leaf_ranges('( A , (B,C)x, D);', taxa)
+        self.assertEqual(taxa.labels, list('ABCD'))
+        self.assertEqual(taxon.tolist(), [0, 1, 2, 3])
+        self.assertEqual(lo.tolist(), [0, 1])
+        self.assertEqual(hi.tolist(), [4, 3])
+
+    def test_splits(self):
+        taxa = TaxonNamespace()
+        unrooted = as_ints(splits(self.newick, taxa))
+        self.assertEqual(labelled(unrooted, taxa), ['CDE', 'DE'])
+        rooted = as_ints(splits(self.newick, taxa, rooted=True))
+        self.assertEqual(labelled(rooted, taxa), ['AB', 'CDE', 'DE'])
+        # Same splits from the parsed tree
+        tree = loads(self.newick, taxa)[0]
+        self.assertEqual(sorted(as_ints(splits(tree))), sorted(unrooted))
+        self.assertEqual(sorted(as_ints(splits(tree, rooted=True))),
+                         sorted(rooted))
+
+    def test_unrooted(self):
+        taxa = TaxonNamespace()
+        # The same unrooted tree, rooted in different places
+        first = as_ints(splits('((A,B),(C,(D,E)));', taxa))
+        second = as_ints(splits('(D,E,(C,(B,A)));', taxa))
+        self.assertEqual(sorted(first), sorted(second))
+        self.assertNotEqual(
+            sorted(as_ints(splits('((A,B),(C,(D,E)));', taxa, True))),
+            sorted(as_ints(splits('(D,E,(C,(B,A)));', taxa, True))))
+
+    def test_wide(self):
+        taxa = TaxonNamespace()
+        labels = ['t%d' % i for i in range(150)]
+        newick = '((%s),(%s));' % (','.join(labels[:70]),
+                                   ','.join(labels[70:]))
+        split, = splits(newick, taxa)
+        self.assertEqual(len(split), 3)
+        self.assertEqual(members(as_ints(split[None])[0], taxa),
+                         labels[70:])
+
+    def test_errors(self):
+        taxa = TaxonNamespace()
+        with self.assertRaises(ValueError):
+            splits('((A,B),(A,C));', taxa)
+        with self.assertRaises(ValueError):
+            splits('((A,B),(C,D);', taxa)
+        with self.assertRaises(ValueError):
+            splits('((A,B),(,D));', taxa)
+
+    def test_comments(self):
+        # BEAST annotations hold commas, which are not more leaves
+        taxa = TaxonNamespace()
+        annotated = splits('((A[&rate={1,2}]:1,B)[&p=1,q=2],(C,D));', taxa)
+        plain = splits('((A:1,B),(C,D));', taxa)
+        self.assertEqual(annotated.tolist(), plain.tolist())
+        self.assertEqual(taxa.labels, ['A', 'B', 'C', 'D'])
+
+    def test_count(self):
+        trees = ('((A,B),(C,(D,E)));\n'
+                 '((B,A),((E,D),C));\n'
+                 '((A,C),(B,(D,E)));\n')
+        taxa = TaxonNamespace()
+        counter, total = read_splits(io.StringIO(trees), taxa)
+        self.assertEqual(total, 3)
+        self.assertEqual(
+            {''.join(members(s, taxa)): n for s, n in counter.items()},
+            {'CDE': 2, 'DE': 3, 'BDE': 1})
+        pooled, total = read_splits(io.StringIO(trees), TaxonNamespace(),
+                                    processes=2)
+        self.assertEqual((pooled, total), (counter, 3))
+        # Workers spawned as they are from inside QGIS
+        spawned = read_splits(io.StringIO(trees), TaxonNamespace(),
+                              processes=2,
+                              context=multiprocessing.get_context('spawn'))
+        self.assertEqual(spawned, (counter, 3))
+        self.assertEqual(count_splits(loads(trees, taxa), taxa)[0], counter)
+
+    def test_stream(self):
+        trees = '(A,B)x;\n(C,D);\n\n(E,(F,G));'
+        self.assertEqual([t.strip() for t in stream(io.StringIO(trees), 4)],
+                         ['(A,B)x', '(C,D)', '(E,(F,G))'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+"""
+    Tests for taxon namespaces and trees of taxon ids
+"""
+import unittest
+
+import numpy as np
+
+from phylo_tree.trees.newick import loads as load_nodes
+from phylo_tree.trees.flat import FlatTree
+from phylo_tree.trees.taxa import TaxonNamespace, TaxonTree, loads
+
+
+class TaxaTest(unittest.TestCase):
+
+    newick = ('((A:1,B:2)ab:1,(C:1,(D:.5,E)de:3)90:2)root;'
+              '(B,(A,(E,C)),D);')
+
+    def test_namespace(self):
+        taxa = TaxonNamespace(['A', 'B'])
+        self.assertEqual(taxa.add('C'), 2)
+        self.assertEqual(taxa.add('A'), 0)
+        self.assertEqual(taxa['B'], 1)
+        self.assertEqual(taxa.ids(['C', 'Z', 'A']).tolist(), [2, -1, 0])
+        taxa.frozen = True
+        with self.assertRaises(KeyError):
+            taxa.add('Z')
+
+    def test_parse(self):
+        taxa = TaxonNamespace()
+        first, second = loads(self.newick, taxa)
+        self.assertEqual(taxa.labels, list('ABCDE'))
+        # Same arrays as the flat form of the parsed nodes
+        for tree, root in zip((first, second), load_nodes(self.newick)):
+            flat = FlatTree(root)
+            self.assertEqual(tree.parent.tolist(), flat.parent.tolist())
+            self.assertEqual(tree.length.tolist(), flat.length.tolist())
+            self.assertEqual(tree.has_lengths, flat.has_lengths)
+            self.assertEqual(
+                [taxa.labels[t] if t >= 0 else None
+                 for t in tree.taxon.tolist()],
+                [n.name if not n.descendants else None for n in flat.nodes])
+            from_flat = TaxonTree.from_flat(flat, taxa)
+            self.assertTrue(np.array_equal(from_flat.taxon, tree.taxon))
+        self.assertEqual(first.names, {0: 'root', 1: 'ab', 4: '90', 6: 'de'})
+        self.assertEqual(first.leaves().tolist(), [2, 3, 5, 7, 8])
+        with self.assertRaises(ValueError):
+            TaxonTree.parse('((A,B)', taxa)
+
+    def test_shared_labels(self):
+        taxa = TaxonNamespace()
+        trees = load_nodes(self.newick, taxa=taxa)
+        a = [n for n in trees[0].walk() if n.name == 'A'][0]
+        b = [n for n in trees[1].walk() if n.name == 'A'][0]
+        self.assertIs(a.name, b.name)
+        self.assertEqual((a.taxon, b.taxon), (0, 0))
+        self.assertIsNone(trees[0].taxon)
+
+
+if __name__ == '__main__':
+    unittest.main()
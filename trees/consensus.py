@@ -0,0 +1,255 @@
+"""
+    Summary trees of a sample of trees, such as a Bayesian posterior.
+
+    A streamed pass over the trees counts each clade of the rooted
+    trees, keyed by the int bitset of its taxa, and sums the length of
+    the branch above it and its height, its distance below the tip
+    furthest from the root. Only the clades are kept, not the trees.
+
+    The majority-rule consensus tree has the clades found in more than
+    half of the trees. These are all compatible, so taken from largest
+    to smallest each hangs from the smallest clade taken before that
+    holds one of its taxa. The maximum clade credibility tree is the
+    sampled tree with the largest product of the frequencies of its
+    clades, found by a second pass keeping only the best tree so far.
+
+    Nodes of the summary trees have the fraction of the trees with
+    their clade as `support`, and the mean height of the clade as
+    `height`.
+"""
+import math
+import os
+import pathlib
+
+from phylo_tree.trees import nexus
+from phylo_tree.trees.newick import Node
+from phylo_tree.trees.splits import as_ints, range_bits
+from phylo_tree.trees.taxa import TaxonNamespace, TaxonTree, stream
+
+METHODS = ['consensus', 'mcc']
+# Trees read between progress reports
+REPORT = 100
+
+
+def taxa_of(clade):
+    """Taxon ids of the bits of an int bitset, in increasing order"""
+    out = []
+    while clade:
+        low = clade & -clade
+        out.append(low.bit_length() - 1)
+        clade ^= low
+    return out
+
+
+class CladeStats(object):
+    """
+    Clades of a sample of rooted trees over a namespace of taxa.
+
+    :ivar clades: Number of trees with each clade, and the sums of its\
+        branch lengths and heights in them, by int bitset.
+    :ivar trees: Number of trees added.
+    """
+
+    def __init__(self, taxa):
+        self.taxa = taxa
+        self.clades = {}
+        self.trees = 0
+
+    def keys(self, tree):
+        """Int bitsets of the clades of the nodes of a `TaxonTree`"""
+        rank, lo, hi = tree.leaf_ranks()
+        taxon = tree.taxon[rank >= 0]
+        if (taxon < 0).any():
+            raise ValueError('unlabelled leaf')
+        return as_ints(range_bits(taxon, lo, hi)[0])
+
+    def add(self, tree):
+        """
+        Count the clades of a `TaxonTree`, returning the int bitsets of
+        the clades of its nodes.
+        """
+        distance = tree.distances()
+        height = distance[tree.is_leaf].max() - distance
+        clades = self.clades
+        keys = self.keys(tree)
+        for key, length, h in zip(keys, tree.length.tolist(),
+                                  height.tolist()):
+            entry = clades.get(key)
+            if entry is None:
+                clades[key] = [1, length, h]
+            else:
+                entry[0] += 1
+                entry[1] += length
+                entry[2] += h
+        self.trees += 1
+        return keys
+
+    def support(self, clade):
+        """Fraction of the trees with a clade"""
+        entry = self.clades.get(clade)
+        return entry[0] / self.trees if entry else 0.
+
+    def credibility(self, tree):
+        """
+        Sum of the logarithms of the support of the clades of the inner
+        nodes of a `TaxonTree`, minus infinity if one was never seen.
+        """
+        inner = (~tree.is_leaf).tolist()
+        total = 0.
+        for key, is_inner in zip(self.keys(tree), inner):
+            if is_inner:
+                support = self.support(key)
+                if not support:
+                    return -math.inf
+                total += math.log(support)
+        return total
+
+    def annotate(self, node, clade):
+        """Set the `support` and mean `height` of a clade on a `Node`"""
+        entry = self.clades.get(clade)
+        node.support = entry[0] / self.trees if entry else 0.
+        node.height = entry[2] / entry[0] if entry else None
+
+
+def majority_rule(stats, threshold=.5):
+    """
+    Majority-rule consensus tree of the clades of `stats`, as a `Node`.
+
+    :param threshold: Fraction of the trees a clade must be found in\
+        more than, at least one half. Branch lengths are the mean ones.
+    """
+    if not .5 <= threshold < 1:
+        raise ValueError('The threshold must be from 0.5 to 1')
+    if not stats.trees:
+        raise ValueError('No trees')
+    labels = stats.taxa.labels
+    chosen = [(taxa_of(key), entry) for key, entry in stats.clades.items()
+              if entry[0] > threshold * stats.trees or not key & (key - 1)]
+    chosen.sort(key=lambda item: (-len(item[0]), item[0][0]))
+
+    root = None
+    smallest = {}
+    for taxa, (count, length, height) in chosen:
+        leaf = len(taxa) == 1
+        node = Node.create(name=labels[taxa[0]] if leaf else None,
+                           taxon=taxa[0] if leaf else None)
+        node.length = length / count
+        node.support = count / stats.trees
+        node.height = height / count
+        parent = smallest.get(taxa[0])
+        if parent is not None:
+            node.ancestor = parent
+            parent.descendants.append(node)
+        elif root is None:
+            root = node
+            root.length = None
+        else:
+            raise ValueError('The trees have different taxa')
+        for taxon in taxa:
+            smallest[taxon] = node
+    return root
+
+
+def as_node(tree, stats, mean_heights=True):
+    """
+    `Node` of a `TaxonTree`, with the support and mean height of its
+    clades in `stats`.
+
+    :param mean_heights: Give the branches the lengths between the mean\
+        heights of their clades rather than their own.
+    """
+    labels = tree.taxa.labels
+    keys = stats.keys(tree)
+    parent = tree.parent.tolist()
+    nodes = []
+    for i, (taxon, length) in enumerate(zip(tree.taxon.tolist(),
+                                            tree.length.tolist())):
+        name = labels[taxon] if taxon >= 0 else tree.names.get(i)
+        node = Node.create(name=name, taxon=taxon if taxon >= 0 else None)
+        stats.annotate(node, keys[i])
+        if i:
+            up = nodes[parent[i]]
+            node.ancestor = up
+            up.descendants.append(node)
+            if mean_heights and node.height is not None and \
+                    up.height is not None:
+                node.length = max(up.height - node.height, 0.)
+            elif tree.has_lengths:
+                node.length = length
+        nodes.append(node)
+    return nodes[0]
+
+
+def max_clade_credibility(trees, stats, strip_comments=False,
+                          mean_heights=True):
+    """
+    The tree of `trees` with the largest clade credibility, as a `Node`.
+
+    :param trees: Iterable of `TaxonTree` or Newick strings over the\
+        namespace of `stats`, consumed one at a time.
+    """
+    best, score = None, -math.inf
+    for tree in trees:
+        if not isinstance(tree, TaxonTree):
+            tree = TaxonTree.parse(tree, stats.taxa, strip_comments)
+        credibility = stats.credibility(tree)
+        if best is None or credibility > score:
+            best, score = tree, credibility
+    if best is None:
+        raise ValueError('No trees')
+    return as_node(best, stats, mean_heights)
+
+
+def sample(path, taxa, progress=None):
+    """
+    Newick strings of the trees of a Newick or NEXUS file, streamed,
+    with the labels of a NEXUS translate statement added to `taxa`.
+    Comments are left in Newick files, so parse with `strip_comments`.
+
+    :param progress: Called every few trees with the fraction of the\
+        file read.
+    """
+    is_nexus = nexus.is_nexus(path)
+    size = os.path.getsize(path) or 1
+    with pathlib.Path(path).open(encoding='utf8') as fp:
+        trees = nexus.trees(fp, taxa) if is_nexus else stream(fp)
+        for k, tree in enumerate(trees):
+            if progress is not None and k % REPORT == 0:
+                progress(fp.buffer.tell() / size)
+            yield tree
+
+
+def summarize(path, method='consensus', threshold=.5, mean_heights=True,
+              progress=None):
+    """
+    Summary tree of the trees of a Newick or NEXUS file, streamed.
+
+    :param method: 'consensus' for the majority-rule consensus tree, or\
+        'mcc' for the maximum clade credibility tree, which reads the\
+        file a second time.
+    :param progress: Called from time to time with the fraction done.
+    :return: Root `Node` of the summary tree.
+    """
+    if method not in METHODS:
+        raise ValueError('Unknown summary {}'.format(method))
+    taxa = TaxonNamespace()
+    passes = 2 if method == 'mcc' else 1
+
+    def parsed(done):
+        def report(fraction):
+            progress((done + fraction) / passes)
+
+        for tree in sample(path, taxa, progress and report):
+            yield TaxonTree.parse(tree, taxa, strip_comments=True)
+
+    stats = CladeStats(taxa)
+    for tree in parsed(0):
+        stats.add(tree)
+    if method == 'consensus':
+        root = majority_rule(stats, threshold)
+    else:
+        root = max_clade_credibility(parsed(1), stats,
+                                     mean_heights=mean_heights)
+    if progress is not None:
+        progress(1.)
+    return root
@@ -0,0 +1,200 @@
+"""
+    Patristic distances between the leaves of a tree.
+
+    The distance between two leaves is the sum of their distances from
+    the root less twice that of their most recent common ancestor. With
+    the leaves in preorder, the common ancestor of leaves i < j is the
+    one of the common ancestors of neighbouring leaves i, i + 1 up to
+    j - 1, j that comes first in preorder, as it is an ancestor of all
+    of them. A row of the matrix is therefore a running minimum over
+    the ancestors of neighbouring leaves, in both directions from the
+    row's leaf, and costs a few array operations per entry.
+
+    Rows are computed in blocks of bounded size, optionally by a pool
+    of processes, and written to a memory mapped file once the matrix
+    would not fit in the given memory. Distances are single precision.
+"""
+import multiprocessing
+import os
+import tempfile
+
+import numpy as np
+
+from phylo_tree.trees.flat import FlatTree
+from phylo_tree.trees.lca import LCAIndex
+
+# Matrices larger than this are written to a memory mapped file
+MEMORY = 2 ** 30
+# Size of a block of rows computed at once
+BLOCK_BYTES = 2 ** 26
+
+
+def condensed_offset(i, n):
+    """
+    Position of the pair (i, i + 1) in the condensed matrix of `n`
+    leaves, the upper triangle by rows as in `scipy.spatial.distance`.
+    """
+    return i * n - i * (i + 1) // 2
+
+
+def neighbour_ancestors(tree, leaves):
+    """
+    Common ancestor of each pair of neighbouring `leaves`, node indices
+    in increasing preorder.
+    """
+    leaves = np.asarray(leaves, dtype=np.int64)
+    if len(leaves) < 2:
+        return np.empty(0, dtype=np.int64)
+    return np.asarray(LCAIndex(tree).mrca(leaves[:-1], leaves[1:]),
+                      dtype=np.int64)
+
+
+def distance_rows(lo, hi, ancestors, tips, distance, condensed=False):
+    """
+    Rows `lo` to `hi` of the distance matrix, as a (hi - lo, n) array or
+    for a condensed matrix the concatenation of the upper triangle of
+    the rows.
+
+    :param ancestors: Common ancestors of neighbouring leaves, from\
+        `neighbour_ancestors`.
+    :param tips: Distance from the root of each leaf.
+    :param distance: Distance from the root of each node.
+    """
+    n = len(tips)
+    if condensed:
+        out = np.empty(condensed_offset(hi, n) - condensed_offset(lo, n),
+                       dtype=np.float32)
+    else:
+        out = np.empty((hi - lo, n), dtype=np.float32)
+    at = 0
+    for r, i in enumerate(range(lo, hi)):
+        right = np.minimum.accumulate(ancestors[i:])
+        row = tips[i] + tips[i + 1:] - 2 * distance[right]
+        if condensed:
+            out[at:at + len(row)] = row
+            at += len(row)
+            continue
+        left = np.minimum.accumulate(ancestors[:i][::-1])[::-1]
+        out[r, :i] = tips[i] + tips[:i] - 2 * distance[left]
+        out[r, i] = 0
+        out[r, i + 1:] = row
+    return out
+
+
+# Arrays shared with the worker processes of a pool
+_shared = {}
+
+
+def _init_worker(ancestors, tips, distance, condensed, path, shape):
+    _shared.update(ancestors=ancestors, tips=tips, distance=distance,
+                   condensed=condensed, path=path, shape=shape)
+
+
+def _worker_block(bounds):
+    lo, hi = bounds
+    s = _shared
+    rows = distance_rows(lo, hi, s['ancestors'], s['tips'], s['distance'],
+                         s['condensed'])
+    if s['path'] is None:
+        return bounds, rows
+    # Written straight into the file, so only the bounds go back
+    out = np.memmap(s['path'], dtype=np.float32, mode='r+',
+                    shape=s['shape'])
+    _store(out, lo, hi, rows, s['condensed'], len(s['tips']))
+    out.flush()
+    return bounds, None
+
+
+def _store(out, lo, hi, rows, condensed, n):
+    if condensed:
+        out[condensed_offset(lo, n):condensed_offset(hi, n)] = rows
+    else:
+        out[lo:hi] = rows
+
+
+def patristic(tree, leaves=None, condensed=False, memory=MEMORY, path=None,
+              processes=None, progress=None, distance=None, context=None):
+    """
+    Patristic distances between leaves of a tree.
+
+    :param tree: A `FlatTree` or a root `Node`.
+    :param leaves: Node indices of the leaves, in increasing preorder,\
+        by default all of them.
+    :param condensed: Return the upper triangle of the matrix by rows,\
+        as `scipy.spatial.distance.pdist` does, instead of all of it.
+    :param memory: Size in bytes above which the matrix is written to a\
+        memory mapped file.
+    :param path: File for the memory mapped matrix, a temporary file by\
+        default that the caller removes once done, as `out.filename`.\
+        Giving a path always maps the matrix to it.
+    :param processes: Number of processes computing blocks of rows, or\
+        None to compute them in this one.
+    :param progress: Called with the fraction of the rows done, if given.
+    :param distance: Distance of each node from the root, by default\
+        along the branch lengths. Depths give distances in edges.
+    :param context: `multiprocessing` context the processes are started\
+        from, the default one if not given.
+    :return: Tuple of the leaf indices and the float32 matrix.
+    """
+    flat = tree if isinstance(tree, FlatTree) else FlatTree(tree)
+    if leaves is None:
+        leaves = flat.leaves()
+    leaves = np.asarray(leaves, dtype=np.int64)
+    if np.any(np.diff(leaves) <= 0):
+        raise ValueError('leaves must be in increasing preorder')
+    n = len(leaves)
+    if distance is None:
+        distance = flat.measures().distance
+    distance = np.asarray(distance, dtype=np.float64)
+    tips = distance[leaves]
+    ancestors = neighbour_ancestors(flat, leaves)
+
+    shape = (condensed_offset(n, n),) if condensed else (n, n)
+    nbytes = 4 * int(np.prod(shape))
+    if path is None and nbytes > memory:
+        handle, path = tempfile.mkstemp(suffix='.f32')
+        os.close(handle)
+    if path is None or not nbytes:
+        # An empty file can't be mapped
+        path = None
+        out = np.empty(shape, dtype=np.float32)
+    else:
+        out = np.memmap(path, dtype=np.float32, mode='w+', shape=shape)
+    if not n:
+        return leaves, out
+
+    rows = max(1, BLOCK_BYTES // (4 * n))
+    blocks = [(lo, min(lo + rows, n)) for lo in range(0, n, rows)]
+    done = 0
+    if processes:
+        if path is not None:
+            out.flush()
+        pool = (context or multiprocessing).Pool(
+            processes, _init_worker,
+            (ancestors, tips, distance, condensed, path, shape))
+        try:
+            for (lo, hi), block in pool.imap_unordered(_worker_block,
+                                                       blocks):
+                if block is not None:
+                    _store(out, lo, hi, block, condensed, n)
+                done += hi - lo
+                if progress is not None:
+                    progress(done / n)
+        except BaseException:
+            # Such as a cancelled progress callback
+            pool.terminate()
+            raise
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for lo, hi in blocks:
+            block = distance_rows(lo, hi, ancestors, tips, distance,
+                                  condensed)
+            _store(out, lo, hi, block, condensed, n)
+            done += hi - lo
+            if progress is not None:
+                progress(done / n)
+    if path is not None:
+        out.flush()
+    return leaves, out
@@ -12,6 +12,11 @@ import random
 from math import sin, cos, radians
 from phylo_tree.trees.indent import read as read_indent
 from phylo_tree.trees.newick import read as read_newick
+from phylo_tree.trees import phylogram
+from phylo_tree.trees.consensus import summarize
+from phylo_tree.trees.nexus import read_tree as read_nexus
+
+NEXUS_EXTENSIONS = ('.nex', '.nexus', '.trees', '.tre')
 
 class DrawTree(object):
     def __init__(self, tree, parent=None, depth=0, number=1):
@@ -60,10 +65,12 @@ class DrawTree(object):
         """
         Traverse the whole tree and yield each visited node in preorder
         """
-        yield self
-        for node in self.children:
-            for n in node.walk():
-                yield n
+        # Explicit stack: nested generators cost O(depth) per node
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.children))
 
     def leaves(self):
         """
@@ -140,94 +147,78 @@ class DrawTree(object):
         Transform the coordinates of the tree to a rectangular phylogram.
         All leaf nodes are drawn at the 'base'
         """
-        leaves = []
-        
-        def first_walk(t, depth):
-            for node in t.children:
-                first_walk(node, depth + 1)
-            if not t.children:
-                t.y = len(leaves)
-                leaves.append(t)
-            t.x = depth
-
-        def second_walk(t):
-            for node in t.children:
-                second_walk(node)
-            if t.children:
-                t.y = sum([c.y for c in t.children]) / len(t.children)
-            else:
-                t.x = max([l.x for l in leaves])
-
-        first_walk(self, 0)
-        second_walk(self)
-        self.max_depth = max([l.x for l in leaves])
-
-    def construct_phylogram(self, orientation=None):
+        xs, ys = phylogram.coordinates(self.tree)
+        for node, x, y in zip(self.walk(), xs.tolist(), ys.tolist()):
+            node.x, node.y = x, y
+        self.max_depth = float(xs.max())
+
+    def construct_phylogram(self, elbows=False):
         """
-        Using the current coordinates of the tree, return a list of lines
-        that can be used to draw it as a rectangular phylogram.
-        Returns a list of (name, (x, y), (x, y) ) tuples
+        Lines to draw the tree as a rectangular phylogram, as an
+        (N, 2, 2) array of segments, or with `elbows` an (N, 3, 2) array
+        holding one polyline per node. See `phylogram.segments` and
+        `phylogram.elbows`.
         """
         # FIXME this actually a cladogram as it only represents the
         # topology rather than a phylogram that represents distance as
         # length
-        max_x   = self.max_depth
-        space_x = (self.x + self.children[0].x) / 2
-        out     = []
-
-        def horizontal(node):
-            if not node.children:
-                start = Point(node.parent.x + space_x, node.y)
-            else:
-                start = Point(node.x - space_x, node.y)
-            end = Point(node.x + space_x, node.y)
-            return Line(start, end)
-
-        def vertical(node):
-            x     = node.x + space_x
-            start = Point(x, node.children[0].y)
-            end   = Point(x, node.children[-1].y)
-            return Line(start, end)
-
-        for node in self.walk():
-            out.append(horizontal(node))
-            if node.children:
-                out.append(vertical(node))
-
-        return out
+        if elbows:
+            return phylogram.elbows(self.tree)
+        return phylogram.segments(self.tree)[0]
 
 def rotate_phylogram(lines, angle):
     """
-    I have a list of Lines and I want to rotate them around the
-    centre of the tree's bounding box
+    Rotate an array of phylogram lines around the centre of the
+    tree's bounding box
     """
-    # Find the corners of the tree
-    all_points = [point for line in lines for point in line]
-    xs, ys = zip(*all_points)
-    a = Line( (min(xs), min(ys)), (max(xs), max(ys)) )
-    b = Line( (min(xs), max(ys)), (max(xs), min(ys)) )
-    
-    centre = a.intersection(b)
+    return phylogram.rotate(lines, angle)
 
-    rotated = [line.rotate(angle, centre) for line in lines]
-
-    return rotated
-        
-    @property
-    def coord(self):
-        return (self.x, self.y)
+class Ticker(object):
+    """
+    Counts visited nodes and reports the fraction of `total` done to
+    `progress` every `every` nodes, scaled into [start, end].
+    """
 
-    def __str__(self):
-        return "%s: x=%s mod=%s" % (self.tree, self.x, self.mod)
+    def __init__(self, total, progress, start=0., end=1., every=1000):
+        self.total = total or 1
+        self.progress = progress
+        self.start = start
+        self.span = end - start
+        self.every = every
+        self.count = 0
 
-    def __repr__(self):
-        return self.__str__()
+    def __call__(self):
+        self.count += 1
+        if self.count % self.every == 0:
+            self.progress(self.start + self.span * self.count / self.total)
 
-def buchheim(tree):
-    dt = firstwalk(DrawTree(tree))
-    min = second_walk(dt)
+def buchheim(tree, progress=None, children=None):
+    """
+    Lay out `tree` and return the root DrawTree. `progress`, if given,
+    is called from time to time with the fraction of the work done.
+    `children`, if given, lists the children of each node in preorder
+    by their preorder indices, as in a `FlatTree`, to draw them in
+    that order instead.
+    """
+    dt = DrawTree(tree)
+    if children is not None:
+        nodes = list(dt.walk())
+        for node, kids in zip(nodes, children):
+            node.children = [nodes[k] for k in kids]
+            for number, child in enumerate(node.children, 1):
+                child.number = number
+    tick = None
+    if progress is not None:
+        total = sum(1 for _ in dt.walk())
+        tick = Ticker(total, progress, 0., .5)
+    dt = firstwalk(dt, tick=tick)
+    if tick is not None:
+        tick = Ticker(total, progress, .5, 1.)
+    min = second_walk(dt, tick=tick)
     if min < 0:
         third_walk(dt, -min)
+    if progress is not None:
+        progress(1.)
     return dt
 
 def third_walk(tree, n):
@@ -235,7 +226,9 @@ def third_walk(tree, n):
     for c in tree.children:
         third_walk(c, n)
 
-def firstwalk(v, distance=1.):
+def firstwalk(v, distance=1., tick=None):
+    if tick is not None:
+        tick()
     if len(v.children) == 0:
         if v.lmost_sibling:
             v.x = v.lbrother().x + distance
@@ -244,7 +237,7 @@ def firstwalk(v, distance=1.):
     else:
         default_ancestor = v.children[0]
         for w in v.children:
-            firstwalk(w)
+            firstwalk(w, tick=tick)
             default_ancestor = apportion(w, default_ancestor, distance)
         execute_shifts(v)
 
@@ -321,7 +314,9 @@ def ancestor(vil, v, default_ancestor):
     else:
         return default_ancestor
 
-def second_walk(v, m=0, depth=0, min=None):
+def second_walk(v, m=0, depth=0, min=None, tick=None):
+    if tick is not None:
+        tick()
     v.x += m
     v.y = depth
 
@@ -329,32 +324,63 @@ def second_walk(v, m=0, depth=0, min=None):
         min = v.x
 
     for w in v.children:
-        min = second_walk(w, m + v.mod, depth+1, min)
+        min = second_walk(w, m + v.mod, depth+1, min, tick)
 
     return min
 
-def buildtree(path):
-    """The entry point into this module.
-
-    Takes a path to a tree in a supported file format and returns
-    a DrawTree object with coordinates and labels set up, ready
-    for use in QGIS API.
+def readtree(path, progress=None, summary=None):
+    """
+    Read the tree in `path` into a Node tree. The first tree is
+    returned if the file contains several, unless `summary` names a
+    summary tree of them all from `consensus.METHODS`.
     """
     _, ext = os.path.splitext(path)
-    if ext == '.nwk':
-        nodetree = read_newick(path)
+    if summary:
+        nodetree = summarize(path, summary, progress=progress)
+    elif ext == '.nwk':
+        nodetree = read_newick(path, progress=progress)[0]
     elif ext == '.txt':
         nodetree = read_indent(path)
+    elif ext in NEXUS_EXTENSIONS:
+        nodetree = read_nexus(path)
     else:
         raise ValueError('Unsupported file type {}'.format(ext))
+    return nodetree
 
-    drawtree = buchheim(nodetree)
+def layout(nodetree, progress=None):
+    """
+    Lay out a Node tree, returning a DrawTree with coordinates and
+    labels set up.
+    """
+    drawtree = buchheim(nodetree, progress)
     for node in drawtree.walk():
         node.name = node.tree.name
         node.length = node.tree.length
 
     return drawtree
 
+def with_coords(nodetree, coords):
+    """
+    Build a DrawTree for `nodetree` with the (x, y) coordinates of a
+    previous layout, in preorder, instead of laying it out again.
+    """
+    drawtree = DrawTree(nodetree)
+    for node, (x, y) in zip(drawtree.walk(), coords):
+        node.x, node.y = x, y
+        node.name = node.tree.name
+        node.length = node.tree.length
+
+    return drawtree
+
+def buildtree(path):
+    """The entry point into this module.
+
+    Takes a path to a tree in a supported file format and returns
+    a DrawTree object with coordinates and labels set up, ready
+    for use in QGIS API.
+    """
+    return layout(readtree(path))
+
 class Point(object):
     """A point in the 2D plane. What else is there to say?"""
 
@@ -419,7 +445,7 @@ class Line(object):
         """Return the point of intersection this and `line`"""
         try:
             x = (self.intercept - line.intercept) / (line.slope - self.slope)
-            y = self.slope * (x + self.intercept)
+            y = self.slope * x + self.intercept
         except ZeroDivisionError:
             return False
         return Point(x, y)
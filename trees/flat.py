@@ -0,0 +1,220 @@
+"""
+    Flat, array based representation of a tree.
+
+    Nodes are numbered in preorder, which is the order in which both
+    `Node.walk` and `DrawTree.walk` visit them, so index `i` of every
+    array refers to the i-th node yielded by `walk()`. Iterating over
+    the indices in reverse visits every child before its parent,
+    which is all a postorder pass needs.
+"""
+import hashlib
+from collections import namedtuple
+
+import numpy as np
+
+from phylo_tree.cache import tree_cache, FLAT_NODE_BYTES
+
+MASK = (1 << 64) - 1
+
+# Per node measures of a tree, arrays in preorder
+Measures = namedtuple('Measures', ['depth', 'distance', 'height', 'tips'])
+
+
+def label_hash(label):
+    """Unsigned 64 bit hash of a leaf label, the same in every run"""
+    digest = hashlib.blake2b((label or '').encode('utf8'),
+                             digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+
+def mix(h):
+    """Scramble a 64 bit hash into another (splitmix64 finalizer)"""
+    h = ((h ^ (h >> 30)) * 0xbf58476d1ce4e5b9) & MASK
+    h = ((h ^ (h >> 27)) * 0x94d049bb133111eb) & MASK
+    return h ^ (h >> 31)
+
+
+class FlatTree(object):
+    """
+    Arrays describing the topology and branch lengths of a tree made
+    of `Node` objects (anything with `descendants`, `name` and
+    `length` attributes).
+
+    :ivar nodes: The original nodes, in preorder.
+    :ivar parent: Index of each node's parent, -1 for the root.
+    :ivar children: List of child indices for each node.
+    :ivar length: Branch length from each node to its parent.
+    :ivar has_lengths: False if no node of the tree has a length.
+    """
+
+    def __init__(self, root):
+        nodes = []
+        parent = []
+        children = []
+        lengths = []
+        has_lengths = False
+        # Iterative preorder so deep trees don't hit the recursion limit
+        stack = [(root, -1)]
+        while stack:
+            node, p = stack.pop()
+            i = len(nodes)
+            nodes.append(node)
+            parent.append(p)
+            children.append([])
+            if p >= 0:
+                children[p].append(i)
+            if getattr(node, '_length', node.length) is not None:
+                has_lengths = True
+            lengths.append(node.length or 0.0)
+            for child in reversed(node.descendants):
+                stack.append((child, i))
+
+        self.nodes = nodes
+        self.children = children
+        self.parent = np.array(parent, dtype=np.int64)
+        self.length = np.array(lengths, dtype=np.float64)
+        self.has_lengths = has_lengths
+        self._measures = None
+
+    def __len__(self):
+        return len(self.nodes)
+
+    @property
+    def names(self):
+        return [n.name for n in self.nodes]
+
+    @property
+    def is_leaf(self):
+        return np.array([not c for c in self.children], dtype=bool)
+
+    def leaves(self):
+        """Indices of the leaf nodes, in preorder"""
+        return np.flatnonzero(self.is_leaf)
+
+    def measures(self):
+        """
+        Depth of each node, its distance from the root along the branch
+        lengths, its height above the tip furthest from the root, and
+        the number of tips under it, as a `Measures` of arrays. Depths
+        and distances take one preorder pass, tip counts one postorder
+        pass, and the result is kept on the tree.
+        """
+        if self._measures is None:
+            n = len(self.nodes)
+            parent = self.parent.tolist()
+            length = self.length.tolist()
+            depth = [0] * n
+            distance = [0.] * n
+            for i in range(1, n):
+                p = parent[i]
+                depth[i] = depth[p] + 1
+                distance[i] = distance[p] + length[i]
+            leaf = self.is_leaf
+            tips = leaf.astype(np.int64).tolist()
+            for i in range(n - 1, 0, -1):
+                tips[parent[i]] += tips[i]
+            distance = np.array(distance)
+            self._measures = Measures(
+                np.array(depth, dtype=np.int64), distance,
+                distance[leaf].max() - distance,
+                np.array(tips, dtype=np.int64))
+        return self._measures
+
+    def subtree(self, keep):
+        """
+        The tree made of the nodes `keep` only, such as the nodes still
+        drawn after edits, with the nodes and branch lengths of this
+        one.
+
+        :param keep: Indices of the nodes in increasing preorder,\
+            including the root and the parent of every other one.
+        """
+        keep = np.asarray(keep, dtype=np.int64)
+        index = np.full(len(self.nodes), -1, dtype=np.int64)
+        index[keep] = np.arange(len(keep))
+        out = FlatTree.__new__(FlatTree)
+        out.nodes = [self.nodes[i] for i in keep.tolist()]
+        out.parent = np.where(keep > 0, index[self.parent[keep]], -1)
+        out.children = [[] for _ in range(len(keep))]
+        for i, p in enumerate(out.parent.tolist()):
+            if p >= 0:
+                out.children[p].append(i)
+        out.length = self.length[keep]
+        out.has_lengths = self.has_lengths
+        out._measures = None
+        return out
+
+    def sizes(self):
+        """Number of nodes in the subtree under each node, in preorder"""
+        parent = self.parent.tolist()
+        size = [1] * len(parent)
+        for i in range(len(parent) - 1, 0, -1):
+            size[parent[i]] += size[i]
+        return np.array(size, dtype=np.int64)
+
+    def intervals(self):
+        """
+        Preorder interval of each node: arrays (pre, post) such that the
+        subtree under node i is the nodes pre[i] to post[i] inclusive,
+        so node d descends from node a if pre[a] <= pre[d] <= post[a].
+        """
+        pre = np.arange(len(self.nodes), dtype=np.int64)
+        return pre, pre + self.sizes() - 1
+
+    def leaf_ranks(self):
+        """
+        Rank of each leaf among the leaves in preorder, and the range of
+        ranks of the leaves under each node.
+
+        :return: Tuple of arrays (rank, lo, hi), rank being -1 for inner\
+            nodes. The leaves under node i have the ranks lo[i] to hi[i]\
+            excluded, and are `leaves()[lo[i]:hi[i]]`.
+        """
+        leaf = self.is_leaf
+        count = np.cumsum(leaf)
+        rank = np.where(leaf, count - 1, -1)
+        _, post = self.intervals()
+        return rank, count - leaf, count[post]
+
+    def clade_ids(self):
+        """
+        Signed 64 bit identifiers of the nodes that depend only on the
+        labels of the leaves below them, so a clade keeps its id when
+        the rest of the tree changes or the file lists it in another
+        order. The id of a clade is the sum of the hashes of its leaf
+        labels, which needs a single postorder pass. Nodes that would
+        share an id, such as a node with a single child and that child,
+        have it rehashed in preorder until it is unique.
+        """
+        n = len(self.nodes)
+        parent = self.parent.tolist()
+        ids = [label_hash(node.name) if not children else 0
+               for node, children in zip(self.nodes, self.children)]
+        for i in range(n - 1, 0, -1):
+            ids[parent[i]] = (ids[parent[i]] + ids[i]) & MASK
+        seen = set()
+        for i in range(n):
+            h = ids[i]
+            while h in seen:
+                h = mix(h)
+            seen.add(h)
+            ids[i] = h
+        return np.array(ids, dtype=np.uint64).view(np.int64)
+
+
+def flat_tree(root):
+    """
+    The `FlatTree` of a root `Node`, kept in the tree cache along with
+    anything computed on it, and built again when the tree has changed.
+    Callers must not change the tree it returns.
+    """
+    key = ('flat', id(root))
+    cached = tree_cache.get(key)
+    # The cached entry holds on to its root, so the id can't be reused
+    if cached is not None and cached[0] is root and \
+            cached[1] == root.version and root.ancestor is None:
+        return cached[2]
+    flat = FlatTree(root)
+    tree_cache.put(key, (root, root.version, flat),
+                   FLAT_NODE_BYTES * len(flat))
+    return flat
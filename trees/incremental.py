@@ -0,0 +1,284 @@
+"""
+    Incremental tree layout.
+
+    Keeps, for every node, the offset of the node from its parent, the
+    height of its subtree and the deepest nodes of the left and right
+    contours of the subtree (the extreme nodes at each depth below
+    it), with their offsets. Contours are followed down from child to
+    child and, where a subtree is shallower than its siblings, along
+    threads to the next node of the contour in a sibling subtree, in
+    the manner of Reingold and Tilford: memory stays linear in the
+    size of the tree. Each thread belongs to the node whose children
+    it links, and is dropped when that node is placed again.
+
+    After collapsing, expanding or pruning a clade only the nodes on
+    the path from the clade to the root are placed again: children
+    are pushed apart until their contours are `distance` apart and the
+    parent is centered over them. Sibling subtrees whose offset
+    changed are then shifted in one go over their preorder range.
+
+    Edits cost time in the depth of the tree and the contours compared
+    along the path, not in its size, and report which nodes moved so
+    that only their features need rewriting.
+"""
+import numpy as np
+
+from phylo_tree.trees.flat import FlatTree
+from phylo_tree.cache import INCREMENTAL_NODE_BYTES
+
+
+class Change(object):
+    """
+    Nodes affected by an edit of an `IncrementalLayout`.
+
+    :ivar moved: Visible nodes whose position changed.
+    :ivar shown: Nodes drawn again, after an expand.
+    :ivar hidden: Nodes no longer drawn, after a collapse or prune.
+    """
+
+    def __init__(self, moved, shown=(), hidden=()):
+        self.moved = np.asarray(moved, dtype=np.int64)
+        self.shown = np.asarray(shown, dtype=np.int64)
+        self.hidden = np.asarray(hidden, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.moved) + len(self.shown) + len(self.hidden)
+
+
+class IncrementalLayout(object):
+    """
+    A layered tree layout that can be updated after local edits.
+
+    Node `i` is the i-th node of the tree in preorder and sits at
+    (`x[i]`, `depth[i]`).
+
+    :param tree: A `FlatTree` or a root `Node`.
+    :param xs: X coordinates of an existing layout to start from, such\
+        as `buchheim`'s, in preorder. The tree is laid out from\
+        scratch if not given.
+    :param distance: Minimum distance between neighbouring subtrees.
+    """
+
+    def __init__(self, tree, xs=None, distance=1.):
+        flat = tree if isinstance(tree, FlatTree) else FlatTree(tree)
+        n = len(flat)
+        self.tree = flat
+        self.distance = distance
+        self.parent = flat.parent
+        self.children = flat.children
+        parent = flat.parent.tolist()
+
+        # Depth, and end of the preorder range of each subtree
+        depth = [0] * n
+        for i in range(1, n):
+            depth[i] = depth[parent[i]] + 1
+        end = list(range(1, n + 1))
+        for i in range(n - 1, 0, -1):
+            if end[i] > end[parent[i]]:
+                end[parent[i]] = end[i]
+        self.depth = np.array(depth, dtype=np.int64)
+        self.end = end
+
+        self.collapsed = np.zeros(n, dtype=bool)
+        self.pruned = np.zeros(n, dtype=bool)
+        self.visible = np.ones(n, dtype=bool)
+        self.rel = np.zeros(n)
+        # Height of each subtree, its deepest left and right contour
+        # nodes with their offsets from it, the threads from a contour
+        # node to the next as (node, offset from it), and the nodes
+        # each node's placement threaded
+        self.height = [0] * n
+        self.extremes = [None] * n
+        self.left_thread = [None] * n
+        self.right_thread = [None] * n
+        self.threaded = {}
+        if xs is None:
+            for i in range(n - 1, -1, -1):
+                self._place(i)
+            self.x = np.zeros(n)
+            self._positions(0)
+        else:
+            self.x = np.array(xs, dtype=np.float64)
+            self.rel[1:] = self.x[1:] - self.x[flat.parent[1:]]
+            for i in range(n - 1, -1, -1):
+                self._place(i, keep=True)
+
+    def __len__(self):
+        return len(self.x)
+
+    @property
+    def size(self):
+        return INCREMENTAL_NODE_BYTES * len(self.x)
+
+    def coords(self, i):
+        return float(self.x[i]), float(self.depth[i])
+
+    def visible_children(self, i):
+        if self.collapsed[i]:
+            return []
+        return [c for c in self.children[i] if not self.pruned[c]]
+
+    # Edits
+
+    def collapse(self, i):
+        """Draw the clade of node `i` as a single leaf"""
+        if self.collapsed[i]:
+            return Change([])
+        self.collapsed[i] = True
+        hidden = self._hide(i + 1, self.end[i])
+        return self._update(i, hidden=hidden)
+
+    def expand(self, i):
+        """Draw the clade of a collapsed node `i` again"""
+        if not self.collapsed[i]:
+            return Change([])
+        self.collapsed[i] = False
+        shown = self._show(i) if self.visible[i] else []
+        return self._update(i, shown=shown)
+
+    def prune(self, i):
+        """Remove node `i` and its clade from the tree"""
+        p = int(self.parent[i])
+        if p < 0:
+            raise ValueError('The root cannot be pruned')
+        if self.pruned[i]:
+            return Change([])
+        self.pruned[i] = True
+        hidden = self._hide(i, self.end[i])
+        return self._update(p, hidden=hidden)
+
+    # Internals
+
+    def _hide(self, start, stop):
+        hidden = np.flatnonzero(self.visible[start:stop]) + start
+        self.visible[start:stop] = False
+        return hidden
+
+    def _show(self, i):
+        """Make the clade under an expanded node `i` visible again"""
+        start, stop = i + 1, self.end[i]
+        visible = np.ones(stop - start, dtype=bool)
+        # Clades still collapsed or pruned inside stay hidden
+        inner = np.flatnonzero(self.collapsed[start:stop] |
+                               self.pruned[start:stop]) + start
+        for j in inner.tolist():
+            first = j if self.pruned[j] else j + 1
+            visible[first - start:self.end[j] - start] = False
+        self.visible[start:stop] = visible
+        return np.flatnonzero(visible) + start
+
+    def _next(self, v, offset, right):
+        """
+        Next node down the left or right contour from `v`, and its
+        offset, from the offset of `v`.
+        """
+        kids = self.visible_children(v)
+        if kids:
+            c = kids[-1] if right else kids[0]
+            return c, offset + float(self.rel[c])
+        c, dx = (self.right_thread if right else self.left_thread)[v]
+        return c, offset + dx
+
+    def _place(self, i, keep=False):
+        """
+        Place the children of `i` from their contours, and set the
+        extremes of `i` and the threads between its children.
+
+        :param keep: Keep the offsets of the children as they are,\
+            only threading their contours.
+        """
+        # Drop the threads of the last placement, but not those since
+        # put in their place by the children
+        for thread, j, link in self.threaded.pop(i, ()):
+            if thread[j] is link:
+                thread[j] = None
+        kids = self.visible_children(i)
+        if not kids:
+            self.height[i] = 0
+            self.extremes[i] = (i, 0., i, 0.)
+            return
+        height, distance = self.height, self.distance
+        threads = []
+        # Offsets from the first child until the parent is placed
+        first = float(self.rel[kids[0]])
+        positions = [0.]
+        left, left_offset, right, right_offset = self.extremes[kids[0]]
+        deepest = height[kids[0]]
+        for c in kids[1:]:
+            # The right contour of the children placed so far against
+            # the left contour of `c`, down to the shallower of them
+            v, v_offset = kids[len(positions) - 1], positions[-1]
+            w, w_offset = c, 0.
+            p = v_offset + distance
+            for _ in range(min(deepest, height[c])):
+                v, v_offset = self._next(v, v_offset, True)
+                w, w_offset = self._next(w, w_offset, False)
+                p = max(p, v_offset - w_offset + distance)
+            if keep:
+                p = float(self.rel[c]) - first
+            c_left, c_left_offset, c_right, c_right_offset = \
+                self.extremes[c]
+            if height[c] > deepest:
+                # The left contour goes on down that of `c`
+                w, w_offset = self._next(w, w_offset, False)
+                link = (w, w_offset + p - left_offset)
+                self.left_thread[left] = link
+                threads.append((self.left_thread, left, link))
+                left, left_offset = c_left, c_left_offset + p
+            elif height[c] < deepest:
+                # The right contour of `c` goes on down those before it
+                v, v_offset = self._next(v, v_offset, True)
+                link = (v, v_offset - c_right_offset - p)
+                self.right_thread[c_right] = link
+                threads.append((self.right_thread, c_right, link))
+            if height[c] >= deepest:
+                right, right_offset = c_right, c_right_offset + p
+            deepest = max(deepest, height[c])
+            positions.append(p)
+        mid = -first if keep else positions[-1] / 2
+        if not keep:
+            self.rel[kids] = np.array(positions) - mid
+        height[i] = deepest + 1
+        self.extremes[i] = (left, left_offset - mid, right, right_offset - mid)
+        if threads:
+            self.threaded[i] = threads
+
+    def _positions(self, i):
+        """Absolute positions of the subtree of `i` from the offsets"""
+        x, rel, parent = self.x, self.rel, self.parent.tolist()
+        for j in range(i + 1, self.end[i]):
+            x[j] = x[parent[j]] + rel[j]
+
+    def _update(self, i, shown=(), hidden=()):
+        """
+        Place `i` and its ancestors again, then move the nodes whose
+        offsets changed along with their subtrees.
+        """
+        # Nothing above a collapsed ancestor depends on this clade
+        path = [i]
+        while self.parent[path[-1]] >= 0 and \
+                not self.collapsed[self.parent[path[-1]]]:
+            path.append(int(self.parent[path[-1]]))
+        for a in path:
+            self._place(a)
+
+        x, end, visible = self.x, self.end, self.visible
+        on_path = set(path)
+        moved = []
+        for a in reversed(path):
+            for c in self.visible_children(a):
+                shift = x[a] + self.rel[c] - x[c]
+                if not shift:
+                    continue
+                if c == i and not self.visible_children(i):
+                    # Hidden nodes under `i` follow it
+                    x[c:end[c]] += shift
+                    moved.append([c])
+                elif c in on_path:
+                    x[c] += shift
+                    moved.append([c])
+                else:
+                    x[c:end[c]] += shift
+                    moved.append(np.flatnonzero(visible[c:end[c]]) + c)
+        moved = np.concatenate(moved) if moved else []
+        return Change(moved, shown, hidden)
@@ -0,0 +1,161 @@
+"""
+    Lowest common ancestor queries in constant time.
+
+    The Euler tour of a tree lists every node when it is entered and
+    again after each of its children is left, 2n - 1 entries in all.
+    The lowest common ancestor of two nodes is the shallowest node
+    between their first entries in the tour, so a sparse table of the
+    shallowest node over every power of two long range of the tour,
+    built in n log n, answers each query with two lookups.
+
+    With nodes numbered in preorder the tour needs no traversal: node
+    i is first entered at 2i - depth(i), and its parent entered again
+    right after the 2 size(i) - 1 entries of its subtree. Queries take
+    arrays of node indices and are answered all at once.
+"""
+import numpy as np
+
+from phylo_tree.cache import tree_cache
+from phylo_tree.trees.flat import FlatTree
+
+
+class LCAIndex(object):
+    """
+    Lowest common ancestor index of a tree.
+
+    Node `i` is the i-th node of the tree in preorder. The index
+    remembers the `version` of the tree's root when it was built, and
+    refuses queries once the tree has been changed.
+
+    :param tree: A `FlatTree` or a root `Node`.
+    """
+
+    def __init__(self, tree):
+        flat = tree if isinstance(tree, FlatTree) else FlatTree(tree)
+        self.tree = flat
+        self.root = flat.nodes[0]
+        self.version = getattr(self.root, 'version', None)
+
+        n = len(flat)
+        parent = flat.parent.tolist()
+        depth = [0] * n
+        for i in range(1, n):
+            depth[i] = depth[parent[i]] + 1
+        self.depth = np.array(depth, dtype=np.int64)
+        size = flat.sizes()
+
+        self.first = 2 * np.arange(n) - self.depth
+        tour = np.empty(2 * n - 1, dtype=np.int32 if n < 2 ** 31 else
+                        np.int64)
+        tour[self.first] = np.arange(n)
+        tour[self.first[1:] + 2 * size[1:] - 1] = flat.parent[1:]
+
+        # Row k holds the shallowest node of each range of 2**k entries
+        rows = [tour]
+        while 2 ** len(rows) <= len(tour):
+            prev = rows[-1]
+            half = 2 ** (len(rows) - 1)
+            a, b = prev[:-half], prev[half:]
+            rows.append(np.where(self.depth[a] <= self.depth[b], a, b))
+        self.table = rows
+
+    @property
+    def size(self):
+        """Memory used by the index, in bytes"""
+        return (sum(row.nbytes for row in self.table) +
+                self.depth.nbytes + self.first.nbytes)
+
+    @property
+    def stale(self):
+        """Whether the tree has changed since the index was built"""
+        if self.version is None:
+            return False
+        # A root grafted into another tree is versioned by that tree's root
+        return (self.root.ancestor is not None or
+                self.root.version != self.version)
+
+    def _check(self):
+        if self.stale:
+            raise ValueError('the tree has changed since its LCA index '
+                             'was built')
+
+    def mrca(self, a, b):
+        """
+        Most recent common ancestors of the pairs of nodes `a` and `b`.
+
+        :param a: Node index, or array of them.
+        :param b: Node index, or array of them, of the same shape as `a`.
+        :return: Node index, or array of them.
+        """
+        self._check()
+        fa = self.first[np.asarray(a)]
+        fb = self.first[np.asarray(b)]
+        lo = np.minimum(fa, fb)
+        hi = np.maximum(fa, fb) + 1
+        return self._shallowest(lo, hi)
+
+    def mrca_of(self, nodes, groups=None):
+        """
+        Most recent common ancestor of a set of nodes, or of each of
+        several sets.
+
+        :param nodes: Array of node indices.
+        :param groups: Set of each node, as integers from 0. Without it\
+            all nodes form a single set.
+        :return: Node index, or array of them by set, -1 for empty sets.
+        """
+        self._check()
+        first = self.first[np.asarray(nodes, dtype=np.int64)]
+        if groups is None:
+            if not len(first):
+                return -1
+            return self._shallowest(first.min(), first.max() + 1)
+        groups = np.asarray(groups, dtype=np.int64)
+        count = int(groups.max()) + 1 if len(groups) else 0
+        lo = np.full(count, len(self.table[0]), dtype=np.int64)
+        hi = np.full(count, -1, dtype=np.int64)
+        np.minimum.at(lo, groups, first)
+        np.maximum.at(hi, groups, first)
+        out = np.full(count, -1, dtype=np.int64)
+        found = hi >= 0
+        out[found] = self._shallowest(lo[found], hi[found] + 1)
+        return out
+
+    def _shallowest(self, lo, hi):
+        """Shallowest node of the tour entries from `lo` up to `hi`"""
+        if np.ndim(lo) == 0:
+            k = int(np.log2(hi - lo))
+            row = self.table[k]
+            a, b = int(row[lo]), int(row[hi - 2 ** k])
+            return a if self.depth[a] <= self.depth[b] else b
+        shape = np.shape(lo)
+        lo, hi = np.ravel(lo), np.ravel(hi)
+        k = np.log2(hi - lo).astype(np.int64)
+        a = np.empty(len(k), dtype=np.int64)
+        b = np.empty(len(k), dtype=np.int64)
+        for level in np.unique(k).tolist():
+            at = k == level
+            row = self.table[level]
+            a[at] = row[lo[at]]
+            b[at] = row[hi[at] - 2 ** level]
+        return np.where(self.depth[a] <= self.depth[b], a, b).reshape(shape)
+
+    def index(self, node):
+        """Index of a `Node` of the tree"""
+        if not hasattr(self, '_index'):
+            self._index = {id(n): i for i, n in enumerate(self.tree.nodes)}
+        return self._index[id(node)]
+
+
+def lca_index(root):
+    """
+    The `LCAIndex` of the tree under a root `Node`, kept in the tree
+    cache and built again when the tree has changed.
+    """
+    key = ('lca', id(root))
+    index = tree_cache.get(key)
+    # The cached index holds on to its root, so the id can't be reused
+    if index is None or index.root is not root or index.stale:
+        index = LCAIndex(root)
+        tree_cache.put(key, index, index.size)
+    return index
@@ -0,0 +1,228 @@
+"""
+    Level of detail for drawing huge trees.
+
+    At small scales most clades of a big tree are drawn smaller than a
+    pixel. Each internal node gets the scale at which its subtree
+    shrinks below a few pixels on screen. Zoomed out beyond it, the
+    clade is drawn as a single wedge instead of its edges. The scales
+    are computed from the extents of the subtrees in one postorder
+    pass, so every node is visited once.
+
+    Clades small on screen are not all there is to it: a caterpillar
+    tree has every leaf hanging from a large clade, so all its leaves
+    would be drawn at any scale. Clades are therefore also collapsed
+    until no screen holds more than a budget of features. The scales
+    are taken in bands, each half the one before, from the most zoomed
+    out in. In each band the clades are opened, largest first, as long
+    as no cell of a grid of screen-sized cells goes over a quarter of
+    the budget, as a screen overlaps at most four cells. The cells
+    of a band nest in those of the band before, so features opened at
+    a smaller scale never crowd a cell later. A feature is counted in
+    the cell of the node it leads to, or stands for.
+
+    Scales are denominators, as in 1:scale. Following QGIS, a feature
+    is drawn at scales between its `max_scale` (most zoomed in) and its
+    `min_scale` (most zoomed out), 0 meaning no limit.
+"""
+import numpy as np
+
+from phylo_tree.trees.flat import FlatTree
+
+INCH = 0.0254
+# Features drawn at most on a screen of SCREEN pixels
+BUDGET = 4000
+SCREEN = (1920, 1080)
+# Bands of scales, each half the one before, in which to open clades
+BANDS = 64
+
+
+def subtree_extents(tree, xs, ys):
+    """
+    Bounding box of each subtree, from one postorder pass.
+
+    :param tree: A `FlatTree`.
+    :param xs: X coordinate of each node, in preorder.
+    :param ys: Y coordinate of each node, in preorder.
+    :return: Tuple of (min_x, min_y, max_x, max_y) arrays.
+    """
+    parent = tree.parent.tolist()
+    min_x, max_x = list(xs), list(xs)
+    min_y, max_y = list(ys), list(ys)
+    # Reversed preorder visits every child before its parent
+    for i in range(len(parent) - 1, 0, -1):
+        p = parent[i]
+        if min_x[i] < min_x[p]:
+            min_x[p] = min_x[i]
+        if max_x[i] > max_x[p]:
+            max_x[p] = max_x[i]
+        if min_y[i] < min_y[p]:
+            min_y[p] = min_y[i]
+        if max_y[i] > max_y[p]:
+            max_y[p] = max_y[i]
+    return (np.array(min_x), np.array(min_y),
+            np.array(max_x), np.array(max_y))
+
+
+def collapse_scales(tree, xs, ys, pixels=4., dpi=96., unit=1.):
+    """
+    The scale beyond which each subtree is drawn smaller than `pixels`
+    on a `dpi` screen, and so is collapsed. It never decreases from a
+    node to its parent, and is 0 for the leaves.
+
+    :param unit: Length of a map unit in meters.
+    :return: Tuple of the scales and the subtree extents.
+    """
+    extents = subtree_extents(tree, xs, ys)
+    min_x, min_y, max_x, max_y = extents
+    size = np.maximum(max_x - min_x, max_y - min_y)
+    return size * unit * dpi / (INCH * pixels), extents
+
+
+def budget_scales(tree, xs, ys, scales, budget=BUDGET, screen=SCREEN,
+                  dpi=96., unit=1.):
+    """
+    Collapse scales lowered so that no screen holds more than `budget`
+    features, edges and wedges, at any scale.
+
+    :param scales: Collapse scales from `collapse_scales`.
+    :param screen: (width, height) of the screen in pixels.
+    :return: The new scales, never above the old ones, still never\
+        decreasing from a node to its parent.
+    """
+    n = len(tree.parent)
+    parent = tree.parent.tolist()
+    children = tree.children
+    internal = [bool(c) for c in children]
+    inner = np.array(internal, dtype=bool)
+    xs, ys = np.asarray(xs, dtype=float), np.asarray(ys, dtype=float)
+    out = np.zeros(n)
+    limit = max(budget // 4, 1)
+    # Map units across a pixel at a scale of one
+    pixel = INCH / (dpi * unit)
+    # Clades in the order they open as one zooms in, parents first
+    order = np.lexsort((np.arange(n), -scales))
+    pending = order[inner[order]].tolist()
+    levels = scales.tolist()
+    is_open = [False] * n
+    band = float(scales.max()) if n else 0.
+    for _ in range(BANDS):
+        if not pending or band <= 0:
+            break
+        lower = band / 2
+        cx = np.floor(xs / (screen[0] * band * pixel)).astype(np.int64)
+        cy = np.floor(ys / (screen[1] * band * pixel)).astype(np.int64)
+        cx -= cx.min()
+        cy -= cy.min()
+        _, cell = np.unique(cx * (int(cy.max()) + 1) + cy,
+                            return_inverse=True)
+        # Features drawn so far: the edges of the children of open
+        # clades, the wedges of their closed children, or the root's
+        opened = np.array(is_open, dtype=bool)
+        drawn = np.zeros(n)
+        drawn[1:] = opened[tree.parent[1:]] * (
+            1 + (inner[1:] & ~opened[1:]))
+        drawn[0] += not is_open[0]
+        counts = np.bincount(cell, drawn).tolist()
+        cell = cell.tolist()
+        # Pending clades are by decreasing scale, those after the first
+        # below the band wait for the next
+        waiting = []
+        for k, i in enumerate(pending):
+            if levels[i] <= lower:
+                waiting.extend(pending[k:])
+                break
+            p = parent[i]
+            if p >= 0 and not is_open[p]:
+                waiting.append(i)
+                continue
+            delta = {cell[i]: -1}
+            for j in children[i]:
+                delta[cell[j]] = delta.get(cell[j], 0) + 1 + internal[j]
+            if any(d > 0 and counts[c] + d > limit
+                   for c, d in delta.items()):
+                waiting.append(i)
+                continue
+            for c, d in delta.items():
+                counts[c] += d
+            is_open[i] = True
+            out[i] = min(levels[i], band)
+        pending = waiting
+        band = lower
+    # Clades still crowded after the last band, such as piles of nodes
+    # at one point, open at its scale
+    for i in pending:
+        out[i] = min(scales[i], band)
+    return out
+
+
+def edge_scales(tree, scales):
+    """
+    (min_scale, max_scale) arrays of the edge leading to each node.
+    An edge is drawn until its parent's clade collapses.
+    """
+    parent = tree.parent
+    min_scale = np.where(parent >= 0, scales[np.maximum(parent, 0)], 0.)
+    return min_scale, np.zeros(len(scales))
+
+
+def wedge(x, y, extent):
+    """
+    A triangle standing for a collapsed clade, from the clade's root
+    at (x, y) to the side of the clade's extent farthest from it.
+    """
+    min_x, min_y, max_x, max_y = extent
+    sides = [
+        (max_y - y, [(min_x, max_y), (max_x, max_y)]),
+        (y - min_y, [(max_x, min_y), (min_x, min_y)]),
+        (max_x - x, [(max_x, max_y), (max_x, min_y)]),
+        (x - min_x, [(min_x, min_y), (min_x, max_y)]),
+    ]
+    _, base = max(sides, key=lambda side: side[0])
+    return [(x, y)] + base + [(x, y)]
+
+
+def wedges(tree, xs, ys, scales, extents):
+    """
+    Yield (index, min_scale, max_scale, ring) of the wedge of every
+    internal node that can be drawn collapsed: from its own scale up
+    to the scale at which its parent collapses in turn.
+    """
+    parent = tree.parent.tolist()
+    scales = scales.tolist()
+    extents = np.column_stack(extents).tolist()
+    for i, children in enumerate(tree.children):
+        if not children:
+            continue
+        p = parent[i]
+        min_scale = scales[p] if p >= 0 else 0.
+        if min_scale and scales[i] >= min_scale:
+            # Collapses along with its parent, never on its own
+            continue
+        yield i, min_scale, scales[i], wedge(xs[i], ys[i], extents[i])
+
+
+def visible(min_scale, max_scale, scale):
+    """Mask of the features drawn at `scale`"""
+    return (((min_scale == 0) | (scale < min_scale)) &
+            (scale >= max_scale))
+
+
+def level_of_detail(tree, xs, ys, pixels=4., dpi=96., unit=1.,
+                    budget=BUDGET, screen=SCREEN):
+    """
+    Scale ranges of the edges and the wedges of a laid out tree.
+
+    :param tree: A `FlatTree` or a root `Node`.
+    :param budget: Features drawn at most on a screen of `screen`\
+        pixels, None for no limit but the size of the clades.
+    :return: Tuple of the edges' (min_scale, max_scale) arrays, and\
+        the list of wedges as from `wedges`.
+    """
+    flat = tree if isinstance(tree, FlatTree) else FlatTree(tree)
+    xs, ys = list(xs), list(ys)
+    scales, extents = collapse_scales(flat, xs, ys, pixels, dpi, unit)
+    if budget:
+        scales = budget_scales(flat, xs, ys, scales, budget, screen, dpi,
+                               unit)
+    return (edge_scales(flat, scales),
+            list(wedges(flat, xs, ys, scales, extents)))
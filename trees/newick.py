@@ -48,7 +48,8 @@ class Node(object):
         :param kw: Recognized keyword arguments:\
             `length_parser`: Custom parser for the `length` attribute of a Node.\
             `length_formatter`: Custom formatter for the branch length when formatting a\
-            Node as Newick string.
+            Node as Newick string.\
+            `taxon`: Id of the node's label in a `TaxonNamespace`.
         """
         for char in RESERVED_PUNCTUATION:
             if (name and char in name) or (length and char in length):
@@ -58,6 +59,8 @@ class Node(object):
         self._length = length
         self.descendants = []
         self.ancestor = None
+        self._version = 0
+        self.taxon = kw.pop('taxon', None)
         self._length_parser = kw.pop('length_parser', length_parser)
         self._length_formatter = kw.pop('length_formatter', length_formatter)
 
@@ -94,6 +97,25 @@ class Node(object):
     def add_descendant(self, node):
         node.ancestor = self
         self.descendants.append(node)
+        self.touch()
+
+    @property
+    def version(self):
+        """
+        Number of changes made to the topology of the tree this node is
+        the root of, so that indexes built on it can tell they are stale.
+        """
+        return self._version
+
+    def touch(self):
+        """
+        Record a change to the topology of the tree containing this node.
+        Code changing `descendants` directly should call it afterwards.
+        """
+        node = self
+        while node.ancestor is not None:
+            node = node.ancestor
+        node._version += 1
 
     @property
     def newick(self):
@@ -293,6 +315,7 @@ class Node(object):
             lambda n: ((not inverse and n in leaves) or
                        (inverse and n.is_leaf and n not in leaves)) and n.ancestor,
             mode="postorder")
+        self.touch()
 
     def prune_by_names(self, leaf_names, inverse=False):
         """
@@ -328,6 +351,7 @@ class Node(object):
                     self.descendants = n.descendants
                     if preserve_lengths:
                         self.length = n.length
+        self.touch()
 
     def resolve_polytomies(self):
         """
@@ -342,6 +366,7 @@ class Node(object):
             n.descendants.append(new)
 
         self.visit(_resolve_polytomies, lambda n: len(n.descendants) > 2)
+        self.touch()
 
     def remove_names(self):
         """
@@ -375,7 +400,8 @@ def loads(s, strip_comments=False, **kw):
     :param s: Newick formatted string.
     :param strip_comments: Flag signaling whether to strip comments enclosed in square \
     brackets.
-    :param kw: Keyword arguments are passed through to `Node.create`.
+    :param kw: Keyword arguments are passed through to `parse_node`, such as a \
+    `taxa` namespace shared by the trees, and from it to `Node.create`.
     :return: List of Node objects.
     """
     kw['strip_comments'] = strip_comments
@@ -401,7 +427,8 @@ def load(fp, strip_comments=False, **kw):
     :param fp: open file handle.
     :param strip_comments: Flag signaling whether to strip comments enclosed in square \
     brackets.
-    :param kw: Keyword arguments are passed through to `Node.create`.
+    :param kw: Keyword arguments are passed through to `parse_node`, such as a \
+    `taxa` namespace shared by the trees, and from it to `Node.create`.
     :return: List of Node objects.
     """
     kw['strip_comments'] = strip_comments
@@ -419,7 +446,8 @@ def read(fname, encoding='utf8', strip_comments=False, **kw):
     :param fname: file path.
     :param strip_comments: Flag signaling whether to strip comments enclosed in square \
     brackets.
-    :param kw: Keyword arguments are passed through to `Node.create`.
+    :param kw: Keyword arguments are passed through to `parse_node`, such as a \
+    `taxa` namespace shared by the trees, and from it to `Node.create`.
     :return: List of Node objects.
     """
     kw['strip_comments'] = strip_comments
@@ -439,46 +467,70 @@ def _parse_name_and_length(s):
     return s or None, length or None
 
 
-def _parse_siblings(s, **kw):
-    """
-    http://stackoverflow.com/a/26809037
-    """
-    bracket_level = 0
-    current = []
-
-    # trick to remove special-case of trailing chars
-    for c in (s + ","):
-        if c == "," and bracket_level == 0:
-            yield parse_node("".join(current), **kw)
-            current = []
-        else:
-            if c == "(":
-                bracket_level += 1
-            elif c == ")":
-                bracket_level -= 1
-            current.append(c)
+DELIMITER = re.compile(r'[(),]')
 
 
-def parse_node(s, strip_comments=False, **kw):
+def parse_node(s, strip_comments=False, progress=None, taxa=None, **kw):
     """
     Parse a Newick formatted string into a `Node` object.
 
+    The string is scanned once from left to right, keeping a stack of
+    the descendants of the currently open brackets, so parsing takes
+    linear time however deep the tree is.
+
     :param s: Newick formatted string to parse.
     :param strip_comments: Flag signaling whether to strip comments enclosed in square \
     brackets.
+    :param progress: Optional callable, called from time to time with the fraction \
+    of the string parsed so far.
+    :param taxa: Optional `TaxonNamespace` the leaf labels are added to. Leaves then \
+    share the namespace's copy of their label and have its id as `taxon`.
     :param kw: Keyword arguments are passed through to `Node.create`.
     :return: `Node` instance.
     """
     if strip_comments:
         s = COMMENT.sub('', s)
     s = s.strip()
-    parts = s.split(')')
-    if len(parts) == 1:
-        descendants, label = [], s
-    else:
-        if not parts[0].startswith('('):
-            raise ValueError('unmatched braces %s' % parts[0][:100])
-        descendants = list(_parse_siblings(')'.join(parts[:-1])[1:], **kw))
-        label = parts[-1]
-    name, length = _parse_name_and_length(label)
-    return Node.create(name=name, length=length, descendants=descendants, **kw)
+    size = len(s) or 1
+
+    stack = [[]]
+    closed = None  # descendants of a bracket closed just before the label
+    pos = 0
+
+    def finish(label):
+        if closed is None:
+            name, length = _parse_name_and_length(label.strip())
+            taxon = None
+            if taxa is not None and name:
+                taxon = taxa.add(name)
+                name = taxa.labels[taxon]
+            node = Node.create(name=name, length=length, taxon=taxon, **kw)
+        else:
+            name, length = _parse_name_and_length(label.rstrip())
+            node = Node.create(
+                name=name, length=length, descendants=closed, **kw)
+        stack[-1].append(node)
+
+    for i, m in enumerate(DELIMITER.finditer(s)):
+        char, label = m.group(), s[pos:m.start()]
+        pos = m.end()
+        if char == '(':
+            if closed is not None or label.strip():
+                raise ValueError('unmatched braces %s' % s[:100])
+            stack.append([])
+            continue
+        finish(label)
+        closed = None
+        if char == ')':
+            if len(stack) == 1:
+                raise ValueError('unmatched braces %s' % s[:100])
+            closed = stack.pop()
+        if progress is not None and i % 10000 == 0:
+            progress(pos / size)
+
+    finish(s[pos:])
+    if len(stack) != 1 or len(stack[0]) != 1:
+        raise ValueError('unmatched braces %s' % s[:100])
+    if progress is not None:
+        progress(1.0)
+    return stack[0][0]
@@ -0,0 +1,89 @@
+"""
+    Trees of NEXUS files, such as the posterior samples written by
+    BEAST or MrBayes.
+
+    Only the trees block is read: its translate statement, mapping the
+    short names used in the trees to taxon labels, and its tree
+    statements. A file is read one statement at a time, so a file of
+    many thousands of trees is streamed rather than loaded.
+"""
+import pathlib
+import re
+
+from phylo_tree.trees.newick import COMMENT, loads
+from phylo_tree.trees.taxa import CHUNK, TaxonNamespace, stream
+
+# Comments before the keyword of a statement
+LEADING = re.compile(r'\s*(?:\[[^\]]*\]\s*)*')
+# A pair of a translate statement: the short name and the label
+TRANSLATE = re.compile(r"\s*([^\s,]+)\s+('(?:[^']|'')*'|[^\s,]+)\s*,?")
+# The name of a tree statement, with any comments, up to the equals sign
+TREE = re.compile(r'(?:[^=\[]|\[[^\]]*\])*=')
+
+
+def is_nexus(path):
+    """Whether the file in `path` starts with the #NEXUS header"""
+    with pathlib.Path(path).open(encoding='utf8') as fp:
+        return LEADING.sub('', fp.read(64), count=1)[:6].upper() == '#NEXUS'
+
+
+def unquote(label):
+    if len(label) > 1 and label[0] == label[-1] == "'":
+        return label[1:-1].replace("''", "'")
+    return label
+
+
+def trees(fp, taxa=None, strip_comments=True, chunk=CHUNK):
+    """
+    Newick strings of the trees of a NEXUS file, one at a time.
+
+    :param fp: File object open for reading text.
+    :param taxa: Optional `TaxonNamespace` the labels of the translate\
+        statement are added to, with the short names as aliases, so\
+        that the trees can be parsed against it as they are.
+    :param strip_comments: Strip comments from the trees, such as the\
+        annotations of BEAST, which hold commas. The comment giving\
+        whether a tree is rooted is always stripped.
+    """
+    block = None
+    for statement in stream(fp, chunk):
+        statement = LEADING.sub('', statement, count=1)
+        if statement[:6].upper() == '#NEXUS':
+            statement = LEADING.sub('', statement[6:], count=1)
+        keyword, rest = (statement.split(None, 1) + ['', ''])[:2]
+        keyword = keyword.lower()
+        if keyword == 'begin':
+            block = rest.strip().lower()
+        elif keyword in ('end', 'endblock'):
+            block = None
+        elif block != 'trees':
+            continue
+        elif keyword == 'translate':
+            for m in TRANSLATE.finditer(rest):
+                if taxa is not None:
+                    taxa.alias(m.group(1), unquote(m.group(2)))
+        elif keyword in ('tree', 'utree'):
+            head = TREE.match(rest)
+            if head is None:
+                continue
+            newick = rest[head.end():]
+            if strip_comments:
+                newick = COMMENT.sub('', newick)
+            yield LEADING.sub('', newick, count=1).strip()
+
+
+def read_tree(path, strip_comments=True):
+    """
+    The first tree of a NEXUS file as a `Node`, with its leaves named
+    by the labels of the translate statement.
+    """
+    taxa = TaxonNamespace()
+    with pathlib.Path(path).open(encoding='utf8') as fp:
+        newick = next(trees(fp, taxa, strip_comments), None)
+    if newick is None:
+        raise ValueError('No tree in {}'.format(path))
+    root = loads(newick)[0]
+    for node in root.walk():
+        if node.is_leaf and node.name in taxa:
+            node.name = taxa.labels[taxa[node.name]]
+    return root
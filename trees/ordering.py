@@ -0,0 +1,250 @@
+"""
+    Leaf ordering to untangle the links between a tree and a map.
+
+    Links from leaves lined up along the tree's baseline to features
+    spread over the map cross each other roughly wherever the order of
+    the leaves disagrees with the order of their features projected
+    onto the baseline, so crossings are counted as the inversions
+    between the two orders. The children of every internal node can
+    be put in any order without changing the tree, and the crossings
+    between links of different children only depend on which child
+    comes first, not on the order inside each of them. One postorder
+    pass therefore picks the best order at each node from the sorted
+    positions of its children's features: exactly for two children,
+    and for more by sorting them on their mean position, then swapping
+    neighbours for a bounded number of sweeps.
+
+    Every choice only depends on which leaves are under each child, not
+    on how they are ordered, so the counts are all made up front. The
+    links of each child are counted against those of its largest
+    sibling in one batch, which searches sorted blocks of the leaves
+    in preorder. Smaller children are compared with each other
+    directly. A leaf is under a smaller child at no more than log n of
+    its ancestors, so the work is n log^2 n even for the deepest trees.
+"""
+import numpy as np
+
+# Polytomies with more children than this are only sorted by their
+# mean position, as comparing every pair of children gets costly
+MAX_SWEEP_CHILDREN = 64
+
+
+def cross(a, b):
+    """
+    Number of pairs of values taken from the sorted arrays `a` and `b`
+    with the one from `a` greater, the crossings when `a` comes first.
+    """
+    if not len(a) or not len(b):
+        return 0
+    if len(a) < len(b):
+        return int(np.searchsorted(b, a, 'left').sum())
+    return int((len(a) - np.searchsorted(a, b, 'right')).sum())
+
+
+def count_below(ranks, starts, stops, thresholds, strict=True):
+    """
+    Number of the values of `ranks[starts[q]:stops[q]]` below
+    `thresholds[q]`, or at most equal to it unless `strict`, for every
+    query q at once.
+
+    A prefix of the sequence is a run of aligned blocks whose sizes are
+    powers of two, so sorting the blocks of each size answers all the
+    queries by one binary search per size.
+    """
+    ranks = np.asarray(ranks, dtype=np.int64)
+    thresholds = np.asarray(thresholds, dtype=np.int64)
+    bounds = ((np.asarray(stops, dtype=np.int64), 1),
+              (np.asarray(starts, dtype=np.int64), -1))
+    counts = np.zeros(len(thresholds), dtype=np.int64)
+    if not len(ranks) or not len(thresholds):
+        return counts
+    side = 'left' if strict else 'right'
+    span = int(max(ranks.max(), thresholds.max())) + 1
+    position = np.arange(len(ranks), dtype=np.int64)
+    level = 0
+    while 1 << level <= len(ranks):
+        # Values sorted within each block, blocks in sequence
+        keys = np.sort((position >> level) * span + ranks)
+        for ends, sign in bounds:
+            take = np.flatnonzero((ends >> level) & 1)
+            block = (ends[take] >> level) - 1
+            found = np.searchsorted(keys, block * span + thresholds[take],
+                                    side)
+            counts[take] += sign * (found - (block << level))
+        level += 1
+    return counts
+
+
+def inversions(a):
+    """Number of pairs of values of `a` in decreasing order"""
+
+    def count(a):
+        if len(a) <= 32:
+            # Small runs compare every pair at once
+            return np.sort(a), int(np.triu(a[:, None] > a[None, :]).sum())
+        mid = len(a) // 2
+        left, x = count(a[:mid])
+        right, y = count(a[mid:])
+        # Each value of the right half jumps over the greater values
+        # still left in the left half
+        z = int((len(left) - np.searchsorted(left, right, 'right')).sum())
+        return np.sort(np.concatenate([left, right])), x + y + z
+
+    return count(np.asarray(a))[1]
+
+
+def order_children(tree, values, sweeps=2):
+    """
+    Reorder the children of every node of `tree` to reduce crossings
+    between the links of its leaves.
+
+    :param tree: A `FlatTree`.
+    :param values: Position of each node's link along the baseline, in\
+        preorder, NaN where a node has none. Only leaves are used.
+    :param sweeps: Passes of neighbour swaps at nodes with more than\
+        two children.
+    :return: Tuple of the new list of children of each node, and the\
+        crossings before and after.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    children = [list(c) for c in tree.children]
+    # Linked leaves in preorder, and the range of them under each node
+    _, lo, hi = tree.leaf_ranks()
+    leaf_values = values[tree.leaves()]
+    linked = leaf_values == leaf_values
+    count = np.concatenate([[0], np.cumsum(linked)])
+    lo, hi = count[lo], count[hi]
+    sequence = leaf_values[linked]
+    _, ranks = np.unique(sequence, return_inverse=True)
+    total = np.concatenate([[0.], np.cumsum(sequence)])
+    size = (hi - lo).tolist()
+
+    # The largest child of each node, and the others
+    heavy = {}
+    light = []
+    for i, kids in enumerate(children):
+        if len(kids) > 1:
+            h = max(kids, key=size.__getitem__)
+            heavy[i] = h
+            light.extend((c, h) for c in kids if c != h)
+    light = np.array(light, dtype=np.int64).reshape(-1, 2)
+    # Links of each smaller child against those of the largest
+    nodes, largest = light[:, 0], light[:, 1]
+    lengths = hi[nodes] - lo[nodes]
+    owner = np.repeat(np.arange(len(nodes)), lengths)
+    positions = np.arange(len(owner)) - np.repeat(
+        np.cumsum(lengths) - lengths, lengths) + lo[nodes][owner]
+    starts, stops = lo[largest][owner], hi[largest][owner]
+    below = count_below(ranks, starts, stops, ranks[positions])
+    above = (stops - starts) - count_below(ranks, starts, stops,
+                                           ranks[positions], strict=False)
+    # Crossings with the largest child when coming before it, and after
+    ahead = dict(zip(nodes.tolist(), np.bincount(
+        owner, below, len(nodes)).astype(np.int64).tolist()))
+    behind = dict(zip(nodes.tolist(), np.bincount(
+        owner, above, len(nodes)).astype(np.int64).tolist()))
+
+    def cross_children(a, b, h):
+        """
+        Crossings between the links of children `a` and `b`, `a`
+        coming first, of a node whose largest child is `h`
+        """
+        if b == h:
+            return ahead[a]
+        if a == h:
+            return behind[b]
+        return cross(np.sort(sequence[lo[a]:hi[a]]),
+                     np.sort(sequence[lo[b]:hi[b]]))
+
+    def order_crossings(kids, h):
+        """Crossings between the children in the order given"""
+        if len(kids) <= MAX_SWEEP_CHILDREN:
+            return sum(cross_children(kids[a], kids[b], h)
+                       for a in range(len(kids))
+                       for b in range(a + 1, len(kids)))
+        # Smaller children against each other as one sequence
+        out = inversions(np.concatenate(
+            [np.sort(sequence[lo[c]:hi[c]]) for c in kids if c != h]))
+        seen = False
+        for c in kids:
+            if c == h:
+                seen = True
+            else:
+                out += behind[c] if seen else ahead[c]
+        return out
+
+    before = after = 0
+    for i, h in heavy.items():
+        kids = children[i]
+        if len(kids) == 2:
+            a, b = kids
+            first, second = cross_children(a, b, h), cross_children(b, a, h)
+            before += first
+            if second < first:
+                kids.reverse()
+            after += min(first, second)
+            continue
+        before += order_crossings(kids, h)
+        sums = [total[hi[c]] - total[lo[c]] for c in kids]
+        counts = [size[c] for c in kids]
+        crossed = None
+        if len(kids) <= MAX_SWEEP_CHILDREN:
+            crossed = [[cross_children(a, b, h) if a != b else 0
+                        for b in kids] for a in kids]
+        order = sort_children(sums, counts, crossed, sweeps)
+        kids[:] = [kids[k] for k in order]
+        after += order_crossings(kids, h)
+    return children, before, after
+
+
+def sort_children(sums, counts, crossed, sweeps):
+    """
+    Order of the children of a polytomy: by mean position, then
+    improved by swapping neighbours while that reduces crossings.
+    Children without links sit at the mean of all of them.
+
+    :param sums: Sum of the positions of the links of each child.
+    :param counts: Number of links of each child.
+    :param crossed: Crossings between the links of each pair of\
+        children, the first coming first, None not to swap them.
+    """
+    total = sum(counts)
+    center = sum(sums) / total if total else 0.
+    means = [s / c if c else center for s, c in zip(sums, counts)]
+    order = sorted(range(len(means)), key=means.__getitem__)
+    if crossed is None:
+        return order
+    for _ in range(sweeps):
+        swapped = False
+        for k in range(len(order) - 1):
+            a, b = order[k], order[k + 1]
+            if crossed[b][a] < crossed[a][b]:
+                order[k], order[k + 1] = b, a
+                swapped = True
+        if not swapped:
+            break
+    return order
+
+
+def leaf_order(children):
+    """Node indices of the leaves in the order they are drawn"""
+    out = []
+    stack = [0]
+    while stack:
+        i = stack.pop()
+        if children[i]:
+            stack.extend(reversed(children[i]))
+        else:
+            out.append(i)
+    return out
+
+
+def crossings(children, values):
+    """
+    Crossings between the links of the leaves when drawn in the order
+    given by `children`, as the number of inversions of their values
+    found by merge sort.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    order = values[leaf_order(children)]
+    return inversions(order[order == order])
@@ -0,0 +1,98 @@
+"""
+    Ancestral location reconstruction.
+
+    Estimates the geographic position of every internal node of a tree
+    from the positions of its leaves by squared-change parsimony: the
+    internal positions minimise the sum over all branches of
+
+        (x_parent - x_child) ** 2 / branch_length
+
+    The minimum is found exactly with the usual two passes over the
+    tree. The postorder pass condenses every subtree into a weighted
+    estimate for its root, the preorder pass then fixes each node
+    given the final position of its parent.
+"""
+import numpy as np
+
+from phylo_tree.trees.flat import FlatTree
+
+INF = float('inf')
+
+
+def branch_weights(flat):
+    """
+    Length of each branch as used by the reconstruction. Trees
+    without branch lengths get unit lengths and zero lengths are
+    clamped to a small positive value so that they stay finite.
+    """
+    if not flat.has_lengths:
+        return [1.0] * len(flat)
+    lengths = flat.length.copy()
+    positive = lengths[lengths > 0]
+    floor = positive.mean() * 1e-6 if positive.size else 1.0
+    return np.maximum(lengths, floor).tolist()
+
+
+def reconstruct_locations(tree, locations):
+    """
+    Place every node of `tree` given the locations of some leaves.
+
+    :param tree: A `FlatTree` or a root `Node`.
+    :param locations: Mapping of preorder node index to an (x, y)\
+        location. Leaves without a location do not constrain the\
+        result.
+    :return: Tuple of (xs, ys) arrays indexed like the tree's nodes.
+    """
+    flat = tree if isinstance(tree, FlatTree) else FlatTree(tree)
+    n = len(flat)
+    parent = flat.parent.tolist()
+    length = branch_weights(flat)
+
+    # Precision (inverse variance) and weighted sums of the estimate
+    # for each subtree's root, from the leaves below it only
+    prec = [0.0] * n
+    sx = [0.0] * n
+    sy = [0.0] * n
+    mx = [0.0] * n
+    my = [0.0] * n
+    for i, (x, y) in locations.items():
+        prec[i] = INF
+        mx[i], my[i] = x, y
+
+    # Postorder pass
+    for i in range(n - 1, -1, -1):
+        p_i = prec[i]
+        if p_i != INF and p_i > 0:
+            mx[i] = sx[i] / p_i
+            my[i] = sy[i] / p_i
+        p = parent[i]
+        if p < 0 or p_i == 0:
+            continue
+        if p_i == INF:
+            w = 1.0 / length[i]
+        else:
+            w = p_i / (1.0 + length[i] * p_i)
+        prec[p] += w
+        sx[p] += w * mx[i]
+        sy[p] += w * my[i]
+
+    if prec[0] == 0:
+        raise ValueError('None of the leaves have a location')
+
+    # Preorder pass
+    xs = [0.0] * n
+    ys = [0.0] * n
+    xs[0], ys[0] = mx[0], my[0]
+    for i in range(1, n):
+        p = parent[i]
+        p_i = prec[i]
+        if p_i == INF:
+            xs[i], ys[i] = mx[i], my[i]
+        elif p_i == 0:
+            xs[i], ys[i] = xs[p], ys[p]
+        else:
+            w = 1.0 / length[i]
+            xs[i] = (p_i * mx[i] + w * xs[p]) / (p_i + w)
+            ys[i] = (p_i * my[i] + w * ys[p]) / (p_i + w)
+
+    return np.array(xs), np.array(ys)
@@ -0,0 +1,124 @@
+"""
+    Rectangular phylogram geometry as arrays.
+
+    Nodes are placed by depth along x, with the leaves lined up at the
+    greatest depth, and along y by leaf order, each internal node
+    sitting at the mean of its children. Every node has a horizontal
+    segment, and every internal node a vertical one joining its
+    children. The segments are built for all nodes at once into an
+    (N, 2, 2) array of ((x0, y0), (x1, y1)), which can be rotated or
+    scaled with a single matrix product.
+"""
+import numpy as np
+
+from phylo_tree.trees.flat import FlatTree
+
+# Horizontal segments reach half a level past their node, so that the
+# vertical segments fall halfway between the levels
+HALF = .5
+
+
+def coordinates(tree):
+    """
+    Phylogram (x, y) coordinates of each node.
+
+    :param tree: A `FlatTree` or a root `Node`.
+    :return: Tuple of x and y arrays, in preorder.
+    """
+    flat = tree if isinstance(tree, FlatTree) else FlatTree(tree)
+    parent = flat.parent
+    leaf = flat.is_leaf
+    depth = flat.measures().depth
+    x = np.where(leaf, depth.max(), depth).astype(np.float64)
+
+    # Leaves by rank, then internal nodes at the mean of their children,
+    # one level at a time from the deepest up
+    y = np.zeros(len(parent))
+    y[leaf] = np.arange(leaf.sum())
+    total = np.zeros(len(parent))
+    count = np.bincount(parent[1:], minlength=len(parent))
+    order = np.argsort(-depth, kind='stable')
+    levels = np.split(order, np.flatnonzero(np.diff(depth[order])) + 1)
+    for level in levels:
+        inner = level[~leaf[level]]
+        y[inner] = total[inner] / count[inner]
+        level = level[parent[level] >= 0]
+        np.add.at(total, parent[level], y[level])
+    return x, y
+
+
+def segments(tree, x=None, y=None):
+    """
+    Horizontal segments of all the nodes, followed by the vertical
+    segments of the internal nodes.
+
+    :param x: Node coordinates as from `coordinates`, computed if not\
+        given.
+    :return: Tuple of an (N, 2, 2) array of segments and the index of\
+        the node each one belongs to.
+    """
+    flat = tree if isinstance(tree, FlatTree) else FlatTree(tree)
+    if x is None:
+        x, y = coordinates(flat)
+    parent = flat.parent
+    start = np.where(parent >= 0, x[np.maximum(parent, 0)] + HALF, x - HALF)
+    horizontal = np.stack([np.column_stack([start, y]),
+                           np.column_stack([x + HALF, y])], axis=1)
+
+    inner = np.flatnonzero(~flat.is_leaf)
+    first = np.array([flat.children[i][0] for i in inner], dtype=np.int64)
+    last = np.array([flat.children[i][-1] for i in inner], dtype=np.int64)
+    bar = x[inner] + HALF
+    vertical = np.stack([np.column_stack([bar, y[first]]),
+                         np.column_stack([bar, y[last]])], axis=1)
+    return (np.concatenate([horizontal, vertical.reshape(-1, 2, 2)]),
+            np.concatenate([np.arange(len(parent)), inner]))
+
+
+def elbows(tree, x=None, y=None):
+    """
+    One polyline per node, from its parent's vertical segment along to
+    the node's level then across to the node, so that the edges of a
+    phylogram take one feature each instead of two. The root's has no
+    vertical part.
+
+    :return: (N, 3, 2) array of polylines, in preorder.
+    """
+    flat = tree if isinstance(tree, FlatTree) else FlatTree(tree)
+    if x is None:
+        x, y = coordinates(flat)
+    parent = flat.parent
+    p = np.maximum(parent, 0)
+    bar = np.where(parent >= 0, x[p] + HALF, x - HALF)
+    corner_y = np.where(parent >= 0, y[p], y)
+    return np.stack([np.column_stack([bar, corner_y]),
+                     np.column_stack([bar, y]),
+                     np.column_stack([x + HALF, y])], axis=1)
+
+
+def center(points):
+    """Center of the bounding box of an array of (..., 2) points"""
+    flat = points.reshape(-1, 2)
+    return (flat.min(axis=0) + flat.max(axis=0)) / 2
+
+
+def rotate(points, degrees, origin=None):
+    """
+    Rotate an array of (..., 2) points counterclockwise around `origin`,
+    by default the center of their bounding box.
+    """
+    if origin is None:
+        origin = center(points)
+    angle = np.radians(degrees)
+    cos, sin = np.cos(angle), np.sin(angle)
+    matrix = np.array([[cos, sin], [-sin, cos]])
+    return (points - origin) @ matrix + origin
+
+
+def place(points, scale, origin):
+    """
+    Scale an array of (..., 2) points by (scale_x, scale_y) and move
+    them so that the center of their bounding box is `origin`.
+    """
+    scaled = points * np.asarray(scale, dtype=np.float64)
+    return scaled - center(scaled) + np.asarray(origin, dtype=np.float64)
@@ -0,0 +1,201 @@
+"""
+    Robinson-Foulds distances between many trees over the same taxa.
+
+    The Robinson-Foulds distance of two trees is the number of splits
+    found in only one of them, the size of the symmetric difference of
+    their sets of splits, |A| + |B| - 2 |A & B|. Every distinct split
+    of the trees is given a column, and each tree becomes the sorted
+    columns of its splits, a row of a sparse matrix in CSR form. The
+    splits shared by a tree and all the trees after it are then counted
+    at once: the tree's columns are marked, the marks gathered over the
+    columns of the other trees, and summed for each tree by differences
+    of a running total. A row costs a few operations per split of the
+    later trees, and blocks of rows can be computed by a pool of
+    processes.
+"""
+import multiprocessing
+from collections import namedtuple
+
+import numpy as np
+
+from phylo_tree.trees.splits import as_ints, ranges, split_bits
+from phylo_tree.trees.taxa import stream
+
+# Rows of the matrix computed by a task of the pool
+ROWS = 32
+
+Summary = namedtuple('Summary', ['splits', 'mean', 'max', 'normalized'])
+
+
+class SplitColumns(object):
+    """
+    Splits of a set of trees as columns of a sparse matrix.
+
+    :ivar indptr: The columns of tree i are `indices[indptr[i]:indptr[i + 1]]`.
+    :ivar indices: Sorted columns of the splits of each tree, in turn.
+    :ivar splits: Int bitset of each column's split.
+    :ivar columns: Column of each split, by int bitset.
+    """
+
+    def __init__(self, rooted=False):
+        self.rooted = rooted
+        self.columns = {}
+        self.splits = []
+        self._indices = []
+        self.counts = [0]
+        self.taxa = None
+
+    def __len__(self):
+        return len(self.counts) - 1
+
+    def add(self, taxon, lo, hi):
+        """Add a tree, from the `leaf_ranges` of its leaves"""
+        taxa = np.sort(taxon)
+        if self.taxa is None:
+            self.taxa = taxa
+        elif not np.array_equal(taxa, self.taxa):
+            raise ValueError('tree {} has other taxa than the first tree'
+                             .format(len(self) + 1))
+        columns = self.columns
+        row = []
+        for split in as_ints(split_bits(taxon, lo, hi, self.rooted)):
+            column = columns.get(split)
+            if column is None:
+                column = columns[split] = len(self.splits)
+                self.splits.append(split)
+            row.append(column)
+        row.sort()
+        self._indices.append(np.array(row, dtype=np.int32))
+        self.counts.append(self.counts[-1] + len(row))
+
+    @property
+    def leaves(self):
+        """Number of leaves of the trees"""
+        return 0 if self.taxa is None else len(self.taxa)
+
+    @property
+    def indptr(self):
+        return np.array(self.counts, dtype=np.int64)
+
+    @property
+    def indices(self):
+        if len(self._indices) > 1:
+            self._indices = [np.concatenate(self._indices)]
+        return (self._indices[0] if self._indices else
+                np.empty(0, dtype=np.int32))
+
+
+def shared_rows(lo, hi, indptr, indices, width):
+    """
+    Number of splits tree i shares with each tree after it, for trees
+    `lo` to `hi`, as a (hi - lo, n) array whose entries for the trees
+    up to i are zero.
+
+    :param width: Number of columns.
+    """
+    n = len(indptr) - 1
+    out = np.zeros((hi - lo, n), dtype=np.int32)
+    mark = np.zeros(width, dtype=np.int32)
+    for r, i in enumerate(range(lo, hi)):
+        own = indices[indptr[i]:indptr[i + 1]]
+        start = indptr[i + 1]
+        mark[own] = 1
+        total = np.zeros(len(indices) - start + 1, dtype=np.int64)
+        np.cumsum(mark[indices[start:]], out=total[1:])
+        out[r, i + 1:] = total[indptr[i + 2:] - start] - \
+            total[indptr[i + 1:-1] - start]
+        mark[own] = 0
+    return out
+
+
+# Sparse matrix shared with the worker processes of a pool
+_shared = {}
+
+
+def _init_worker(indptr, indices, width):
+    _shared.update(indptr=indptr, indices=indices, width=width)
+
+
+def _worker_rows(bounds):
+    s = _shared
+    return bounds, shared_rows(bounds[0], bounds[1], s['indptr'],
+                               s['indices'], s['width'])
+
+
+def rf_matrix(trees, taxa, rooted=False, strip_comments=True,
+              processes=None, progress=None, context=None):
+    """
+    Robinson-Foulds distances between all pairs of trees.
+
+    :param trees: Iterable of `TaxonTree` or Newick strings over the same\
+        taxa, consumed one at a time.
+    :param taxa: `TaxonNamespace` of the leaves.
+    :param rooted: Compare the clades of rooted trees rather than the\
+        splits of unrooted ones.
+    :param processes: Number of processes computing blocks of rows, or\
+        None to compute them in this one.
+    :param progress: Called with the fraction of the rows done, if given.
+    :param context: `multiprocessing` context the processes are started\
+        from, the default one if not given.
+    :return: Tuple of the int32 matrix and a `Summary` of each tree: its\
+        number of splits, its mean and largest distance to the other\
+        trees, and the mean divided by the largest possible distance.
+    """
+    table = SplitColumns(rooted)
+    for tree in trees:
+        table.add(*ranges(tree, taxa, strip_comments))
+    n = len(table)
+    indptr, indices = table.indptr, table.indices
+    width = len(table.splits)
+    shared = np.zeros((n, n), dtype=np.int32)
+
+    blocks = [(lo, min(lo + ROWS, n)) for lo in range(0, n, ROWS)]
+    done = 0
+    if processes:
+        pool = (context or multiprocessing).Pool(
+            processes, _init_worker, (indptr, indices, width))
+        try:
+            for (lo, hi), rows in pool.imap_unordered(_worker_rows, blocks):
+                shared[lo:hi] = rows
+                done += hi - lo
+                if progress is not None:
+                    progress(done / n)
+        except BaseException:
+            # Such as a cancelled progress callback
+            pool.terminate()
+            raise
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for lo, hi in blocks:
+            shared[lo:hi] = shared_rows(lo, hi, indptr, indices, width)
+            done += hi - lo
+            if progress is not None:
+                progress(done / n)
+
+    shared += shared.T
+    counts = np.diff(indptr).astype(np.int32)
+    matrix = counts[:, None] + counts[None, :] - 2 * shared
+    np.fill_diagonal(matrix, 0)
+
+    # Largest number of nontrivial splits of a tree of these leaves
+    largest = 2 * max(table.leaves - (2 if rooted else 3), 0)
+    if n > 1:
+        mean = matrix.sum(axis=1) / (n - 1)
+    else:
+        mean = np.zeros(n)
+    summary = Summary(counts, mean, matrix.max(axis=1, initial=0),
+                      mean / largest if largest else np.zeros(n))
+    return matrix, summary
+
+
+def read_rf(fp, taxa, rooted=False, strip_comments=True, processes=None,
+            progress=None, context=None):
+    """
+    `rf_matrix` of the trees of a Newick file, streamed.
+
+    :param fp: File object open for reading text.
+    """
+    return rf_matrix(stream(fp), taxa, rooted, strip_comments, processes,
+                     progress, context)
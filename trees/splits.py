@@ -0,0 +1,286 @@
+"""
+    Splits of trees as bitsets of taxa, and their counts over many trees.
+
+    Each edge of a tree splits its leaves in two. A split is stored as
+    the set of leaves on one side, a bitset with bit t set for taxon t
+    of a `TaxonNamespace`, packed into 64 bit words. Unrooted trees
+    don't tell the two sides apart, so a split is normalized to the
+    side without the tree's lowest taxon; rooted trees keep the side
+    under the edge, the clade. Splits of a single leaf, and in rooted
+    trees the whole tree, are found in every tree and are left out.
+
+    With the leaves in preorder, the leaves under a node have a range
+    of ranks. As every taxon occurs once in a tree, the bitset of a
+    range is the exclusive or of two running totals of the leaf bits,
+    so all splits of a tree take a few array operations. The ranges
+    come from a postorder pass over a `TaxonTree`, or straight from
+    the brackets of a Newick string, matched by their depth, which
+    spares building the tree when only its splits are wanted.
+
+    Counted splits are keyed by Python ints of their bits, which don't
+    depend on the number of words, so the namespace can grow while a
+    file is streamed. Memory then grows with the number of distinct
+    splits, not of trees. Batches of trees can be counted by a pool of
+    processes, a few batches read ahead of them at a time.
+"""
+import collections
+import itertools
+import multiprocessing
+import re
+
+import numpy as np
+
+from phylo_tree.trees.newick import COMMENT
+from phylo_tree.trees.taxa import TaxonNamespace, TaxonTree, stream
+
+# Name of a leaf: what follows an opening bracket or a comma, up to
+# the next delimiter or the colon of a length, unless it is another
+# opening bracket
+LEAF = re.compile(r'[(,](?!\()([^(),:]*)')
+SPACE = re.compile(r'([(,])\s+')
+# Trees counted by a task of the pool
+BATCH = 250
+
+
+def leaf_ranges(s, taxa, strip_comments=True):
+    """
+    Taxa of the leaves of a Newick string in preorder, and the range of
+    ranks of the leaves under each inner node, adding the leaf labels
+    to `taxa`.
+
+    :param strip_comments: Strip comments in square brackets, such as\
+        BEAST's annotations, whose commas would otherwise be read as\
+        more leaves. Only trees known to have none can skip it.
+    :return: Tuple of arrays (taxon, lo, hi), the leaves under inner\
+        node i being those of ranks lo[i] to hi[i] excluded.
+    """
+    if strip_comments and '[' in s:
+        s = COMMENT.sub('', s)
+    s = s.strip().rstrip(';')
+    if ' ' in s or '\n' in s or '\t' in s or '\r' in s:
+        s = SPACE.sub(r'\1', s)
+    names = list(map(str.rstrip, LEAF.findall(s)))
+    if '' in names:
+        raise ValueError('unlabelled leaf in %s' % s[:100])
+    taxon = taxa.ids(names).astype(np.int64)
+    if np.any(taxon < 0):
+        taxon = np.array(list(map(taxa.add, names)), dtype=np.int64)
+
+    chars = np.frombuffer(s.encode(), dtype=np.uint8)
+    brackets = np.flatnonzero((chars == ord('(')) | (chars == ord(')')))
+    step = np.where(chars[brackets] == ord('('), 1, -1)
+    depth = np.cumsum(step)
+    if len(depth) and (depth.min() < 0 or depth[-1] != 0):
+        raise ValueError('unmatched braces %s' % s[:100])
+    # A leaf starts after each comma or opening bracket not followed by
+    # another opening bracket
+    marks = np.flatnonzero((chars == ord('(')) | (chars == ord(',')))
+    starts = marks[chars[np.minimum(marks + 1, len(chars) - 1)] != ord('(')]
+
+    # The k-th bracket opened at some depth is closed by the k-th one
+    # closed back to the depth above it
+    opening = step > 0
+    opened = brackets[opening]
+    order = np.argsort(depth[~opening], kind='stable')
+    closed = np.empty_like(opened)
+    closed[np.argsort(depth[opening], kind='stable')] = \
+        brackets[~opening][order]
+    return (taxon, np.searchsorted(starts, opened),
+            np.searchsorted(starts, closed))
+
+
+def range_bits(taxon, lo, hi):
+    """
+    Bitsets of the taxa of the leaves of each range of ranks, and of
+    all of them.
+
+    :param taxon: Taxon of each leaf, by rank, each taxon at most once.
+    :return: Tuple of an array of uint64 with a row of words for each\
+        range, and the row of all the leaves.
+    """
+    taxon = np.asarray(taxon, dtype=np.int64)
+    n = len(taxon)
+    words = (int(taxon.max()) >> 6) + 1 if n else 1
+    bits = np.zeros((n + 1, words), dtype=np.uint64)
+    bits[np.arange(1, n + 1), taxon >> 6] = \
+        np.left_shift(np.uint64(1), (taxon & 63).astype(np.uint64))
+    np.bitwise_xor.accumulate(bits, axis=0, out=bits)
+    if n and np.bincount(taxon).max() > 1:
+        raise ValueError('a taxon occurs more than once in the tree')
+    return bits[np.asarray(hi)] ^ bits[np.asarray(lo)], bits[-1]
+
+
+def split_bits(taxon, lo, hi, rooted=False):
+    """
+    Bitsets of the nontrivial splits of a tree, normalized, with
+    duplicates removed.
+
+    :param taxon: Taxon of each leaf, by rank.
+    :param lo: First leaf rank under each node.
+    :param hi: Leaf rank after the last under each node.
+    :param rooted: Keep the clades under the edges as they are, rather\
+        than normalize the splits for unrooted comparison.
+    :return: Array of uint64, a row of words for each split.
+    """
+    taxon = np.asarray(taxon, dtype=np.int64)
+    n = len(taxon)
+    lo, hi = np.asarray(lo), np.asarray(hi)
+    count = hi - lo
+    if rooted:
+        keep = (count >= 2) & (count < n)
+    else:
+        keep = (count >= 2) & (count <= n - 2)
+    split, leaves = range_bits(taxon, lo[keep], hi[keep])
+    if not rooted and len(split):
+        first = int(taxon.min())
+        flip = (split[:, first >> 6] >> np.uint64(first & 63)) & \
+            np.uint64(1)
+        split[flip.astype(bool)] ^= leaves
+    if len(split) > 1:
+        # Nodes with a single child, and unrooted the two sides of the
+        # root, give the same split twice
+        split = split[np.lexsort(split.T)]
+        split = split[np.r_[True, np.any(split[1:] != split[:-1], axis=1)]]
+    return split
+
+
+def as_ints(split):
+    """Python ints of the rows of bitsets `split`"""
+    size = 8 * split.shape[1] if split.ndim == 2 else 8
+    data = np.ascontiguousarray(split, dtype='<u8').tobytes()
+    return [int.from_bytes(data[i:i + size], 'little')
+            for i in range(0, len(data), size)]
+
+
+def ranges(tree, taxa=None, strip_comments=True):
+    """
+    `leaf_ranges` of a `TaxonTree`, from its parent array, or of a
+    Newick string whose leaf labels are added to the namespace `taxa`.
+    """
+    if not isinstance(tree, TaxonTree):
+        return leaf_ranges(tree, taxa, strip_comments)
+    rank, lo, hi = tree.leaf_ranks()
+    taxon = tree.taxon[rank >= 0].astype(np.int64)
+    if np.any(taxon < 0):
+        raise ValueError('unlabelled leaf')
+    inner = rank < 0
+    return taxon, lo[inner], hi[inner]
+
+
+def splits(tree, taxa=None, rooted=False, strip_comments=True):
+    """
+    Nontrivial splits of a tree.
+
+    :param tree: A `TaxonTree`, or a Newick string whose leaf labels\
+        are added to the namespace `taxa`.
+    :return: Array of uint64, a row of words for each split.
+    """
+    return split_bits(*ranges(tree, taxa, strip_comments), rooted=rooted)
+
+
+# Namespace and options shared with the worker processes of a pool
+_shared = {}
+
+
+def _init_worker(taxa, rooted, strip_comments):
+    _shared.update(taxa=taxa, rooted=rooted, strip_comments=strip_comments)
+
+
+def _worker_batch(batch):
+    s = _shared
+    counter = collections.Counter()
+    for tree in batch:
+        counter.update(as_ints(splits(tree, s['taxa'], s['rooted'],
+                                      s['strip_comments'])))
+    return counter, len(batch)
+
+
+def count_splits(trees, taxa, rooted=False, strip_comments=True,
+                 progress=None, processes=None, context=None):
+    """
+    Number of trees each split occurs in.
+
+    :param trees: Iterable of `TaxonTree` or Newick strings, consumed\
+        one at a time.
+    :param taxa: `TaxonNamespace` of the leaves.
+    :param progress: Called with the number of trees counted so far,\
+        every thousand trees.
+    :param processes: Number of processes counting batches of trees, or\
+        None to count them in this one. The taxa of the first tree are\
+        then all the taxa the other trees may have.
+    :param context: `multiprocessing` context the processes are started\
+        from, the default one if not given.
+    :return: Tuple of a `collections.Counter` keyed by the int bitsets\
+        of the splits, and the number of trees.
+    """
+    counter = collections.Counter()
+    total = 0
+    trees = iter(trees)
+    if processes:
+        first = next(trees, None)
+        if first is None:
+            return counter, 0
+        counter.update(as_ints(splits(first, taxa, rooted, strip_comments)))
+        total = 1
+        known = TaxonNamespace(taxa.labels, frozen=True)
+        pool = (context or multiprocessing).Pool(
+            processes, _init_worker, (known, rooted, strip_comments))
+        pending = collections.deque()
+        done = total
+
+        def collect():
+            nonlocal total, done
+            result, count = pending.popleft().get()
+            counter.update(result)
+            total += count
+            if progress is not None and total // 1000 > done // 1000:
+                progress(total)
+            done = total
+
+        try:
+            while True:
+                batch = list(itertools.islice(trees, BATCH))
+                if not batch:
+                    break
+                # Only a few batches are read ahead of the workers
+                if len(pending) >= 2 * processes:
+                    collect()
+                pending.append(pool.apply_async(_worker_batch, (batch,)))
+            while pending:
+                collect()
+        except BaseException:
+            # Such as a cancelled progress callback
+            pool.terminate()
+            raise
+        finally:
+            pool.close()
+            pool.join()
+        return counter, total
+
+    for tree in trees:
+        counter.update(as_ints(splits(tree, taxa, rooted, strip_comments)))
+        total += 1
+        if progress is not None and total % 1000 == 0:
+            progress(total)
+    return counter, total
+
+
+def read_splits(fp, taxa, rooted=False, strip_comments=True,
+                progress=None, processes=None, context=None):
+    """
+    `count_splits` of the trees of a Newick file, streamed.
+
+    :param fp: File object open for reading text.
+    """
+    return count_splits(stream(fp), taxa, rooted, strip_comments, progress,
+                        processes, context)
+
+
+def members(split, taxa):
+    """Labels of the taxa of a split given as an int bitset"""
+    out = []
+    while split:
+        low = split & -split
+        out.append(taxa.labels[low.bit_length() - 1])
+        split ^= low
+    return out
@@ -0,0 +1,245 @@
+"""
+    Taxa shared by many trees, and trees as arrays of taxon ids.
+
+    A `TaxonNamespace` numbers the leaf labels seen across a set of
+    trees, such as the posterior sample of a Bayesian analysis, so that
+    each label is stored once and leaves of different trees can be
+    compared as small integers, or as bits of a leaf set.
+
+    A `TaxonTree` holds a tree in a few arrays, in preorder like a
+    `FlatTree`: the parent, the taxon id and the branch length of each
+    node, some 16 bytes a node against a few hundred for `Node`
+    objects. Newick strings are parsed straight into these arrays.
+"""
+import numpy as np
+
+from phylo_tree.trees.newick import COMMENT, DELIMITER, _parse_name_and_length
+
+# Characters read at once when streaming the trees of a file
+CHUNK = 2 ** 20
+
+
+class TaxonNamespace(object):
+    """
+    Dense integer ids of taxon labels, in the order they were added.
+
+    :param labels: Labels to start with.
+    :param frozen: Refuse labels not already in the namespace, so that\
+        trees over unexpected taxa are caught.
+    """
+
+    def __init__(self, labels=(), frozen=False):
+        self.labels = []
+        self._ids = {}
+        self.frozen = False
+        for label in labels:
+            self.add(label)
+        self.frozen = frozen
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __contains__(self, label):
+        return label in self._ids
+
+    def __getitem__(self, label):
+        """Id of a label, raising `KeyError` if it isn't in the namespace"""
+        return self._ids[label]
+
+    def add(self, label):
+        """Id of a label, adding it if new"""
+        taxon = self._ids.get(label)
+        if taxon is None:
+            if self.frozen:
+                raise KeyError('Unknown taxon {}'.format(label))
+            taxon = self._ids[label] = len(self.labels)
+            self.labels.append(label)
+        return taxon
+
+    def alias(self, name, label):
+        """
+        Make `name` another name of the taxon `label`, adding it if new,
+        as the numbers of a NEXUS translate block stand for labels.
+        """
+        taxon = self._ids[name] = self.add(label)
+        return taxon
+
+    def intern(self, label):
+        """The namespace's own copy of a label, adding it if new"""
+        return self.labels[self.add(label)]
+
+    def ids(self, labels):
+        """Array of the ids of `labels`, -1 for those not in the namespace"""
+        get = self._ids.get
+        return np.array([get(label, -1) for label in labels], dtype=np.int32)
+
+    def label(self, taxon):
+        return self.labels[taxon]
+
+
+class TaxonTree(object):
+    """
+    A tree as arrays, in preorder, over the taxa of a namespace.
+
+    :ivar parent: Index of each node's parent, -1 for the root.
+    :ivar taxon: Taxon id of each node, -1 for inner and unlabelled nodes.
+    :ivar length: Branch length from each node to its parent.
+    :ivar has_lengths: False if no node of the tree has a length.
+    :ivar names: Labels of the inner nodes that have one, by index.
+    """
+
+    def __init__(self, taxa, parent, taxon, length, has_lengths=True,
+                 names=None):
+        self.taxa = taxa
+        self.parent = np.asarray(parent, dtype=np.int32)
+        self.taxon = np.asarray(taxon, dtype=np.int32)
+        self.length = np.asarray(length, dtype=np.float64)
+        self.has_lengths = has_lengths
+        self.names = names or {}
+
+    def __len__(self):
+        return len(self.parent)
+
+    @property
+    def nbytes(self):
+        return self.parent.nbytes + self.taxon.nbytes + self.length.nbytes
+
+    @property
+    def is_leaf(self):
+        children = np.bincount(self.parent[1:], minlength=len(self.parent))
+        return children == 0
+
+    def leaves(self):
+        """Indices of the leaf nodes, in preorder"""
+        return np.flatnonzero(self.is_leaf)
+
+    def sizes(self):
+        """Number of nodes in the subtree under each node, in preorder"""
+        parent = self.parent.tolist()
+        size = [1] * len(parent)
+        for i in range(len(parent) - 1, 0, -1):
+            size[parent[i]] += size[i]
+        return np.array(size, dtype=np.int64)
+
+    def distances(self):
+        """Distance of each node from the root along the branch lengths"""
+        parent = self.parent.tolist()
+        length = self.length.tolist()
+        distance = [0.] * len(parent)
+        for i in range(1, len(parent)):
+            distance[i] = distance[parent[i]] + length[i]
+        return np.array(distance)
+
+    def leaf_ranks(self):
+        """
+        Rank of each leaf among the leaves in preorder, and the range of
+        ranks of the leaves under each node, as `FlatTree.leaf_ranks`.
+        """
+        leaf = self.is_leaf
+        count = np.cumsum(leaf)
+        rank = np.where(leaf, count - 1, -1)
+        post = np.arange(len(leaf)) + self.sizes() - 1
+        return rank, count - leaf, count[post]
+
+    @classmethod
+    def from_flat(cls, flat, taxa):
+        """
+        `TaxonTree` of a `FlatTree`, adding its leaf labels to `taxa`.
+        """
+        leaf = flat.is_leaf
+        taxon = [taxa.add(node.name) if is_leaf and node.name else -1
+                 for node, is_leaf in zip(flat.nodes, leaf.tolist())]
+        names = {i: node.name for i, node in enumerate(flat.nodes)
+                 if node.name and not leaf[i]}
+        return cls(taxa, flat.parent, taxon, flat.length, flat.has_lengths,
+                   names)
+
+    @classmethod
+    def parse(cls, s, taxa, strip_comments=False):
+        """
+        Parse a Newick string, with or without the final semicolon,
+        into a `TaxonTree`, adding its leaf labels to `taxa`.
+
+        Nodes are numbered as they are met: an inner node at its
+        opening bracket, before its children, which is preorder.
+        """
+        if strip_comments:
+            s = COMMENT.sub('', s)
+        s = s.strip().rstrip(';')
+        parent = []
+        taxon = []
+        length = []
+        names = {}
+        lengths = [False]
+        stack = [-1]
+        closed = None  # node whose bracket was closed just before the label
+        pos = 0
+
+        def finish(label, node):
+            if node is None:
+                name, value = _parse_name_and_length(label.strip())
+                parent.append(stack[-1])
+                taxon.append(taxa.add(name) if name else -1)
+                length.append(0.)
+                node = len(parent) - 1
+            else:
+                name, value = _parse_name_and_length(label.rstrip())
+                if name:
+                    names[node] = name
+            if value is not None:
+                length[node] = float(value)
+                lengths[0] = True
+
+        for m in DELIMITER.finditer(s):
+            char, label = m.group(), s[pos:m.start()]
+            pos = m.end()
+            if char == '(':
+                if closed is not None or label.strip():
+                    raise ValueError('unmatched braces %s' % s[:100])
+                parent.append(stack[-1])
+                taxon.append(-1)
+                length.append(0.)
+                stack.append(len(parent) - 1)
+                continue
+            finish(label, closed)
+            closed = None
+            if char == ')':
+                if len(stack) == 1:
+                    raise ValueError('unmatched braces %s' % s[:100])
+                closed = stack.pop()
+
+        finish(s[pos:], closed)
+        if len(stack) != 1 or parent.count(-1) != 1:
+            raise ValueError('unmatched braces %s' % s[:100])
+        return cls(taxa, parent, taxon, length, lengths[0], names)
+
+
+def loads(s, taxa, strip_comments=False):
+    """
+    Load a list of `TaxonTree` from a Newick formatted string, with
+    their leaf labels added to the namespace `taxa`.
+    """
+    return [TaxonTree.parse(ss, taxa, strip_comments)
+            for ss in s.split(';') if ss.strip()]
+
+
+def stream(fp, chunk=CHUNK):
+    """
+    Newick strings of the trees of a file, one at a time, reading it
+    `chunk` characters at a time so that only the tree being read is
+    held in memory, however many trees the file has.
+
+    :param fp: File object open for reading text.
+    """
+    rest = ''
+    while True:
+        data = fp.read(chunk)
+        if not data:
+            break
+        parts = (rest + data).split(';')
+        rest = parts.pop()
+        for part in parts:
+            if part.strip():
+                yield part
+    if rest.strip():
+        yield rest